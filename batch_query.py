@@ -0,0 +1,167 @@
+#----------------------批量查询---------------------------------
+import asyncio
+import json
+import re
+import time
+import traceback
+import uuid
+from typing import AsyncIterator, Dict, List, Optional
+import settings
+from logger import logger
+from texttosql import stream_sql_query
+
+#输出格式 -> Content-Type
+BATCH_FORMATS: Dict[str, str] = {
+    'jsonl': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+#格式化结果为失败信息时的前缀（format_result节点）
+FAILED_PREFIXES = ('查询失败', '结果格式化失败')
+
+
+def normalize_question(question: str) -> str:
+    '''
+    去重时比较的问题文本：去掉首尾空白，连续空白合并
+    :param question:
+    :return:
+    '''
+    return re.sub(r'\s+', ' ', question).strip()
+
+
+def check_format(fmt: str):
+    '''
+    :param fmt: BATCH_FORMATS之一
+    :return:
+    '''
+    if fmt not in BATCH_FORMATS:
+        raise ValueError(f"不支持的输出格式：{fmt}")
+    if fmt == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ValueError("输出parquet格式需要安装pyarrow")
+
+
+async def run_question(question: str, sid: str) -> Dict:
+    '''
+    执行一个问题并收集结果（一次读取，最多sql_direct_max_rows行），不生成图表、不写入会话记忆
+    :param question:
+    :param sid: 会话ID
+    :return:
+    '''
+    item = {'status': None, 'sql': None, 'columns': None, 'rows': [], 'truncated': False,
+            'content': None, 'error': None, 'request_id': None}
+    stream = stream_sql_query(question, sid, chart=False, batch=True)
+    try:
+        async for event, data in stream:
+            if event == 'sql':
+                item['sql'] = data['sql']
+            elif event == 'rows':
+                if 'columns' in data:
+                    item['columns'] = data['columns']
+                item['rows'].extend(data['rows'])
+                item['truncated'] = data['has_more'] or data.get('truncated', False)
+                item['status'] = 'ok'
+            elif event == 'markdown':
+                item['content'] = data['content']
+                failed = data['content'].startswith(FAILED_PREFIXES)
+                item['status'] = 'failed' if failed else 'ok'
+                if failed:
+                    item['error'] = data['content']
+            elif event == 'done':
+                item['request_id'] = data.get('request_id')
+            elif event == 'error':
+                item['status'] = 'error'
+                item['error'] = data['message']
+                item['request_id'] = data.get('request_id')
+    finally:
+        await stream.aclose()
+    item['status'] = item['status'] or 'error'
+    item['row_count'] = len(item['rows'])
+    return item
+
+
+async def run_batch(questions: List[str], concurrency: Optional[int] = None,
+                    batch_id: Optional[str] = None) -> AsyncIterator[Dict]:
+    '''
+    并发执行一批问题，按完成顺序输出每个问题的结果。
+    相同的问题（忽略空白差异）只执行一次；不同问题生成相同的SQL时，由执行节点等待先执行的完成后读取结果缓存。
+    每个问题使用单独的会话ID（不作为追问，不保存到会话记忆），表结构、提示词与编译后的工作流在进程内共享
+    :param questions:
+    :param concurrency: 同时执行的问题数，默认settings.batch_concurrency
+    :param batch_id: 会话ID前缀，默认随机生成
+    :return: {"index", "question", "status": ok/failed/error, "sql", "columns", "rows", "row_count", "truncated",
+              "content": 文本结果, "error", "wait_seconds": 排队时间, "seconds": 执行时间, "duplicate_of", "request_id"}
+    '''
+    batch_id = batch_id or uuid.uuid4().hex
+    semaphore = asyncio.Semaphore(concurrency or settings.batch_concurrency)
+    first: Dict[str, int] = {}
+    duplicates: Dict[int, List[int]] = {}
+    for index, question in enumerate(questions):
+        key = normalize_question(question)
+        if key in first:
+            duplicates.setdefault(first[key], []).append(index)
+        else:
+            first[key] = index
+    submitted = time.perf_counter()
+
+    async def run(index):
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                item = await run_question(questions[index], f"batch-{batch_id}-{index}")
+            except Exception as e:
+                logger.error(traceback.format_exc())
+                item = {'status': 'error', 'sql': None, 'columns': None, 'rows': [], 'row_count': 0, 'truncated': False,
+                        'content': None, 'error': str(e), 'request_id': None}
+        item.update(index=index, question=questions[index], wait_seconds=round(started - submitted, 4),
+                    seconds=round(time.perf_counter() - started, 4), duplicate_of=None)
+        return item
+
+    tasks = [asyncio.create_task(run(index)) for index in first.values()]
+    counts = {'ok': 0, 'failed': 0, 'error': 0}
+    try:
+        for future in asyncio.as_completed(tasks):
+            item = await future
+            counts[item['status']] += 1 + len(duplicates.get(item['index'], []))
+            yield item
+            for index in duplicates.get(item['index'], []):
+                yield dict(item, index=index, question=questions[index], duplicate_of=item['index'])
+    finally:
+        # 调用方提前关闭（客户端断开）时取消未完成的问题
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info(f"批量查询完成：{len(questions)}个问题（去重后{len(tasks)}个），成功{counts['ok']}，"
+                f"失败{counts['failed']}，出错{counts['error']}，耗时{time.perf_counter() - submitted:.2f}s")
+
+
+def encode_jsonl(item: Dict) -> bytes:
+    '''
+    一个问题的结果编码为一行JSON
+    :param item:
+    :return:
+    '''
+    return (json.dumps(item, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+
+
+def encode_parquet(items: List[Dict]) -> bytes:
+    '''
+    全部结果按问题顺序编码为一个parquet文件，每个问题一行，查询结果的行以JSON字符串保存
+    :param items:
+    :return:
+    '''
+    import pyarrow
+    import pyarrow.parquet
+    schema = pyarrow.schema([
+        ('index', pyarrow.int64()), ('question', pyarrow.string()), ('status', pyarrow.string()),
+        ('sql', pyarrow.string()), ('columns', pyarrow.list_(pyarrow.string())), ('rows', pyarrow.string()),
+        ('row_count', pyarrow.int64()), ('truncated', pyarrow.bool_()), ('content', pyarrow.string()),
+        ('error', pyarrow.string()), ('wait_seconds', pyarrow.float64()), ('seconds', pyarrow.float64()),
+        ('duplicate_of', pyarrow.int64()), ('request_id', pyarrow.string()),
+    ])
+    records = [dict(item, rows=json.dumps(item['rows'], ensure_ascii=False, default=str))
+               for item in sorted(items, key=lambda item: item['index'])]
+    sink = pyarrow.BufferOutputStream()
+    pyarrow.parquet.write_table(pyarrow.Table.from_pylist(records, schema=schema), sink)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,93 @@
+#----------------------批量查询基准测试---------------------------------
+'''
+使用模拟LLM与本地SQLite数据库，对比逐个调用stream_sql_query（每次等待上一个完成，与逐个请求/default/query相同）
+与batch_query.run_batch并发执行同一批问题的总耗时；两次运行前均清空结果缓存与问题缓存
+用法：python bench/bench_batch.py [--questions 100 --distinct 40 --concurrency 8 --llm-latency 0.2]
+'''
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_llm  # noqa: E402
+import fixture  # noqa: E402
+from bench_load import QUESTIONS  # noqa: E402
+
+
+def make_questions(total: int, distinct: int):
+    '''
+    生成total个问题，其中distinct个不同（其余为重复，模拟报表任务中重复的问题）
+    :param total:
+    :param distinct:
+    :return:
+    '''
+    return [f"{QUESTIONS[index % distinct % len(QUESTIONS)]}（报表{index % distinct}）" for index in range(total)]
+
+
+def reset_caches():
+    import texttosql
+    texttosql.result_cache.clear()
+    texttosql.question_cache.clear()
+
+
+async def run_serial(questions):
+    from batch_query import run_question
+    statuses = []
+    for index, question in enumerate(questions):
+        statuses.append((await run_question(question, f"serial-{index}"))['status'])
+    return statuses
+
+
+async def run_parallel(questions, concurrency: int):
+    from batch_query import run_batch
+    return [item['status'] async for item in run_batch(questions, concurrency)]
+
+
+async def bench(args):
+    questions = make_questions(args.questions, args.distinct)
+    # 预热：编译工作流、加载表结构，不计入耗时
+    await run_serial(questions[:1])
+    results = {}
+    for name, runner in (("逐个执行", lambda: run_serial(questions)),
+                         ("批量执行", lambda: run_parallel(questions, args.concurrency))):
+        reset_caches()
+        start = time.perf_counter()
+        statuses = await runner()
+        results[name] = (time.perf_counter() - start, statuses)
+    print(f"问题数 {len(questions)}（不同的 {args.distinct}），并发 {args.concurrency}，LLM延迟 {args.llm_latency}s")
+    for name, (elapsed, statuses) in results.items():
+        ok = sum(1 for status in statuses if status == 'ok')
+        print(f"{name}：{elapsed:.2f}s，成功 {ok}/{len(statuses)}，平均 {elapsed / len(statuses) * 1000:.1f}ms/题")
+    serial, parallel = results["逐个执行"][0], results["批量执行"][0]
+    print(f"批量执行耗时为逐个执行的 {parallel / serial:.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量查询基准测试（模拟LLM + 本地SQLite）")
+    parser.add_argument("--db", default=os.path.join(ROOT, "bench", "stock_bench.db"), help="SQLite文件路径")
+    parser.add_argument("--rebuild", action="store_true", help="重新生成测试数据库")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数")
+    parser.add_argument("--days", type=int, default=250, help="交易日数")
+    parser.add_argument("--questions", type=int, default=100, help="问题总数")
+    parser.add_argument("--distinct", type=int, default=40, help="其中不同问题的个数")
+    parser.add_argument("--concurrency", type=int, default=8, help="批量执行的并发数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="每次LLM调用的延迟（秒）")
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(args.db):
+        fixture.build("sqlite:///" + os.path.abspath(args.db), args.stocks, args.days)
+    # 需在导入settings之前设置
+    os.environ["MYSQL_DB_URI"] = "sqlite:///" + os.path.abspath(args.db)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    fake_llm.install(latency=args.llm_latency)
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#----------------------查询结果导出基准测试---------------------------------
+'''
+在本地SQLite测试库上对比大结果集的两种输出方式：
+markdown=当前查询路径（一次读取全部行，转为可JSON序列化的列表后生成markdown表格），
+csv/arrow/parquet=导出接口（服务端游标按批读取并编码）；统计行/秒与tracemalloc峰值内存
+用法：python bench/bench_export.py [--stocks 500 --days 250] [--batch-size 10000]
+'''
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixture  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from result_export import ResultExport  # noqa: E402
+from sql_executor import SqlExecutor, rows_to_markdown  # noqa: E402
+
+SQL = ("SELECT t.stock_id, d.trade_date, t.price, t.turnover, b.stock_name, b.industry FROM stock_daily_trade_1 t "
+       "JOIN trade_date d ON d.date_id = t.date_id JOIN stock_basic b ON b.stock_id = t.stock_id")
+
+
+def run_markdown(engine):
+    result = SqlExecutor(engine, max_rows=10 ** 9, pool_size=1).execute(SQL)
+    size = len(rows_to_markdown(result["columns"], result["rows"]).encode('utf-8'))
+    return result["row_count"], size
+
+
+def run_export(engine, fmt: str, batch_size: int):
+    export = ResultExport(engine, SQL, fmt, batch_size=batch_size)
+    export.open()
+    size = 0
+    while True:
+        data = export.next_chunk()
+        if data is None:
+            break
+        size += len(data)
+    return export.rows, size
+
+
+def measure(name: str, func, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows, size = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{name:10s}{rows:>10d}{rows / elapsed:>14.0f}{peak / 1024 / 1024:>14.1f}{size / 1024 / 1024:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询结果导出基准测试（本地SQLite）")
+    parser.add_argument("--db", default=os.path.join(ROOT, "bench", "stock_bench.db"), help="SQLite文件路径")
+    parser.add_argument("--rebuild", action="store_true", help="重新生成测试数据库")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数")
+    parser.add_argument("--days", type=int, default=250, help="交易日数")
+    parser.add_argument("--batch-size", type=int, default=10000, help="导出每批的行数")
+    args = parser.parse_args()
+
+    uri = "sqlite:///" + os.path.abspath(args.db)
+    if args.rebuild or not os.path.exists(args.db):
+        fixture.build(uri, args.stocks, args.days)
+    engine = create_engine(uri)
+    formats = ["csv"]
+    try:
+        import pyarrow  # noqa: F401
+        formats += ["arrow", "parquet"]
+    except ImportError:
+        print("未安装pyarrow，跳过arrow与parquet")
+
+    print(f"{'':10s}{'行数':>8s}{'行/秒':>12s}{'峰值内存MB':>9s}{'输出MB':>9s}")
+    # 预热：加载驱动与pyarrow，不计入结果
+    run_export(engine, formats[-1], args.batch_size)
+    measure("markdown", run_markdown, engine)
+    for fmt in formats:
+        measure(fmt, run_export, engine, fmt, args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
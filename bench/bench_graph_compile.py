@@ -0,0 +1,52 @@
+#----------------------工作流编译耗时基准测试---------------------------------
+'''
+对比每次请求重新编译工作流与使用GraphRegistry缓存时，到达首个工作流消息的耗时
+用法：MYSQL_DB_URI=sqlite:///stock.db OPENAI_API_KEY=x python bench/bench_graph_compile.py [次数]
+'''
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+import texttosql  # noqa: E402
+
+FIRST_GRAPH_EVENT = ("progress", {"message": "工作流已编译完成，开始流程任务"})
+
+
+async def time_to_first_chunk(rounds):
+    '''
+    stream_sql_query输出工作流就绪消息前的耗时（不会触发LLM调用）
+    :param rounds:
+    :return:
+    '''
+    costs = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        stream = texttosql.stream_sql_query("bench", sid=f"bench-{i}")
+        async for chunk in stream:
+            if chunk == FIRST_GRAPH_EVENT:
+                break
+        costs.append(time.perf_counter() - start)
+        await stream.aclose()
+    return costs
+
+
+async def main(rounds):
+    # 旧行为：每个请求都重新编译
+    registry_get = texttosql.graph_registry.get
+    texttosql.graph_registry.get = texttosql.workflow
+    before = await time_to_first_chunk(rounds)
+    texttosql.graph_registry.get = registry_get
+    # 新行为：首次编译后复用
+    after = await time_to_first_chunk(rounds)
+    for name, costs in (("每次编译", before), ("注册表缓存", after)):
+        print(f"{name}: 平均 {statistics.mean(costs) * 1000:.3f}ms, "
+              f"中位数 {statistics.median(costs) * 1000:.3f}ms, 最大 {max(costs) * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
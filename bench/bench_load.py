@@ -0,0 +1,232 @@
+#----------------------离线负载测试---------------------------------
+'''
+使用模拟LLM与本地SQLite数据库，按给定并发驱动stream_sql_query或/default/query接口，
+统计首个内容事件耗时（TTFC，SQL生成后的第一个sql/rows/markdown/chart事件，不含进度消息）、出结果耗时、总耗时的p50/p95/p99，吞吐与内存（RSS）增长
+用法：
+    python bench/bench_load.py --mode stream --concurrency 8 --requests 200
+    python bench/bench_load.py --mode http --llm-latency 0.5 --stocks 500 --days 250
+    录制后离线回放（回放不调用模型，耗时只反映服务自身，可用于回归计时）：
+    python bench/bench_load.py --real-llm --cassette bench/cassette.db --record
+    python bench/bench_load.py --real-llm --cassette bench/cassette.db
+'''
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_llm  # noqa: E402
+import fixture  # noqa: E402
+from stream_events import decode_sse  # noqa: E402
+
+#与fake_llm.CANNED_SQL的关键词对应，覆盖排序、多表关联、聚合与时间序列
+QUESTIONS = [
+    "查询市盈率大于30的股票名称和市盈率，按市盈率降序排序，取前20条",
+    "查询机构持仓占比最高的10条记录，包括股票名称、机构名称、持仓占比和持仓成本",
+    "统计各行业股票的平均价格",
+    "查询股票1最近60个交易日的价格走势",
+    "查询成交额最大的10只股票",
+]
+#查询结果事件
+RESULT_EVENTS = ("rows", "markdown")
+#SQL生成后的内容事件，计算TTFC；progress事件在请求开始时立即发出，不计入
+CONTENT_EVENTS = ("sql", "chart") + RESULT_EVENTS
+
+
+def rss_mb() -> float:
+    '''
+    当前进程的常驻内存（MB），无/proc时退化为峰值内存
+    :return:
+    '''
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+class Sample:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.result = None
+        self.total = None
+        self.error = None
+
+    def event(self, event, data):
+        now = time.perf_counter() - self.start
+        if self.first is None and event in CONTENT_EVENTS:
+            self.first = now
+        if self.result is None and event in RESULT_EVENTS:
+            self.result = now
+        if event == "error":
+            self.error = data.get("message")
+
+
+async def run_stream(question: str, session_id: str) -> Sample:
+    from texttosql import stream_sql_query
+    sample = Sample()
+    async for event, data in stream_sql_query(question, session_id):
+        sample.event(event, data)
+    sample.total = time.perf_counter() - sample.start
+    return sample
+
+
+async def run_http(client, question: str, session_id: str) -> Sample:
+    sample = Sample()
+    async with client.stream("POST", "/default/query", json={"question": question},
+                             cookies={"session_id": session_id}) as response:
+        if response.status_code != 200:
+            sample.error = f"HTTP {response.status_code}"
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                sample.event(event, decode_sse(line[6:]))
+    sample.total = time.perf_counter() - sample.start
+    return sample
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def start_server():
+    '''
+    在当前事件循环中启动服务，与负载在同一进程，便于统计RSS
+    :return: (server, 任务, 地址)
+    '''
+    import uvicorn
+    from root_urls import app
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def load(args):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    client = server = task = None
+    if args.mode == "http":
+        import httpx
+        url = args.url
+        if not url:
+            server, task, url = await start_server()
+        client = httpx.AsyncClient(base_url=url, timeout=None,
+                                   limits=httpx.Limits(max_connections=args.concurrency * 2))
+
+    async def one(index: int) -> Sample:
+        question = QUESTIONS[index % len(QUESTIONS)]
+        # 每个会话连续追问args.turns轮
+        session_id = f"bench-{index // args.turns}"
+        async with semaphore:
+            try:
+                if client is not None:
+                    return await run_http(client, question, session_id)
+                return await run_stream(question, session_id)
+            except Exception as e:
+                sample = Sample()
+                sample.error = repr(e)
+                return sample
+
+    try:
+        # 预热：编译工作流、加载表结构，不计入耗时与内存增长
+        for index in range(args.warmup):
+            await one(-1 - index)
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        samples = await asyncio.gather(*(one(index) for index in range(args.requests)))
+        elapsed = time.perf_counter() - start
+        rss_after = rss_mb()
+    finally:
+        if client is not None:
+            await client.aclose()
+        if server is not None:
+            server.should_exit = True
+            await task
+    return samples, elapsed, rss_before, rss_after
+
+
+def report(samples, elapsed: float, rss_before: float, rss_after: float):
+    failed = [sample for sample in samples if sample.error or sample.total is None]
+    ok = [sample for sample in samples if sample not in failed]
+    print(f"请求数 {len(samples)}，失败 {len(failed)}，耗时 {elapsed:.2f}s，吞吐 {len(ok) / elapsed:.2f} 请求/秒")
+    print(f"{'':12s}{'p50':>10s}{'p95':>10s}{'p99':>10s}{'max':>10s}")
+    for name, values in (
+        ("TTFC", [sample.first for sample in ok if sample.first is not None]),
+        ("出结果", [sample.result for sample in ok if sample.result is not None]),
+        ("总耗时", [sample.total for sample in ok]),
+    ):
+        print(f"{name:10s}" + "".join(f"{percentile(values, q) * 1000:9.1f}ms" for q in (50, 95, 99))
+              + f"{(max(values) if values else 0) * 1000:9.1f}ms")
+    print(f"RSS {rss_before:.1f}MB -> {rss_after:.1f}MB（增长 {rss_after - rss_before:+.1f}MB）")
+    for error in sorted({sample.error for sample in failed if sample.error})[:5]:
+        print(f"错误: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线负载测试（模拟LLM + 本地SQLite）")
+    parser.add_argument("--mode", choices=["stream", "http"], default="stream",
+                        help="stream=直接调用stream_sql_query，http=请求/default/query")
+    parser.add_argument("--url", default="", help="http模式下压测已启动的服务（数据库与LLM由该服务决定）")
+    parser.add_argument("--db", default=os.path.join(ROOT, "bench", "stock_bench.db"), help="SQLite文件路径")
+    parser.add_argument("--rebuild", action="store_true", help="重新生成测试数据库")
+    parser.add_argument("--stocks", type=int, default=200, help="股票数")
+    parser.add_argument("--days", type=int, default=250, help="交易日数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="每次LLM调用的延迟（秒）")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="LLM流式分块间隔（秒）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发数")
+    parser.add_argument("--requests", type=int, default=100, help="请求总数")
+    parser.add_argument("--turns", type=int, default=1, help="每个会话的连续提问轮数")
+    parser.add_argument("--warmup", type=int, default=1, help="预热请求数")
+    parser.add_argument("--log-level", default="WARNING", help="服务日志级别，默认只输出警告以上")
+    parser.add_argument("--real-llm", action="store_true", help="使用真实的模型（OPENAI_API_KEY等环境变量），不替换为模拟LLM")
+    parser.add_argument("--cassette", default="", help="LLM录制文件：默认从中回放，未录制的调用报错")
+    parser.add_argument("--record", action="store_true", help="调用模型并将响应录制到--cassette")
+    args = parser.parse_args()
+
+    if not args.url:
+        if args.rebuild or not os.path.exists(args.db):
+            started = time.perf_counter()
+            counts = fixture.build("sqlite:///" + os.path.abspath(args.db), args.stocks, args.days)
+            print(f"生成测试数据库 {args.db}：{sum(counts.values())} 行，{time.perf_counter() - started:.1f}s")
+        # 需在导入settings之前设置
+        os.environ["MYSQL_DB_URI"] = "sqlite:///" + os.path.abspath(args.db)
+        os.environ.setdefault("OPENAI_API_KEY", "bench")
+        if args.cassette:
+            os.environ["LLM_CACHE_MODE"] = "record" if args.record else "replay"
+            os.environ["LLM_CACHE_PATH"] = os.path.abspath(args.cassette)
+        if not args.real_llm:
+            fake_llm.install(latency=args.llm_latency, chunk_latency=args.chunk_latency)
+
+    from logger import logger
+    logger.setLevel(args.log_level.upper())
+    report(*asyncio.run(load(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#----------------------只读副本路由检查---------------------------------
+'''
+以本地SQLite文件模拟主库与两个副本（复制测试数据库，第二个副本删除最新交易日的数据以模拟复制延迟），
+按权重分配连接并统计各节点的分配比例；随后删除第一个副本的文件目录模拟副本宕机，检查故障转移与延迟副本的排除
+用法：python bench/bench_replicas.py [--connections 1000 --weights 1,2,1]
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixture  # noqa: E402
+
+
+def route(router, connections: int):
+    for node in router.nodes:
+        node.routed = 0
+    for _ in range(connections):
+        with router.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+    return {node["name"]: node["routed"] for node in router.stats()["nodes"]}
+
+
+def print_nodes(router):
+    for node in router.stats()["nodes"]:
+        print(f"  {node['name']:<8} 可用 {node['healthy']!s:<5} 参与分配 {node['eligible']!s:<5} "
+              f"水位 {node['watermark']} 延迟 {node['lag']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="只读副本路由检查（本地SQLite模拟主库与副本）")
+    parser.add_argument("--db", default=os.path.join(ROOT, "bench", "stock_bench.db"), help="SQLite文件路径（主库）")
+    parser.add_argument("--rebuild", action="store_true", help="重新生成测试数据库")
+    parser.add_argument("--connections", type=int, default=1000, help="每轮获取的连接数")
+    parser.add_argument("--weights", default="1,2,1", help="主库,副本1,副本2的权重")
+    args = parser.parse_args()
+
+    if args.rebuild or not os.path.exists(args.db):
+        fixture.build("sqlite:///" + os.path.abspath(args.db), 200, 250)
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("LOG_LEVEL", "ERROR")
+    import settings
+    from sqlalchemy import create_engine
+    from read_router import ReadRouter
+
+    workdir = tempfile.mkdtemp(prefix="replicas-")
+    paths = {}
+    for name in ("replica1", "replica2"):
+        os.makedirs(os.path.join(workdir, name))
+        paths[name] = os.path.join(workdir, name, "stock.db")
+        shutil.copy(args.db, paths[name])
+    lagged = create_engine("sqlite:///" + paths["replica2"])
+    with lagged.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM stock_daily_trade_1 WHERE date_id = (SELECT MAX(date_id) FROM stock_daily_trade_1)")
+    lagged.dispose()
+
+    primary_weight, *weights = [float(weight) for weight in args.weights.split(",")]
+    router = ReadRouter(create_engine("sqlite:///" + os.path.abspath(args.db)),
+                        [(name, create_engine("sqlite:///" + path), weight) for (name, path), weight in zip(paths.items(), weights)],
+                        primary_weight=primary_weight, watermark_sql=settings.replica_watermark_sql,
+                        max_lag=settings.replica_max_lag)
+    try:
+        print(f"未检查（均参与分配）：{route(router, args.connections)}")
+        router.check()
+        print_nodes(router)
+        print(f"检查后（排除延迟的副本）：{route(router, args.connections)}")
+        shutil.rmtree(os.path.dirname(paths["replica1"]))
+        # 关闭连接池中已打开的连接，之后新建连接失败
+        router.engine("replica1").dispose()
+        print(f"副本1宕机：{route(router, args.connections)}，连接失败转移 {router.stats()['failovers']} 次")
+        router.check()
+        print_nodes(router)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
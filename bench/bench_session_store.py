@@ -0,0 +1,75 @@
+#----------------------多worker会话记忆负载测试---------------------------------
+'''
+模拟N个worker进程共享会话存储：每一轮中同一会话的请求交给不同的worker处理，
+校验追问读取到的last_sql来自上一轮（可能由其他worker写入），并统计吞吐随worker数的变化。
+每个请求包含：读取会话记忆 + SQL校验（请求中的CPU部分）+ 追加对话记录
+用法：python bench/bench_session_store.py [会话数] [轮数] [存储连接串，默认临时SQLite文件]
+'''
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SqlSessionStore  # noqa: E402
+from sql_validator import validate_sql  # noqa: E402
+
+SQL = ("SELECT b.stock_name, i.inst_name, h.hold_ratio, h.hold_cost FROM stock_inst_hold_3 h "
+       "JOIN stock_basic b ON h.stock_id = b.stock_id JOIN institution i ON h.inst_id = i.inst_id "
+       "WHERE h.hold_ratio > {turn} ORDER BY h.hold_ratio DESC LIMIT 5")
+
+
+def worker(index, workers, sessions, turns, uri, ready, barrier, errors):
+    store = SqlSessionStore(uri, max_turns=10)
+    # 进程启动与导入不计入耗时
+    ready.wait()
+    for turn in range(turns):
+        for session in range(sessions):
+            if (session + turn) % workers != index:
+                continue
+            session_id = f"bench-{session}"
+            _, last_sql = store.load(session_id)
+            expected = SQL.format(turn=turn - 1) if turn else None
+            if last_sql != expected:
+                with errors.get_lock():
+                    errors.value += 1
+            validate_sql(SQL.format(turn=turn))
+            store.append(session_id, f"第{turn}轮问题", SQL.format(turn=turn), str(time.time()))
+        # 所有worker完成本轮后再进入下一轮，下一轮同一会话由另一个worker处理（append返回时已提交）
+        barrier.wait()
+    store.close()
+
+
+def run(workers, sessions, turns, uri):
+    SqlSessionStore(uri).clear()
+    ready = multiprocessing.Barrier(workers + 1)
+    barrier = multiprocessing.Barrier(workers)
+    errors = multiprocessing.Value('i', 0)
+    processes = [
+        multiprocessing.Process(target=worker, args=(index, workers, sessions, turns, uri, ready, barrier, errors))
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    ready.wait()
+    start = time.perf_counter()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+    return sessions * turns / elapsed, errors.value
+
+
+if __name__ == '__main__':
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    uri = sys.argv[3] if len(sys.argv) > 3 else "sqlite:///" + os.path.join(tempfile.mkdtemp(), "session.db")
+    print(f"存储: {uri}，会话数: {sessions}，轮数: {turns}")
+    base = None
+    for workers in (1, 2, 4, 8):
+        if workers > (os.cpu_count() or 1) * 2:
+            break
+        throughput, errors = run(workers, sessions, turns, uri)
+        base = base or throughput
+        print(f"worker数 {workers}: {throughput:8.1f} 请求/秒（{throughput / base:.2f}x），last_sql不一致 {errors} 次")
@@ -0,0 +1,86 @@
+#----------------------SQL校验语料与吞吐基准---------------------------------
+'''
+先用语料校验validate_sql的判定结果，再测量每秒可校验的SQL条数
+用法：python bench/bench_sql_validator.py [轮数]
+'''
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+# 按settings.log_module_levels设置日志级别（sqlglot回退为Command的警告默认不输出）
+import logger  # noqa: E402,F401
+from sql_validator import validate_sql  # noqa: E402
+
+SCHEMA = {
+    "stock_basic": {"stock_id", "stock_code", "stock_name", "exchange", "industry", "plate", "create_time", "update_time"},
+    "stock_market_cap_2": {"id", "stock_id", "date_id", "market_cap", "pe_ratio", "pb_ratio"},
+    "stock_inst_hold_3": {"id", "stock_id", "inst_id", "hold_volume", "hold_ratio", "hold_cost"},
+    "institution": {"inst_id", "inst_name", "inst_type"},
+    "trade_date": {"date_id", "trade_date", "is_trading_day"},
+    "stock_daily_trade_1": {"id", "stock_id", "date_id", "price", "rise_fall", "volume", "turnover"},
+}
+
+#（SQL, 是否应通过校验）
+CORPUS = [
+    ("SELECT stock_name, update_time, create_time FROM stock_basic LIMIT 10", True),
+    ("select stock_name from stock_basic where update_time > '2024-01-01'", True),
+    ("SELECT b.stock_name, c.pe_ratio FROM stock_basic b JOIN stock_market_cap_2 c ON b.stock_id = c.stock_id "
+     "WHERE c.pe_ratio > 30 ORDER BY c.pe_ratio DESC LIMIT 20", True),
+    ("SELECT b.stock_name, i.inst_name, h.hold_ratio, h.hold_cost FROM stock_inst_hold_3 h "
+     "JOIN stock_basic b ON h.stock_id = b.stock_id JOIN institution i ON h.inst_id = i.inst_id "
+     "ORDER BY h.hold_ratio DESC LIMIT 5", True),
+    ("WITH latest AS (SELECT MAX(date_id) AS date_id FROM trade_date) "
+     "SELECT t.stock_id, t.price FROM stock_daily_trade_1 t JOIN latest l ON t.date_id = l.date_id LIMIT 10", True),
+    ("SELECT industry, COUNT(*) AS cnt FROM stock_basic GROUP BY industry ORDER BY cnt DESC", True),
+    ("SELECT stock_name FROM stock_basic WHERE stock_id IN (SELECT stock_id FROM stock_market_cap_2 WHERE pe_ratio > 30)", True),
+    ("(SELECT stock_name FROM stock_basic LIMIT 1) UNION (SELECT inst_name FROM institution LIMIT 1)", True),
+    ("```sql\nSELECT stock_name FROM stock_basic\n```", False),
+    ("UPDATE stock_basic SET stock_name = 'x'", False),
+    ("DELETE FROM stock_basic", False),
+    ("INSERT INTO institution VALUES (1, 'a', 'b')", False),
+    ("REPLACE INTO institution VALUES (1, 'a', 'b')", False),
+    ("TRUNCATE TABLE stock_basic", False),
+    ("DROP TABLE stock_basic", False),
+    ("ALTER TABLE stock_basic ADD COLUMN x INT", False),
+    ("CREATE TABLE x (a INT)", False),
+    ("LOAD DATA INFILE '/tmp/x.csv' INTO TABLE stock_basic", False),
+    ("SELECT 1; DROP TABLE stock_basic", False),
+    ("SELECT * FROM stock_basic INTO OUTFILE '/tmp/x'", False),
+    ("SELECT * FROM stock_basic FOR UPDATE", False),
+    ("SELECT SLEEP(10)", False),
+    ("SELECT stock_nme FROM stock_basic", False),
+    ("SELECT b.pe_ratio FROM stock_basic b", False),
+    ("SELECT * FROM stock_basics", False),
+    ("SELECT * FROM information_schema.tables", False),
+    ("SELECT * FROM stock_basic LIMIT @n", False),
+]
+
+
+def check_corpus():
+    failures = 0
+    for sql, expected in CORPUS:
+        validated, error = validate_sql(sql, SCHEMA)
+        if (error is None) != expected:
+            failures += 1
+            print(f"判定错误: 期望{'通过' if expected else '拒绝'}，实际{error or '通过'}：{sql}")
+    print(f"语料 {len(CORPUS)} 条，判定错误 {failures} 条")
+    return failures
+
+
+def throughput(rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for sql, _ in CORPUS:
+            validate_sql(sql, SCHEMA)
+    cost = time.perf_counter() - start
+    total = rounds * len(CORPUS)
+    print(f"校验 {total} 条SQL，耗时 {cost:.3f}s，吞吐 {total / cost:.0f} 条/秒，平均 {cost / total * 1000:.3f}ms/条")
+
+
+if __name__ == "__main__":
+    failed = check_corpus()
+    throughput(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,112 @@
+#----------------------基准测试用的模拟LLM---------------------------------
+'''
+可配置延迟、返回固定SQL的确定性聊天模型，替换ChatOpenAI后无需真实的模型服务即可运行完整工作流
+必须在导入texttosql之前调用install()
+'''
+import asyncio
+import json
+import re
+import time
+from typing import List, Optional, Tuple
+
+import langchain_openai
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableLambda
+
+#（问题关键词, SQL），按顺序匹配，都不匹配时返回DEFAULT_SQL
+CANNED_SQL: List[Tuple[str, str]] = [
+    ("市盈率", "SELECT b.stock_name, c.pe_ratio FROM stock_basic b JOIN stock_market_cap_2 c ON b.stock_id = c.stock_id "
+             "WHERE c.pe_ratio > 30 ORDER BY c.pe_ratio DESC LIMIT 20"),
+    ("持仓", "SELECT b.stock_name, i.inst_name, h.hold_ratio, h.hold_cost FROM stock_inst_hold_3 h "
+           "JOIN stock_basic b ON h.stock_id = b.stock_id JOIN institution i ON h.inst_id = i.inst_id "
+           "ORDER BY h.hold_ratio DESC LIMIT 10"),
+    ("行业", "SELECT b.industry, AVG(t.price) AS avg_price FROM stock_daily_trade_1 t "
+           "JOIN stock_basic b ON b.stock_id = t.stock_id GROUP BY b.industry"),
+    ("走势", "SELECT d.trade_date, t.price FROM stock_daily_trade_1 t JOIN trade_date d ON d.date_id = t.date_id "
+           "WHERE t.stock_id = 1 ORDER BY d.trade_date LIMIT 60"),
+    ("成交", "SELECT b.stock_name, SUM(t.turnover) AS turnover FROM stock_daily_trade_1 t "
+           "JOIN stock_basic b ON b.stock_id = t.stock_id GROUP BY b.stock_name ORDER BY turnover DESC LIMIT 10"),
+]
+DEFAULT_SQL = "SELECT stock_code, stock_name, industry FROM stock_basic LIMIT 10"
+QUESTION_PATTERN = re.compile(r'用户需求[:：]\s*(.*)', re.S)
+
+
+class FakeChatModel(BaseChatModel):
+    '''
+    SQL生成提示词返回按关键词匹配的SQL；agent提示词直接返回Final Answer；结构化输出返回固定的JSON
+    '''
+    latency: float = 0.2
+    #流式输出时每个分块的间隔（秒）
+    chunk_latency: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    def _reply(self, messages, structured_output: Optional[str] = None) -> str:
+        if structured_output == "DataNeedImage":
+            return json.dumps({"binary_score": "yes"})
+        if structured_output:
+            return json.dumps({"echar_data": {"xAxis": {"type": "category", "data": ["a", "b"]},
+                                              "yAxis": {"type": "value"}, "series": [{"type": "bar", "data": [1, 2]}]}})
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "Thought:" in prompt or "sql_db_query" in prompt:
+            return "Thought: 已得到查询结果\nFinal Answer: | 股票名称 | 行业 |\n|---|---|\n| 股票1 | 银行 |\n| 股票2 | 医药 |"
+        match = QUESTION_PATTERN.search(prompt)
+        question = match.group(1) if match else prompt
+        for keyword, sql in CANNED_SQL:
+            if keyword in question:
+                return sql
+        return DEFAULT_SQL
+
+    @staticmethod
+    def _usage(content: str, messages):
+        input_tokens = sum(len(str(message.content)) for message in messages) // 2
+        output_tokens = len(content) // 2
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        content = self._reply(messages, kwargs.get("structured_output"))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=self._usage(content, messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        content = self._reply(messages, kwargs.get("structured_output"))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content, usage_metadata=self._usage(content, messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        content = self._reply(messages, kwargs.get("structured_output"))
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            last = index == len(words) - 1
+            # token用量只随最后一个分块返回，与OpenAI流式接口一致
+            yield ChatGenerationChunk(message=AIMessageChunk(
+                content=word if last else word + " ",
+                usage_metadata=self._usage(content, messages) if last else None,
+            ))
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+
+    def with_structured_output(self, schema, **kwargs):
+        # 与ChatOpenAI一致：绑定输出格式的模型 | 解析器，经过调度时同样被包装
+        return self.bind(structured_output=schema.__name__) | RunnableLambda(
+            lambda message: schema.model_validate_json(message.content))
+
+def install(latency: float = 0.2, chunk_latency: float = 0.0, canned: Optional[List[Tuple[str, str]]] = None):
+    '''
+    用FakeChatModel替换langchain_openai.ChatOpenAI
+    :param latency: 每次调用的延迟（秒）
+    :param chunk_latency: 流式分块间隔（秒）
+    :param canned: 额外的（关键词, SQL），优先匹配
+    :return:
+    '''
+    if canned:
+        CANNED_SQL[:0] = canned
+
+    def factory(*args, **kwargs):
+        return FakeChatModel(latency=latency, chunk_latency=chunk_latency, callbacks=kwargs.get("callbacks"))
+    langchain_openai.ChatOpenAI = factory
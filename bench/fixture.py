@@ -0,0 +1,200 @@
+#----------------------基准测试数据库---------------------------------
+'''
+将sql/create_table.sql导入本地SQLite（或测试用MySQL）并按规模生成模拟的股票数据
+用法：python bench/fixture.py [数据库路径或连接串] [股票数] [交易日数]
+'''
+import datetime
+import os
+import random
+import re
+import sys
+from typing import Dict, List
+
+import sqlglot
+from sqlalchemy import create_engine, text
+from sqlglot import exp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DDL_PATH = os.path.join(ROOT, "sql", "create_table.sql")
+
+#分类字段的取值池，其余字符串字段按“字段名_序号”生成
+VALUE_POOLS = {
+    "industry": ["银行", "医药", "半导体", "白酒", "新能源", "券商", "汽车", "电力"],
+    "plate": ["主板", "创业板", "科创板"],
+    "exchange": ["SH", "SZ", "BJ"],
+    "inst_type": ["公募", "私募", "券商", "保险"],
+}
+
+
+def parse_tables(ddl: str) -> List[Dict]:
+    '''
+    解析建表语句，得到表名与字段（名称、类型、注释）
+    :param ddl:
+    :return:
+    '''
+    tables = []
+    for statement in sqlglot.parse(ddl, read="mysql"):
+        if not isinstance(statement, exp.Create) or statement.kind != "TABLE":
+            continue
+        schema = statement.this
+        columns = []
+        for column in schema.expressions:
+            if not isinstance(column, exp.ColumnDef):
+                continue
+            comment = column.find(exp.CommentColumnConstraint)
+            columns.append({
+                "name": column.name,
+                "type": column.args["kind"],
+                "comment": comment.this.name if comment else "",
+                "auto": column.find(exp.AutoIncrementColumnConstraint) is not None,
+            })
+        tables.append({"name": schema.this.name, "columns": columns})
+    return tables
+
+
+def sqlite_ddl(ddl: str) -> List[str]:
+    '''
+    MySQL建表语句转为SQLite可执行的语句：去掉注释、字符集、自增与ON UPDATE；
+    SQLite的索引名全库唯一，表名作为索引名前缀
+    :param ddl:
+    :return:
+    '''
+    ddl = re.sub(r"on update CURRENT_TIMESTAMP", "", ddl, flags=re.I)
+    ddl = re.sub(r"bigint unsigned auto_increment", "integer", ddl, flags=re.I)
+    ddl = re.sub(r"bigint unsigned", "bigint", ddl, flags=re.I)
+    statements = []
+    for statement in sqlglot.parse(ddl, read="mysql"):
+        if not isinstance(statement, exp.Create):
+            continue
+        for node in list(statement.find_all(exp.CommentColumnConstraint)):
+            node.parent.pop()
+        for node in list(statement.find_all(exp.SchemaCommentProperty, exp.CharacterSetProperty)):
+            node.pop()
+        if statement.kind == "INDEX":
+            index = statement.this
+            index.set("this", exp.to_identifier(f"{index.args['table'].name}_{index.name}"))
+        statements.append(statement.sql(dialect="sqlite"))
+    return statements
+
+
+def _value(column: Dict, row: int, rng: random.Random):
+    name, kind = column["name"], column["type"]
+    if name in VALUE_POOLS:
+        return rng.choice(VALUE_POOLS[name])
+    data_type = kind.this
+    if data_type == exp.DataType.Type.DECIMAL:
+        precision, scale = [int(param.name) for param in kind.expressions] or [10, 2]
+        upper = min(10 ** (precision - scale) - 1, 10 ** 6)
+        lower = -min(upper, 10) if re.search(r"rise|fall|change|net", name) else 0
+        return round(rng.uniform(lower, upper), scale)
+    if data_type in (exp.DataType.Type.TINYINT, exp.DataType.Type.BOOLEAN):
+        return rng.randint(0, 1)
+    if data_type in (exp.DataType.Type.INT, exp.DataType.Type.BIGINT, exp.DataType.Type.UBIGINT,
+                     exp.DataType.Type.SMALLINT):
+        return rng.randint(1, 10 ** 6)
+    if data_type in (exp.DataType.Type.DATE,):
+        return (datetime.date(2020, 1, 1) + datetime.timedelta(days=row)).isoformat()
+    if data_type in (exp.DataType.Type.DATETIME, exp.DataType.Type.TIMESTAMP):
+        return datetime.datetime(2024, 1, 1, 9, 30).isoformat(sep=" ")
+    return f"{name}_{row % 50}"
+
+
+def generate(engine, stocks: int = 200, days: int = 250, institutions: int = 50, event_density: float = 0.05,
+             seed: int = 1, batch: int = 5000):
+    '''
+    生成模拟数据：维度表按规模生成；同时含stock_id与date_id的事实表，
+    “关联交易日期”的表每只股票每天一行，公告类表按event_density抽样
+    :param engine:
+    :param stocks: 股票数
+    :param days: 交易日数
+    :param institutions: 机构数
+    :param event_density: 公告类表的抽样比例
+    :param seed:
+    :param batch: 单批插入行数
+    :return: {表名: 行数}
+    '''
+    rng = random.Random(seed)
+    with open(DDL_PATH, encoding="utf-8") as file:
+        tables = parse_tables(file.read())
+    counts = {}
+    with engine.begin() as connection:
+        for table in tables:
+            columns = [column for column in table["columns"] if not column["auto"] or column["name"] != "id"]
+            names = {column["name"] for column in columns}
+            comments = {column["name"]: column["comment"] for column in columns}
+
+            def rows():
+                if table["name"] == "stock_basic":
+                    for i in range(1, stocks + 1):
+                        yield {"stock_id": i, "stock_code": f"{600000 + i:06d}.SH", "stock_name": f"股票{i}"}
+                elif table["name"] == "institution":
+                    for i in range(1, institutions + 1):
+                        yield {"inst_id": i, "inst_name": f"机构{i}"}
+                elif table["name"] == "trade_date":
+                    for i in range(1, days + 1):
+                        yield {"date_id": i, "trade_date": (datetime.date(2024, 1, 1) + datetime.timedelta(days=i - 1)).isoformat(),
+                               "is_trading_day": 1}
+                elif {"stock_id", "date_id"} <= names:
+                    daily = "交易日期" in comments.get("date_id", "")
+                    for stock_id in range(1, stocks + 1):
+                        for date_id in range(1, days + 1):
+                            if daily or rng.random() < event_density:
+                                row = {"stock_id": stock_id, "date_id": date_id}
+                                if "inst_id" in names:
+                                    row["inst_id"] = rng.randint(1, institutions)
+                                yield row
+                elif {"stock_id", "inst_id"} <= names:
+                    for stock_id in range(1, stocks + 1):
+                        for inst_id in rng.sample(range(1, institutions + 1), min(3, institutions)):
+                            yield {"stock_id": stock_id, "inst_id": inst_id}
+
+            statement = text(f"INSERT INTO {table['name']} ({', '.join(column['name'] for column in columns)}) "
+                             f"VALUES ({', '.join(':' + column['name'] for column in columns)})")
+            pending, count = [], 0
+            for index, row in enumerate(rows()):
+                for column in columns:
+                    if column["name"] not in row:
+                        row[column["name"]] = _value(column, index, rng)
+                pending.append(row)
+                if len(pending) >= batch:
+                    connection.execute(statement, pending)
+                    count += len(pending)
+                    pending = []
+            if pending:
+                connection.execute(statement, pending)
+                count += len(pending)
+            counts[table["name"]] = count
+    return counts
+
+
+def build(uri: str, stocks: int = 200, days: int = 250, **kwargs) -> Dict[str, int]:
+    '''
+    建表并生成数据（SQLite文件已存在时先删除）
+    :param uri: sqlite:///路径 或 MySQL连接串（需为空库）
+    :param stocks:
+    :param days:
+    :return: {表名: 行数}
+    '''
+    with open(DDL_PATH, encoding="utf-8") as file:
+        ddl = file.read()
+    if uri.startswith("sqlite"):
+        path = uri.split(":///", 1)[1]
+        if os.path.exists(path):
+            os.remove(path)
+        statements = sqlite_ddl(ddl)
+    else:
+        statements = [statement.strip() for statement in ddl.split(";") if statement.strip()]
+    engine = create_engine(uri)
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+    return generate(engine, stocks=stocks, days=days, **kwargs)
+
+
+if __name__ == '__main__':
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ROOT, "bench", "stock_bench.db")
+    uri = target if "://" in target else "sqlite:///" + os.path.abspath(target)
+    stocks = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    days = int(sys.argv[3]) if len(sys.argv) > 3 else 250
+    for name, count in build(uri, stocks, days).items():
+        print(f"{name:28s} {count:>10d}")
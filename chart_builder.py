@@ -0,0 +1,121 @@
+#----------------------基于查询结果的图表生成---------------------------------
+import re
+from typing import Dict, List, Optional
+
+TIME_NAME_PATTERN = re.compile(r'date|time|day|month|year|日期|时间|年份|月份', re.I)
+DATE_VALUE_PATTERN = re.compile(r'^\d{4}-\d{1,2}(-\d{1,2})?([ T]\d{1,2}:\d{2}(:\d{2})?)?')
+#编号类数值字段（stock_id、inst_id等）不作为度量
+ID_NAME_PATTERN = re.compile(r'(^|_)(id|code|no)$', re.I)
+PIE_PATTERN = re.compile(r'占比|比例|比重|分布|构成|份额')
+#多序列折线图的序列数上限
+MAX_SERIES = 10
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def column_types(columns: List[str], rows: List[list]) -> List[str]:
+    '''
+    根据字段名与取值推断字段类型
+    :param columns:
+    :param rows:
+    :return: 每个字段的类型：time / number / category / id / empty
+    '''
+    types = []
+    for index, name in enumerate(columns):
+        values = [row[index] for row in rows if row[index] is not None]
+        if not values:
+            types.append('empty')
+        elif all(isinstance(value, str) and DATE_VALUE_PATTERN.match(value) for value in values):
+            types.append('time')
+        elif all(_is_number(value) for value in values):
+            if ID_NAME_PATTERN.search(name):
+                # date_id形如20240101时按日期处理
+                if TIME_NAME_PATTERN.search(name) and all(isinstance(value, int) and 19000101 <= value <= 21001231 for value in values):
+                    types.append('time')
+                else:
+                    types.append('id')
+            elif TIME_NAME_PATTERN.search(name) and all(isinstance(value, int) and 1900 <= value <= 21001231 for value in values):
+                types.append('time')
+            else:
+                types.append('number')
+        else:
+            types.append('category')
+    return types
+
+
+def _axis_chart(chart_type: str, x_name: str, x_values: List, series: List[Dict]) -> Dict:
+    option = {
+        'title': {'text': ' / '.join(item['name'] for item in series[:3])},
+        'tooltip': {'trigger': 'axis'},
+        'legend': {'data': [item['name'] for item in series]},
+        'xAxis': {'type': 'category', 'name': x_name, 'data': x_values},
+        'yAxis': {'type': 'value'},
+        'series': [dict(item, type=chart_type) for item in series],
+    }
+    if len(x_values) > 20:
+        option['dataZoom'] = [{'type': 'slider'}, {'type': 'inside'}]
+    return option
+
+
+def build_chart(columns: List[str], rows: List[list], labels: Optional[Dict[str, str]] = None,
+                question: str = '', max_points: int = 100) -> Optional[Dict]:
+    '''
+    根据结构化查询结果按规则生成ECharts配置：
+    时间字段+度量 -> 折线图（另有一个分类字段时按分类拆分序列）；
+    分类字段+度量 -> 柱状图（问题涉及占比/分布且只有一个度量时为饼图）
+    :param columns: 字段名
+    :param rows: 行数据
+    :param labels: 字段名 -> 中文名
+    :param question: 用户问题，用于判断是否为占比类问题
+    :param max_points: 最多展示的数据点数
+    :return: ECharts配置，不适合生成图表时返回None
+    '''
+    if not columns or not rows or len(rows) < 2:
+        return None
+    labels = labels or {}
+    name = lambda index: labels.get(columns[index]) or columns[index]
+    types = column_types(columns, rows)
+    measures = [index for index, kind in enumerate(types) if kind == 'number']
+    if not measures:
+        return None
+    times = [index for index, kind in enumerate(types) if kind == 'time']
+    categories = [index for index, kind in enumerate(types) if kind == 'category']
+
+    if times:
+        x = times[0]
+        ordered = sorted(rows, key=lambda row: (row[x] is None, str(row[x])))
+        group_values = sorted({row[categories[0]] for row in ordered if row[categories[0]] is not None}) if categories else []
+        if categories and len(measures) == 1 and 1 < len(group_values) <= MAX_SERIES:
+            # 如多只股票的每日收盘价：按分类拆分为多条折线
+            group, measure = categories[0], measures[0]
+            x_values = sorted({row[x] for row in ordered if row[x] is not None})[-max_points:]
+            points = {(row[group], row[x]): row[measure] for row in ordered}
+            series = [{'name': str(value), 'data': [points.get((value, key)) for key in x_values]} for value in group_values]
+            option = _axis_chart('line', name(x), x_values, series)
+            option['title']['text'] = name(measure)
+            return option
+        ordered = ordered[-max_points:]
+        series = [{'name': name(index), 'data': [row[index] for row in ordered]} for index in measures[:5]]
+        return _axis_chart('line', name(x), [row[x] for row in ordered], series)
+
+    if categories:
+        x = categories[0]
+        rows = rows[:max_points]
+        if len(measures) == 1 and PIE_PATTERN.search(question or '') and len(rows) <= 12:
+            measure = measures[0]
+            return {
+                'title': {'text': name(measure)},
+                'tooltip': {'trigger': 'item'},
+                'legend': {'data': [str(row[x]) for row in rows]},
+                'series': [{
+                    'name': name(measure),
+                    'type': 'pie',
+                    'radius': '60%',
+                    'data': [{'name': str(row[x]), 'value': row[measure]} for row in rows],
+                }],
+            }
+        series = [{'name': name(index), 'data': [row[index] for row in rows]} for index in measures[:3]]
+        return _axis_chart('bar', name(x), [str(row[x]) for row in rows], series)
+    return None
@@ -0,0 +1,11 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+
+class CacheInvalidate(BaseModel):
+    tables: List[str] = []  #需要失效的表，为空时清空全部缓存
+
+
+class RollupRefresh(BaseModel):
+    name: Optional[str] = None  #只刷新指定的汇总表，为空时刷新全部
+    full: bool = False  #全量重建
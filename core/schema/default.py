@@ -1,5 +1,18 @@
-from pydantic import BaseModel
+from typing import List, Literal, Optional
+from pydantic import BaseModel, Field
+from settings import batch_max_questions
 
 
 class Query(BaseModel):
-    question: str
\ No newline at end of file
+    question: str
+
+
+class QueryPage(BaseModel):
+    cursor: str
+    size: Optional[int] = Field(None, ge=1, le=10000)
+
+
+class BatchQuery(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=batch_max_questions)
+    format: Literal['jsonl', 'parquet'] = 'jsonl'
+    concurrency: Optional[int] = Field(None, ge=1, le=64)
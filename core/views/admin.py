@@ -0,0 +1,130 @@
+import asyncio
+import secrets
+import settings
+from typing import Optional
+from fastapi import Header,HTTPException
+from core.schema.admin import CacheInvalidate,RollupRefresh
+from texttosql import db,sql_executor,result_cache,question_cache,session_memory,llm_gateway,llm_cache,result_cursors,rollup_manager,read_router
+from sql_executor import exec_path_counter
+
+
+async def require_admin_token(x_admin_token: Optional[str] = Header(default=None)):
+    '''
+    管理接口的访问校验：未配置admin_token时管理接口关闭
+    :param x_admin_token: 请求头X-Admin-Token
+    :return:
+    '''
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="管理接口未开启")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token.encode("utf-8"), settings.admin_token.encode("utf-8")):
+        raise HTTPException(status_code=401, detail="管理接口令牌无效")
+
+
+async def schema_refresh():
+    '''
+    强制刷新表结构缓存
+    :return:
+    '''
+    # 重新读取指纹与反射需要访问数据库，不阻塞事件循环
+    await asyncio.to_thread(db.refresh_schema)
+    return {'schema_version': db.schema_version}
+
+async def schema_metrics():
+    '''
+    表结构缓存指标
+    :return:
+    '''
+    return db.schema_metrics()
+
+async def exec_metrics():
+    '''
+    SQL执行路径计数与执行线程池/连接池指标
+    :return:
+    '''
+    return {'paths': dict(exec_path_counter), 'executor': sql_executor.metrics()}
+
+async def result_cache_stats():
+    '''
+    查询结果缓存命中/未命中/淘汰统计
+    :return:
+    '''
+    return result_cache.stats()
+
+async def result_cache_invalidate(body: CacheInvalidate):
+    '''
+    按表失效查询结果缓存（数据导入任务完成后调用）
+    :param body:
+    :return:
+    '''
+    if not body.tables:
+        result_cache.clear()
+        return {'invalidated': 'all'}
+    return {'invalidated': result_cache.invalidate_tables(body.tables)}
+
+async def question_cache_stats():
+    '''
+    问题缓存命中统计
+    :return:
+    '''
+    return question_cache.stats()
+
+async def session_stats():
+    '''
+    会话记忆指标：会话数、总大小与每个会话占用的字节数
+    :return:
+    '''
+    # sqlite/mysql存储时需要查询数据库
+    return await asyncio.to_thread(session_memory.stats)
+
+async def llm_stats():
+    '''
+    LLM调用调度指标：当前并发与上限、各优先级排队数、平均等待时间、合并/限流/重试次数
+    :return:
+    '''
+    return llm_gateway.stats()
+
+async def llm_cache_stats():
+    '''
+    LLM响应缓存指标：模式、命中率、条目数与大小（按节点）
+    :return:
+    '''
+    return await asyncio.to_thread(llm_cache.stats)
+
+async def llm_cache_clear():
+    '''
+    清空LLM响应缓存（模型或提示词调整后调用）
+    :return:
+    '''
+    return {'removed': await asyncio.to_thread(llm_cache.clear)}
+
+async def cursor_stats():
+    '''
+    大结果集游标指标：游标数、打开的游标数、过期/淘汰/重新执行次数与累计读取的批次、行数
+    :return:
+    '''
+    return result_cursors.stats()
+
+async def rollup_stats():
+    '''
+    汇总表指标：每个汇总表的水位、是否可用、最近一次刷新方式与耗时，查询改写命中率与未命中原因
+    :return:
+    '''
+    return rollup_manager.stats()
+
+async def rollup_refresh(body: RollupRefresh):
+    '''
+    刷新汇总表（数据导入完成后调用；历史数据更正后需全量刷新）
+    :param body:
+    :return:
+    '''
+    # 全量重建耗时较长，不占用SQL执行线程
+    return await asyncio.to_thread(rollup_manager.refresh, body.name, body.full)
+
+async def replica_stats():
+    '''
+    只读副本：各节点的权重、是否可用、数据水位与落后主库的交易日数、分配的连接数与连接失败次数
+    :return:
+    '''
+    if read_router is None:
+        return {'enabled': False, 'nodes': []}
+    return dict(read_router.stats(), enabled=True)
@@ -1,12 +1,15 @@
 from fastapi import Request
 import uuid
 import os
-import json
-from starlette.responses import StreamingResponse
+from typing import Literal, Optional
+from fastapi import HTTPException
+from starlette.responses import Response,StreamingResponse
 from starlette.templating import Jinja2Templates
-from core.schema.default import Query
-from settings import template_dir
-from texttosql import stream_sql_query
+from core.schema.default import Query,QueryPage,BatchQuery
+from settings import template_dir,stream_compress_min_bytes
+from stream_events import encode_sse
+from texttosql import stream_sql_query,stream_query_page,open_export,export_chunks
+from batch_query import BATCH_FORMATS,check_format,run_batch,encode_jsonl,encode_parquet
 
 template=Jinja2Templates(directory=str(template_dir))
 
@@ -31,7 +34,74 @@ async def query(request: Request, query: Query):
 
     async def generate():
         result = stream_sql_query(q, session_id)
-        async for chunk in result:
-            yield json.dumps({'content': chunk}) + '\n'
+        try:
+            # 每个事件单独发送（发送缓冲区满时等待客户端读取，不在服务端堆积）
+            async for event, data in result:
+                # 客户端断开后不再继续执行工作流
+                if await request.is_disconnected():
+                    break
+                yield encode_sse(event, data, stream_compress_min_bytes)
+        finally:
+            # 关闭工作流生成器，取消仍在进行的节点（正在执行的SQL会被中断）
+            await result.aclose()
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
\ No newline at end of file
+    # 禁止代理缓冲，保证每个事件即时到达
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def query_page(request: Request, page: QueryPage):
+    session_id = request.cookies.get("session_id") or ""
+
+    async def generate():
+        result = stream_query_page(page.cursor, session_id, page.size)
+        try:
+            async for event, data in result:
+                if await request.is_disconnected():
+                    break
+                yield encode_sse(event, data, stream_compress_min_bytes)
+        finally:
+            await result.aclose()
+
+    return StreamingResponse(generate(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def query_export(request: Request, format: Literal['csv', 'arrow', 'parquet'] = 'csv', cursor: Optional[str] = None):
+    '''
+    导出完整的查询结果，按批读取并编码后流式发送，不经过LLM
+    :param request:
+    :param format: csv、arrow（Arrow IPC流）或parquet
+    :param cursor: 查询结果的游标，为空时导出会话上一次执行的SQL
+    :return:
+    '''
+    session_id = request.cookies.get("session_id") or ""
+    try:
+        export = await open_export(session_id, format, cursor)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(export_chunks(export), media_type=export.media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{export.filename}"'})
+
+async def query_batch(batch: BatchQuery):
+    '''
+    批量查询：并发执行一批问题（相同问题只执行一次），不生成图表
+    jsonl按完成顺序逐行返回每个问题的结果；parquet在全部完成后返回一个文件
+    :param batch:
+    :return:
+    '''
+    try:
+        check_format(batch.format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if batch.format == 'parquet':
+        items = [item async for item in run_batch(batch.questions, batch.concurrency)]
+        return Response(encode_parquet(items), media_type=BATCH_FORMATS['parquet'],
+                        headers={"Content-Disposition": 'attachment; filename="batch.parquet"'})
+
+    async def generate():
+        async for item in run_batch(batch.questions, batch.concurrency):
+            yield encode_jsonl(item)
+
+    return StreamingResponse(generate(), media_type=BATCH_FORMATS['jsonl'],
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,17 @@
+from starlette.responses import JSONResponse
+from startup import startup_state
+
+
+async def healthz():
+    '''
+    存活检查：进程能够响应请求即返回成功，不访问数据库与LLM
+    :return:
+    '''
+    return {'status': 'ok'}
+
+async def readyz():
+    '''
+    就绪检查：启动预热完成后返回200，预热进行中或失败时返回503；附带导入与预热各步骤的耗时
+    :return:
+    '''
+    return JSONResponse(startup_state.snapshot(), status_code=200 if startup_state.ready else 503)
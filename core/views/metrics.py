@@ -0,0 +1,10 @@
+from starlette.responses import PlainTextResponse
+from tracing import render_metrics
+
+
+async def metrics():
+    '''
+    Prometheus指标：请求、节点、LLM、数据库调用耗时与token/费用
+    :return:
+    '''
+    return PlainTextResponse(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,131 @@
+#----------------------查询代价评估---------------------------------
+import json
+from typing import Dict, Optional
+from sql_executor import exec_driver_sql
+
+
+def _num(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _add_table(table: Dict, result: Dict):
+    access = {
+        "table": table.get("table_name"),
+        "access_type": table.get("access_type"),
+        "key": table.get("key"),
+        "possible_keys": table.get("possible_keys") or [],
+        "rows": _num(table.get("rows_examined_per_scan")),
+    }
+    result["tables"].append(access)
+    # ALL为全表扫描，index为全索引扫描
+    if access["access_type"] in ("ALL", "index"):
+        result["full_scans"].append(access["table"])
+
+
+def _walk(node, result: Dict):
+    '''
+    遍历EXPLAIN FORMAT=JSON的结果，按嵌套循环估算扫描行数：
+    第k张表的扫描行数 = 前k-1张表连接产生的行数 × 该表每次扫描的行数
+    :param node:
+    :param result:
+    :return:
+    '''
+    if isinstance(node, list):
+        for item in node:
+            _walk(item, result)
+        return
+    if not isinstance(node, dict):
+        return
+    for key, value in node.items():
+        if key == "nested_loop" and isinstance(value, list):
+            produced = 1.0
+            for item in value:
+                table = item.get("table") if isinstance(item, dict) else None
+                if not isinstance(table, dict):
+                    _walk(item, result)
+                    continue
+                result["rows_examined"] += produced * _num(table.get("rows_examined_per_scan"))
+                produced = max(_num(table.get("rows_produced_per_join")), 1.0)
+                _add_table(table, result)
+                _walk(table, result)
+        elif key == "table" and isinstance(value, dict):
+            result["rows_examined"] += _num(value.get("rows_examined_per_scan"))
+            _add_table(value, result)
+            _walk(value, result)
+        elif isinstance(value, (dict, list)):
+            _walk(value, result)
+
+
+def parse_explain(plan: Dict) -> Dict:
+    '''
+    从EXPLAIN FORMAT=JSON的结果中提取预计扫描行数、查询代价与每张表的访问方式
+    :param plan:
+    :return:
+    '''
+    result = {"rows_examined": 0.0, "query_cost": 0.0, "tables": [], "full_scans": []}
+    result["query_cost"] = _num(plan.get("query_block", {}).get("cost_info", {}).get("query_cost"))
+    _walk(plan, result)
+    return result
+
+
+class CostGuard:
+    '''
+    执行前基于EXPLAIN的代价评估，预计扫描行数超过预算的查询不执行
+    '''
+
+    def __init__(self, engine, max_rows_examined: float = 5_000_000):
+        '''
+        :param engine: SQLAlchemy引擎
+        :param max_rows_examined: 预计扫描行数预算
+        '''
+        self._engine = engine
+        self.max_rows_examined = max_rows_examined
+
+    @property
+    def supported(self) -> bool:
+        return self._engine.dialect.name == "mysql"
+
+    def estimate(self, sql: str) -> Dict:
+        '''
+        执行EXPLAIN FORMAT=JSON并解析（同步，运行在执行线程中）
+        :param sql:
+        :return:
+        '''
+        with self._engine.connect() as connection:
+            row = exec_driver_sql(connection, f"EXPLAIN FORMAT=JSON {sql}").fetchone()
+        return parse_explain(json.loads(row[0]))
+
+    def check(self, estimate: Dict) -> Optional[str]:
+        '''
+        判断是否超出预算
+        :param estimate:
+        :return: 超出预算时返回反馈信息（用于提示LLM重新生成），否则None
+        '''
+        if estimate["rows_examined"] <= self.max_rows_examined:
+            return None
+        feedback = f"预计扫描约{int(estimate['rows_examined'])}行，超过预算{int(self.max_rows_examined)}行"
+        if estimate["full_scans"]:
+            feedback += f"；以下表为全表扫描：{'、'.join(estimate['full_scans'])}"
+        unused = [
+            f"{table['table']}({'/'.join(table['possible_keys'])})"
+            for table in estimate["tables"] if table["possible_keys"] and not table["key"]
+        ]
+        if unused:
+            feedback += f"；以下表有可用索引但未使用：{'、'.join(unused)}"
+        return feedback + "；请通过带索引的字段（如stock_id、date_id、inst_id）关联和过滤，并缩小日期范围"
+
+
+def describe(estimate: Dict) -> str:
+    '''
+    代价评估结果的简要描述
+    :param estimate:
+    :return:
+    '''
+    keys = [f"{table['table']}:{table['key']}" for table in estimate["tables"] if table["key"]]
+    text = f"预计扫描约{int(estimate['rows_examined'])}行"
+    if keys:
+        text += f"，使用索引 {', '.join(keys)}"
+    return text
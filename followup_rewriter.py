@@ -0,0 +1,138 @@
+#----------------------追问改写---------------------------------
+import re
+from typing import Optional
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sql_ast import DIALECT, parse_sql
+
+CN_DIGITS = {'零': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+NUMBER = r'\d+|[零一二两三四五六七八九十百]+'
+
+FILTER_PATTERN = re.compile(
+    r'(大于等于|小于等于|不低于|不高于|不少于|不超过|大于|小于|高于|低于|超过|等于|改成|改为|换成|换为)\s*(-?\d+(?:\.\d+)?)'
+)
+LIMIT_PATTERNS = [
+    re.compile(r'前\s*(' + NUMBER + r')\s*(?:条|个|行|名|只)?'),
+    re.compile(r'top\s*(\d+)', re.I),
+    re.compile(r'(' + NUMBER + r')\s*(?:条|个|行|名|只)'),
+]
+#“倒序”按常见用法视为降序（上一次已是降序时不变）；把现有排序反过来用FLIP_PATTERN中的说法
+DESC_PATTERN = re.compile(r'降序|倒序|从大到小|由大到小|从高到低|由高到低')
+ASC_PATTERN = re.compile(r'升序|正序|从小到大|由小到大|从低到高|由低到高')
+FLIP_PATTERN = re.compile(r'反过来|反序|顺序反')
+#识别出改写意图后剩余的内容只能是这些语气/填充词，否则视为语义不明确，交给LLM
+FILLER_PATTERN = re.compile(
+    r'只需要|只需|只要|只看|只显示|只返回|只取|给我|显示|返回|查询|看看|看下|看一下|就行|就好|即可|可以|'
+    r'改成|改为|换成|换为|那就|请|吧|呢|啊|了|的|数据|记录|结果|一下|再|按|排序|排列|排|取|要|[\s，。,.!！?？、~]'
+)
+COMPARISONS = {
+    '大于': exp.GT, '高于': exp.GT, '超过': exp.GT,
+    '大于等于': exp.GTE, '不低于': exp.GTE, '不少于': exp.GTE,
+    '小于': exp.LT, '低于': exp.LT,
+    '小于等于': exp.LTE, '不高于': exp.LTE, '不超过': exp.LTE,
+    '等于': exp.EQ,
+}
+
+
+def parse_cn_number(text: str) -> Optional[int]:
+    '''
+    解析阿拉伯数字或简单中文数字（一百以内，如“两”、“十五”、“二十”）
+    :param text:
+    :return:
+    '''
+    if text.isdigit():
+        return int(text)
+    if text == '百' or text == '一百':
+        return 100
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        if (tens and tens not in CN_DIGITS) or (ones and ones not in CN_DIGITS):
+            return None
+        return CN_DIGITS.get(tens, 1) * 10 + CN_DIGITS.get(ones, 0)
+    if len(text) == 1 and text in CN_DIGITS:
+        return CN_DIGITS[text]
+    return None
+
+
+def _numeric_comparisons(where: exp.Expression):
+    comparisons = []
+    for node in where.find_all(exp.GT, exp.GTE, exp.LT, exp.LTE, exp.EQ):
+        sides = (node.this, node.expression)
+        if any(isinstance(side, exp.Column) for side in sides) and \
+                any(isinstance(side, exp.Literal) and not side.is_string for side in sides):
+            comparisons.append(node)
+    return comparisons
+
+
+def rewrite_follow_up(question: str, last_sql: Optional[str]) -> Optional[str]:
+    '''
+    将“只需要前两条”、“倒序”、“改成大于50”等追问直接改写为基于上一次SQL的新SQL
+    :param question: 用户问题
+    :param last_sql: 上一次执行的SQL
+    :return: 改写后的SQL，无法确定意图时返回None（交由LLM生成）
+    '''
+    if not last_sql or not question:
+        return None
+    try:
+        tree = parse_sql(last_sql)
+    except SqlglotError:
+        return None
+    if not isinstance(tree, exp.Select):
+        return None
+    rest = question
+    changed = False
+
+    # 条件值调整：只在上一次SQL恰好有一个“字段 比较 数值”条件时改写
+    filter_match = FILTER_PATTERN.search(rest)
+    if filter_match:
+        where = tree.args.get('where')
+        comparisons = _numeric_comparisons(where) if where else []
+        if len(comparisons) != 1:
+            return None
+        node = comparisons[0]
+        literal_first = not isinstance(node.this, exp.Column)
+        column = node.expression if literal_first else node.this
+        value = exp.Literal.number(filter_match.group(2))
+        operator = COMPARISONS.get(filter_match.group(1))
+        if operator is None:
+            # 只给出新数值（如“换成50”），沿用原来的比较方式
+            (node.this if literal_first else node.expression).replace(value)
+        else:
+            node.replace(operator(this=column.copy(), expression=value))
+        rest = rest[:filter_match.start()] + rest[filter_match.end():]
+        changed = True
+
+    # 排序方向
+    direction = None
+    for pattern, value in ((DESC_PATTERN, 'desc'), (ASC_PATTERN, 'asc'), (FLIP_PATTERN, 'flip')):
+        match = pattern.search(rest)
+        if match:
+            direction = value
+            rest = rest[:match.start()] + rest[match.end():]
+            break
+    if direction:
+        order = tree.args.get('order')
+        if order is None or not order.expressions:
+            return None
+        ordered = order.expressions[0]
+        desc = {'desc': True, 'asc': False, 'flip': not ordered.args.get('desc')}[direction]
+        ordered.set('desc', desc)
+        # 与MySQL默认的NULL排序一致（升序NULL在前），避免生成额外的CASE排序表达式
+        ordered.set('nulls_first', not desc)
+        changed = True
+
+    # 返回条数
+    for pattern in LIMIT_PATTERNS:
+        match = pattern.search(rest)
+        if match:
+            limit = parse_cn_number(match.group(1))
+            if not limit:
+                return None
+            tree = tree.limit(limit)
+            rest = rest[:match.start()] + rest[match.end():]
+            changed = True
+            break
+
+    if not changed or FILLER_PATTERN.sub('', rest):
+        return None
+    return tree.sql(dialect=DIALECT)
@@ -0,0 +1,44 @@
+#----------------------编译图注册表---------------------------------
+import asyncio
+import time
+from logger import logger
+
+
+class GraphRegistry:
+    '''
+    进程级的已编译工作流缓存
+    首次使用时编译一次，之后所有请求共享同一个编译结果（提示词不在图中，由各节点按文件修改时间重新加载）
+    '''
+
+    def __init__(self, builder):
+        '''
+        :param builder: 返回已编译图的异步函数
+        '''
+        self._builder = builder
+        self._graph = None
+        self._lock = asyncio.Lock()
+        self.version = 0
+        self.build_seconds = 0.0
+
+    async def _build(self):
+        start = time.perf_counter()
+        graph = await self._builder()
+        self.build_seconds = time.perf_counter() - start
+        self._graph = graph
+        self.version += 1
+        logger.info(f"工作流已编译，版本: {self.version}，耗时: {self.build_seconds * 1000:.1f}ms")
+        return graph
+
+    async def get(self):
+        '''
+        获取已编译的图，未编译时编译
+        :return:
+        '''
+        graph = self._graph
+        if graph is not None:
+            return graph
+        async with self._lock:
+            # 等待锁期间可能已被其他请求编译
+            if self._graph is not None:
+                return self._graph
+            return await self._build()
@@ -3,8 +3,8 @@ from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
-def fastapi_init():
-    app = FastAPI()
+def fastapi_init(lifespan=None):
+    app = FastAPI(lifespan=lifespan)
     STATIC_DIR = "static"
     os.makedirs(STATIC_DIR, exist_ok=True)
     # 添加 CORS 中间件
@@ -0,0 +1,178 @@
+#----------------------LLM响应缓存---------------------------------
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from logger import logger
+from tracing import LLM_CACHE
+
+#off=关闭，on=读写缓存，record=调用模型并写入（录制），replay=只读缓存、未命中时报错（离线回放）
+CACHE_MODES = ('off', 'on', 'record', 'replay')
+
+
+class CassetteMiss(Exception):
+    '''
+    回放模式下调用没有录制的响应
+    '''
+
+
+def _dump_generation(generation) -> Dict:
+    # 回放的响应不带token用量（未实际调用模型，不计入用量与费用）
+    message = message_to_dict(generation.message)
+    message["data"]["usage_metadata"] = None
+    return {"message": message, "generation_info": generation.generation_info}
+
+
+def dump_result(result: ChatResult) -> str:
+    return json.dumps({"generations": [_dump_generation(generation) for generation in result.generations],
+                       "llm_output": result.llm_output}, ensure_ascii=False, default=str)
+
+
+def load_result(data: str) -> ChatResult:
+    value = json.loads(data)
+    generations = [ChatGeneration(message=messages_from_dict([item["message"]])[0], generation_info=item["generation_info"])
+                   for item in value["generations"]]
+    return ChatResult(generations=generations, llm_output=value["llm_output"])
+
+
+def dump_chunks(chunks: List[ChatGenerationChunk]) -> str:
+    return json.dumps([_dump_generation(chunk) for chunk in chunks], ensure_ascii=False, default=str)
+
+
+def load_chunks(data: str) -> List[ChatGenerationChunk]:
+    return [ChatGenerationChunk(message=messages_from_dict([item["message"]])[0], generation_info=item["generation_info"])
+            for item in json.loads(data)]
+
+
+class LLMCache:
+    '''
+    LLM响应的本地缓存（SQLite，WAL模式，同一主机的多个worker共享），键为模型参数、消息、
+    绑定参数（工具、结构化输出格式）的哈希（llm_gateway.request_key），流式与非流式调用分别缓存。
+    on模式只缓存nodes中工作流节点的调用，总大小超过max_bytes时淘汰最久未使用的条目；
+    record/replay模式对所有节点生效且不淘汰：录制文件（cassette）可用于离线运行完整的工作流
+    读写为同步调用，需在执行线程中运行
+    '''
+
+    def __init__(self, path: str, mode: str = 'on', max_bytes: int = 256 * 1024 * 1024, nodes: Sequence[str] = ()):
+        '''
+        :param path: SQLite文件路径
+        :param mode: CACHE_MODES之一
+        :param max_bytes: on模式下缓存的总大小上限
+        :param nodes: on模式下缓存哪些节点的调用
+        '''
+        if mode not in CACHE_MODES:
+            raise ValueError(f"不支持的LLM缓存模式：{mode}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.nodes = set(nodes)
+        self._lock = threading.Lock()
+        self._connection = None
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evicted": 0}
+
+    def enabled(self, node: str) -> bool:
+        '''
+        :param node: 当前的工作流节点
+        :return: 该节点的调用是否经过缓存
+        '''
+        if self.mode == 'off':
+            return False
+        return self.mode != 'on' or node in self.nodes
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, node TEXT, value TEXT NOT NULL, "
+                               "size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0)")
+            connection.execute("CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache (used)")
+            self._bytes = connection.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+            self._connection = connection
+        return self._connection
+
+    def get(self, key: str) -> Optional[str]:
+        '''
+        :param key: 调用类型与request_key
+        :return: 序列化的响应，未命中时返回None；回放模式未命中时抛出CassetteMiss
+        '''
+        if self.mode == 'record':
+            return None
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE llm_cache SET used = ?, hits = hits + 1 WHERE key = ?", (time.time(), key))
+            self._stats["hits" if row is not None else "misses"] += 1
+        LLM_CACHE.inc(result="hit" if row is not None else "miss")
+        if row is None and self.mode == 'replay':
+            raise CassetteMiss(f"录制文件{self.path}中没有该调用的响应（{key[:24]}），请先以record模式录制")
+        return row[0] if row is not None else None
+
+    def put(self, key: str, node: str, value: str):
+        '''
+        写入响应，on模式下超出大小上限时淘汰最久未使用的条目
+        :param key:
+        :param node:
+        :param value: 序列化的响应
+        :return:
+        '''
+        if self.mode not in ('on', 'record'):
+            return
+        size = len(value.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            old = connection.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            connection.execute("INSERT OR REPLACE INTO llm_cache (key, node, value, size, created, used, hits) "
+                               "VALUES (?, ?, ?, ?, ?, ?, 0)", (key, node, value, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            self._stats["writes"] += 1
+            if self.mode == 'on' and self._bytes > self.max_bytes:
+                self._evict(connection)
+        LLM_CACHE.inc(result="store")
+
+    def _evict(self, connection: sqlite3.Connection):
+        # 其他worker也会写入，按表中的实际大小淘汰到上限的90%
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for key, size in connection.execute("SELECT key, size FROM llm_cache ORDER BY used").fetchall():
+            if total <= target:
+                break
+            connection.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._bytes = total
+        self._stats["evicted"] += evicted
+        logger.info(f"LLM缓存超出大小上限，淘汰{evicted}条")
+
+    def clear(self) -> int:
+        '''
+        清空缓存
+        :return: 删除的条目数
+        '''
+        with self._lock:
+            removed = self._connect().execute("DELETE FROM llm_cache").rowcount
+            self._bytes = 0
+        return removed
+
+    def stats(self) -> Dict:
+        '''
+        命中/未命中/写入/淘汰次数与当前条目数、大小，按节点统计条目数
+        :return:
+        '''
+        stats = dict(self._stats, mode=self.mode, path=self.path, max_bytes=self.max_bytes, nodes=sorted(self.nodes))
+        if self.mode == 'off':
+            return stats
+        with self._lock:
+            connection = self._connect()
+            stats["entries"], stats["bytes"] = connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            stats["entries_by_node"] = dict(connection.execute("SELECT node, COUNT(*) FROM llm_cache GROUP BY node").fetchall())
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0
+        return stats
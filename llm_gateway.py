@@ -0,0 +1,427 @@
+#----------------------LLM调用调度---------------------------------
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import itertools
+import json
+import random
+import time
+from typing import Any, Dict, Optional, Sequence
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import RunnableBinding, RunnableParallel, RunnableSequence
+from logger import logger
+from llm_cache import dump_result, load_result, dump_chunks, load_chunks
+from tracing import (current_node, LLM_QUEUE_DEPTH, LLM_INFLIGHT, LLM_CONCURRENCY_LIMIT, LLM_QUEUE_SECONDS,
+                     LLM_COALESCED, LLM_RATE_LIMITED)
+
+
+class _LeaderCancelled(Exception):
+    '''
+    合并调用中发起实际调用的一方被取消，等待方需重新发起
+    '''
+
+
+def request_key(params: Dict, messages, stop, kwargs: Dict) -> str:
+    '''
+    调用的唯一标识：模型参数、消息、stop与绑定参数（工具、结构化输出格式）相同即视为同一调用
+    :param params:
+    :param messages:
+    :param stop:
+    :param kwargs:
+    :return:
+    '''
+    payload = json.dumps([params, [message.model_dump(exclude={"id"}) for message in messages], stop, kwargs],
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _status_code(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _replay(result):
+    '''
+    合并调用的等待方得到结果的副本，并去掉token用量（实际只调用了一次，避免重复计费统计）
+    :param result: ChatResult 或 ChatGenerationChunk
+    :return:
+    '''
+    result = result.model_copy(deep=True)
+    for generation in getattr(result, "generations", None) or [result]:
+        if getattr(generation.message, "usage_metadata", None):
+            generation.message.usage_metadata = None
+    return result
+
+
+class LLMGateway:
+    '''
+    LLM调用调度：并发上限（排队时按优先级分配名额）、令牌桶限速、进行中的相同调用合并，
+    限流（429）或服务暂时不可用时退避重试；遇到限流时并发上限减半，之后随成功调用逐步恢复
+    '''
+
+    def __init__(self, max_concurrency: int = 8, rate: float = 0, burst: int = 10, max_retries: int = 3,
+                 backoff_base: float = 1, backoff_max: float = 30, low_priority_nodes: Sequence[str] = ()):
+        '''
+        :param max_concurrency: 同时进行的调用数上限
+        :param rate: 每秒发起的调用数（令牌桶速率），0表示不限
+        :param burst: 令牌桶容量（允许的突发调用数）
+        :param max_retries: 限流或服务不可用时的最大重试次数
+        :param backoff_base: 首次重试的等待时间（秒），之后指数增长
+        :param backoff_max: 重试等待时间上限（秒）
+        :param low_priority_nodes: 低优先级的工作流节点，排队时让出名额
+        '''
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.low_priority_nodes = set(low_priority_nodes)
+        self._active = 0
+        # 等待名额的调用：[优先级, 序号, future]，优先级小的先分配，同优先级先到先得
+        self._waiters = []
+        self._seq = itertools.count()
+        self._depth = {"high": 0, "low": 0}
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0, "rate_limited": 0, "retries": 0, "errors": 0,
+                       "queue_seconds_total": 0.0}
+        LLM_CONCURRENCY_LIMIT.set(self.limit)
+
+    def lane(self) -> str:
+        return "low" if current_node.get() in self.low_priority_nodes else "high"
+
+    async def _acquire(self, lane: str):
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [1 if lane == "low" else 0, next(self._seq), future])
+        self._depth[lane] += 1
+        LLM_QUEUE_DEPTH.set(self._depth[lane], lane=lane)
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 已分配到名额后才被取消时归还名额；未分配的future已被取消，分配时跳过
+            if future.done() and not future.cancelled():
+                self._release()
+            raise
+        finally:
+            self._depth[lane] -= 1
+            LLM_QUEUE_DEPTH.set(self._depth[lane], lane=lane)
+
+    def _release(self):
+        self._active -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._active < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    async def _throttle(self):
+        '''
+        限流后的全局暂停与令牌桶限速
+        :return:
+        '''
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if not self.rate:
+                return
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, lane: str):
+        '''
+        获取一个调用名额（排队与限速的等待时间计入指标）
+        :param lane: high / low
+        :return:
+        '''
+        start = time.perf_counter()
+        await self._acquire(lane)
+        try:
+            await self._throttle()
+            seconds = time.perf_counter() - start
+            LLM_QUEUE_SECONDS.observe(seconds, lane=lane)
+            self._stats["queue_seconds_total"] += seconds
+            self._stats["calls"] += 1
+            LLM_INFLIGHT.set(self._active)
+            yield
+        finally:
+            self._release()
+            LLM_INFLIGHT.set(self._active)
+
+    def _on_success(self):
+        # 加性恢复：连续成功的调用数达到当前上限时上限加一
+        if self.limit >= self.max_concurrency:
+            return
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            self.limit += 1
+            LLM_CONCURRENCY_LIMIT.set(self.limit)
+            self._wake()
+
+    def _backoff(self, error: Exception, attempt: int) -> float:
+        '''
+        判断是否重试并计算等待时间，不重试时重新抛出异常
+        :param error:
+        :param attempt: 已重试次数
+        :return: 等待时间（秒）
+        '''
+        status = _status_code(error)
+        if status is not None:
+            retryable = status == 429 or status >= 500
+        else:
+            retryable = type(error).__name__ in ("APIConnectionError", "APITimeoutError")
+        if not retryable or attempt >= self.max_retries:
+            self._stats["errors"] += 1
+            raise error
+        delay = _retry_after(error) or min(self.backoff_max, self.backoff_base * 2 ** attempt) * random.uniform(0.5, 1)
+        self._stats["retries"] += 1
+        if status == 429:
+            # 乘性降低并发上限，并暂停所有调用直到退避结束
+            self._stats["rate_limited"] += 1
+            LLM_RATE_LIMITED.inc()
+            self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            LLM_CONCURRENCY_LIMIT.set(self.limit)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        logger.warning(f"LLM调用失败（{status or type(error).__name__}），{delay:.1f}秒后第{attempt + 1}次重试")
+        return delay
+
+    async def _join(self, key: str):
+        '''
+        等待进行中的相同调用
+        :param key:
+        :return: 结果，没有进行中的相同调用时返回None
+        '''
+        while key in self._inflight:
+            self._stats["coalesced"] += 1
+            LLM_COALESCED.inc()
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except _LeaderCancelled:
+                continue
+        return None
+
+    def _lead(self, key: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        return future
+
+    def _settle(self, key: str, future: asyncio.Future, result=None, error: Optional[BaseException] = None):
+        self._inflight.pop(key, None)
+        if future.done():
+            return
+        if error is None:
+            future.set_result(result)
+            return
+        future.set_exception(error if isinstance(error, Exception) else _LeaderCancelled())
+        # 没有等待方时避免“Future exception was never retrieved”
+        future.exception()
+
+    async def generate(self, key: str, call):
+        '''
+        经调度执行一次调用，相同的调用进行中时直接等待其结果
+        :param key: request_key
+        :param call: 无参的协程函数，返回ChatResult
+        :return:
+        '''
+        result = await self._join(key)
+        if result is not None:
+            return _replay(result)
+        future = self._lead(key)
+        lane = self.lane()
+        attempt = 0
+        try:
+            while True:
+                async with self.slot(lane):
+                    try:
+                        result = await call()
+                        self._on_success()
+                        break
+                    except Exception as e:
+                        delay = self._backoff(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def stream(self, key: str, call):
+        '''
+        经调度执行一次流式调用；输出第一个分块前失败才重试。相同的调用进行中时等待其结束后重放全部分块
+        :param key: request_key
+        :param call: 无参函数，返回分块的异步迭代器
+        :return:
+        '''
+        chunks = await self._join(key)
+        if chunks is not None:
+            for chunk in chunks:
+                yield _replay(chunk)
+            return
+        future = self._lead(key)
+        lane = self.lane()
+        chunks = []
+        attempt = 0
+        try:
+            while True:
+                async with self.slot(lane):
+                    try:
+                        async for chunk in call():
+                            chunks.append(chunk)
+                            yield chunk
+                        self._on_success()
+                        break
+                    except Exception as e:
+                        if chunks:
+                            raise
+                        delay = self._backoff(e, attempt)
+                attempt += 1
+                await asyncio.sleep(delay)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, chunks)
+
+    def stats(self) -> Dict:
+        '''
+        当前并发、排队数与累计的调用、合并、限流、重试次数
+        :return:
+        '''
+        stats = dict(self._stats)
+        stats.update(active=self._active, limit=self.limit, max_concurrency=self.max_concurrency,
+                     queue_depth=dict(self._depth), inflight_keys=len(self._inflight))
+        stats["queue_seconds_avg"] = stats["queue_seconds_total"] / stats["calls"] if stats["calls"] else 0
+        return stats
+
+
+class GatewayChatModel(BaseChatModel):
+    '''
+    经LLMGateway调度的聊天模型：包装实际的模型，链、agent、工具调用与结构化输出的调用都经过调度；
+    设置response_cache（llm_cache.LLMCache）时先查缓存，命中的调用不经过调度也不调用模型
+    '''
+    model: BaseChatModel
+    gateway: Any
+    response_cache: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.model._identifying_params
+
+    def _key(self, messages, stop, kwargs) -> str:
+        return request_key(self._identifying_params, messages, stop, kwargs)
+
+    def _cache(self):
+        '''
+        :return: 当前节点的调用使用的缓存，不使用时返回None
+        '''
+        if self.response_cache is not None and self.response_cache.enabled(current_node.get()):
+            return self.response_cache
+        return None
+
+    def _should_stream(self, *, async_api: bool, run_manager=None, **kwargs) -> bool:
+        # 是否流式调用由实际模型决定（不支持流式的模型走_agenerate）
+        return self.model._should_stream(async_api=async_api, run_manager=run_manager, **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        # 同步调用不经过调度（服务中只使用异步调用）
+        return self.model._generate(messages, stop=stop, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        cache = self._cache()
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, f"generate:{key}")
+            if cached is not None:
+                return load_result(cached)
+        # 回调由本模型触发，实际模型不再传入run_manager，避免重复回调
+        result = await self.gateway.generate(key, lambda: self.model._agenerate(messages, stop=stop, **kwargs))
+        if cache is not None:
+            await asyncio.to_thread(cache.put, f"generate:{key}", current_node.get(), dump_result(result))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        key = self._key(messages, stop, kwargs)
+        cache = self._cache()
+        if cache is not None:
+            cached = await asyncio.to_thread(cache.get, f"stream:{key}")
+            if cached is not None:
+                for chunk in load_chunks(cached):
+                    yield chunk
+                return
+        chunks = []
+        async for chunk in self.gateway.stream(key, lambda: self.model._astream(messages, stop=stop, **kwargs)):
+            chunks.append(chunk)
+            yield chunk
+        # 调用方中途停止读取时不写入不完整的响应
+        if cache is not None:
+            await asyncio.to_thread(cache.put, f"stream:{key}", current_node.get(), dump_chunks(chunks))
+
+    def bind_tools(self, tools, **kwargs):
+        # 工具定义由实际模型转换，调用仍经过调度
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def _route(self, runnable):
+        '''
+        将实际模型构造的链中对实际模型的调用替换为本模型（经过调度），链中没有实际模型时返回None
+        :param runnable:
+        :return:
+        '''
+        if runnable is self.model:
+            return self
+        if isinstance(runnable, RunnableBinding) and runnable.bound is self.model:
+            return self.bind(**runnable.kwargs)
+        if isinstance(runnable, RunnableSequence):
+            steps = [self._route(step) for step in runnable.steps]
+            if all(step is None for step in steps):
+                return None
+            return RunnableSequence(*[routed or step for routed, step in zip(steps, runnable.steps)])
+        if isinstance(runnable, RunnableParallel):
+            steps = {name: self._route(step) for name, step in runnable.steps__.items()}
+            if all(step is None for step in steps.values()):
+                return None
+            return RunnableParallel({name: steps[name] or step for name, step in runnable.steps__.items()})
+        return None
+
+    def with_structured_output(self, schema, **kwargs):
+        structured = self.model.with_structured_output(schema, **kwargs)
+        # 实际模型返回“绑定参数的模型 | 解析器”（include_raw时模型在RunnableParallel中），将其中的模型替换为本模型
+        routed = self._route(structured)
+        if routed is None:
+            raise ValueError(f"{type(self.model).__name__}的结构化输出（{kwargs or '默认参数'}）返回的"
+                             f"{type(structured).__name__}中没有可替换的模型调用，无法经调度调用")
+        return routed
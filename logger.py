@@ -1,26 +1,167 @@
 #----------------------日志模块---------------------------------
+'''
+日志记录器只把日志放入队列（QueueHandler），由后台线程（QueueListener）格式化并写入stdout与文件，
+请求处理线程（事件循环）不进行磁盘与stdout写入。
+日志为JSON（settings.log_format=text时为文本），带当前请求、会话ID与节点；过长的消息截断，
+标记extra={"sample": True}的大体积日志按log_sample_rate采样；级别可按模块（文件名）设置，
+低于所有模块级别的日志在记录器处直接丢弃，不产生格式化开销
+'''
+import atexit
+import copy
+import json
 import logging
 import logging.handlers
+import queue
+import random
+import time
 from pathlib import Path
+from typing import Callable, Dict, List
 import sys
+import settings
 
 LOG_DIR = Path(__file__).parent / "logs"
 LOG_DIR.mkdir(exist_ok=True)
 
+#返回当前上下文字段（请求ID、会话ID等）的函数，由tracing注册
+_context_providers: List[Callable[[], Dict]] = []
+
+
+def add_log_context(provider: Callable[[], Dict]):
+    '''
+    注册日志上下文字段的来源，每条日志记录时调用（在记录日志的线程中，可读取contextvars）
+    :param provider: 返回{字段: 值}的函数
+    :return:
+    '''
+    _context_providers.append(provider)
+
+
+#队列已满丢弃日志时通知的函数（参数为丢弃的条数），由tracing注册为指标
+_drop_listeners: List[Callable[[int], None]] = []
+
+
+def add_drop_listener(listener: Callable[[int], None]):
+    '''
+    注册日志丢弃的通知（在记录日志的线程中调用），注册前已丢弃的条数立即通知一次
+    :param listener: 接收丢弃条数的函数
+    :return:
+    '''
+    _drop_listeners.append(listener)
+    dropped = sum(handler.dropped for handler in logger.handlers if isinstance(handler, _QueueHandler))
+    if dropped:
+        listener(dropped)
+
+
+def _level(name: str) -> int:
+    return getattr(logging, str(name).upper(), logging.INFO)
+
+
+class _RecordFilter(logging.Filter):
+    '''
+    在记录日志的线程中执行：按模块级别与采样丢弃记录，附加上下文字段
+    '''
+
+    def __init__(self, level: int, module_levels: Dict[str, int], sample_rate: float):
+        super().__init__()
+        self.level = level
+        self.module_levels = module_levels
+        self.sample_rate = sample_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.module_levels.get(record.module, self.level):
+            return False
+        if getattr(record, "sample", False) and random.random() >= self.sample_rate:
+            return False
+        for provider in _context_providers:
+            try:
+                for key, value in provider().items():
+                    setattr(record, key, value)
+            except Exception:
+                pass
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''
+    只在调用线程中合并消息参数、截断与展开异常堆栈，格式化在写入线程进行；队列满时丢弃并计数，不阻塞调用方
+    '''
+
+    def __init__(self, log_queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            message = f"{message[:self.max_chars]}...（已截断，共{len(message)}字符）"
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            for listener in _drop_listeners:
+                try:
+                    listener(1)
+                except Exception:
+                    pass
+
+
+class JsonFormatter(logging.Formatter):
+    '''
+    每条日志一行JSON，包含上下文字段（request_id、session_id、node）
+    '''
+
+    context_fields = ("request_id", "session_id", "node")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        for field in self.context_fields:
+            value = getattr(record, field, None)
+            if value:
+                entry[field] = value
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
 def setup_logger(name: str = "texttosql", log_level: str = "INFO") -> logging.Logger:
     logger = logging.getLogger(name)
-    logger.setLevel(getattr(logging, log_level.upper(), logging.INFO))
     if logger.handlers:
         return logger
-    
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
+    level = _level(log_level)
+    module_levels = {module: _level(value) for module, value in settings.log_module_levels.items()}
+    # 同名的第三方库记录器（如sqlglot）直接设置级别
+    for module, value in module_levels.items():
+        if module != name:
+            logging.getLogger(module).setLevel(value)
+    # 记录器级别取各模块级别的最小值，未被任何模块开启的级别在创建记录前即被丢弃
+    logger.setLevel(min([level, *module_levels.values()]))
+    logger.addFilter(_RecordFilter(level, module_levels, settings.log_sample_rate))
+
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        )
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(logging.INFO)
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
     info_log_file = LOG_DIR / f"{name}_info.log"
     info_handler = logging.handlers.RotatingFileHandler(
         info_log_file,
@@ -28,9 +169,7 @@ def setup_logger(name: str = "texttosql", log_level: str = "INFO") -> logging.Lo
         backupCount=5,
         encoding='utf-8'
     )
-    info_handler.setLevel(logging.INFO)
     info_handler.setFormatter(formatter)
-    logger.addHandler(info_handler)
     error_log_file = LOG_DIR / f"{name}_error.log"
     error_handler = logging.handlers.RotatingFileHandler(
         error_log_file,
@@ -40,11 +179,23 @@ def setup_logger(name: str = "texttosql", log_level: str = "INFO") -> logging.Lo
     )
     error_handler.setLevel(logging.ERROR)
     error_handler.setFormatter(formatter)
-    logger.addHandler(error_handler)
-    
+
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    logger.addHandler(_QueueHandler(log_queue, settings.log_max_message_chars))
+    listener = logging.handlers.QueueListener(log_queue, console_handler, info_handler, error_handler,
+                                              respect_handler_level=True)
+    listener.start()
+
+    def stop():
+        # 进程退出前写完队列中剩余的日志
+        try:
+            listener.stop()
+        except queue.Full:
+            pass
+    atexit.register(stop)
     return logger
 
-logger = setup_logger()
+logger = setup_logger(log_level=settings.log_level)
 
 if __name__ == "__main__":
 
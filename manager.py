@@ -1,11 +1,11 @@
-from root_urls import app
 import dotenv
 import uvicorn
 #----------------------初始化---------------------------------
 dotenv.load_dotenv()
+import settings
 
 
 if __name__ == '__main__':
-    uvicorn.run(app, host="0.0.0.0", port=8000)
-
+    # 多worker时uvicorn需要以导入字符串的形式加载应用
+    uvicorn.run("root_urls:app", host="0.0.0.0", port=8000, workers=settings.server_workers)
 
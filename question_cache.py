@@ -0,0 +1,173 @@
+#----------------------问题到SQL的缓存---------------------------------
+import math
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, Optional, Tuple
+
+PUNCTUATION_PATTERN = re.compile(r'[\s\W_]+')
+NUMBER_PATTERN = re.compile(r'\d+(?:\.\d+)?')
+#决定查询方向的词（比较、排序、极值与否定），近似匹配要求两个问题中出现的这些词完全一致
+MEANING_PATTERN = re.compile(
+    r'大于|小于|高于|低于|多于|少于|超过|不足|不到|以上|以下|以内|之前|之后|'
+    r'升序|降序|从高到低|从低到高|从大到小|从小到大|由高到低|由低到高|'
+    r'最高|最低|最大|最小|最多|最少|上涨|下跌|涨|跌|前|后|不|非|没有|未'
+)
+#不影响查询含义的措辞用字（“列出”“查询一下”“有哪些”等），近似匹配的两个问题只允许在这些字上不同
+FILLER_CHARS = frozenset('请帮给我列出查询找显示看告诉一下所有全部哪些的是呢吗吧了')
+
+
+def normalize_question(question: str) -> str:
+    '''
+    问题规范化：全角转半角、小写、去除空白与标点
+    :param question:
+    :return:
+    '''
+    question = unicodedata.normalize('NFKC', question or '').lower()
+    return PUNCTUATION_PATTERN.sub('', question)
+
+
+def char_ngrams(text: str, n: int = 2) -> Counter:
+    if len(text) < n:
+        return Counter([text]) if text else Counter()
+    return Counter(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def cosine(left: Counter, right: Counter) -> float:
+    if not left or not right:
+        return 0.0
+    dot = sum(count * right.get(gram, 0) for gram, count in left.items())
+    if not dot:
+        return 0.0
+    return dot / (math.sqrt(sum(v * v for v in left.values())) * math.sqrt(sum(v * v for v in right.values())))
+
+
+def meaning_signature(normalized: str) -> Tuple:
+    '''
+    问题中的数字与方向词（按出现顺序），近似匹配的两个问题必须相同
+    :param normalized: 规范化后的问题
+    :return:
+    '''
+    return tuple(NUMBER_PATTERN.findall(normalized)), tuple(MEANING_PATTERN.findall(normalized))
+
+
+def only_filler_differs(left: str, right: str) -> bool:
+    '''
+    两个规范化问题不同的字是否都是措辞用字；公司、交易所、行业等实体不同（“招商银行”与“平安银行”）时字面仍很相近，
+    只靠相似度会返回另一个实体的SQL
+    :param left:
+    :param right:
+    :return:
+    '''
+    left_chars, right_chars = Counter(left), Counter(right)
+    differing = (left_chars - right_chars) + (right_chars - left_chars)
+    return all(char in FILLER_CHARS for char in differing)
+
+
+class QuestionCache:
+    '''
+    问题 -> 已校验SQL 的缓存
+    键为（规范化问题, top_k, 表结构版本与裁剪结果）；默认只做精确匹配，threshold不大于1时再按字符二元组余弦相似度
+    在同一键空间内查找近似问题。字面相近的问题可能含义相反（“大于30”与“小于30”、“升序”与“降序”、“最高”与“最低”）
+    或针对不同的实体（“招商银行”与“平安银行”、“上海”与“深圳”），近似匹配要求数字与方向词完全一致，且只在措辞用字上不同；
+    会话中已有上一次的SQL或对话历史时，问题可能依赖上下文（如“按市值降序”），不读取也不写入
+    '''
+
+    def __init__(self, threshold: float = 1.1, ttl: float = 3600, max_entries: int = 2000):
+        '''
+        :param threshold: 近似匹配的相似度阈值，大于1时只做精确匹配
+        :param ttl: 条目存活时间（秒）
+        :param max_entries: 最多缓存条目数（LRU淘汰）
+        '''
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        self._stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0, "skipped_context": 0, "puts": 0, "evictions": 0}
+
+    def get(self, question: str, top_k: int, schema_key, has_context: bool = False) -> Optional[str]:
+        '''
+        查找缓存的SQL
+        :param question: 用户问题
+        :param top_k: 从问题中提取的返回条数
+        :param schema_key: 表结构版本与裁剪结果（可哈希）
+        :param has_context: 会话中是否已有上一次的SQL或对话历史，有时不使用缓存
+        :return: 命中时返回SQL，否则None
+        '''
+        if has_context:
+            with self._lock:
+                self._stats["skipped_context"] += 1
+            return None
+        normalized = normalize_question(question)
+        key = (normalized, top_k, schema_key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry["created"] <= self.ttl:
+                self._entries.move_to_end(key)
+                self._stats["exact_hits"] += 1
+                return entry["sql"]
+            if self.threshold <= 1:
+                grams = char_ngrams(normalized)
+                signature = meaning_signature(normalized)
+                best_key, best_score = None, self.threshold
+                for other_key, other in self._entries.items():
+                    if other_key[1:] != key[1:] or now - other["created"] > self.ttl or other["signature"] != signature:
+                        continue
+                    if not only_filler_differs(normalized, other_key[0]):
+                        continue
+                    score = cosine(grams, other["grams"])
+                    if score >= best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self._stats["similar_hits"] += 1
+                    return self._entries[best_key]["sql"]
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, question: str, top_k: int, schema_key, sql: str, has_context: bool = False):
+        '''
+        写入已校验并成功执行的SQL
+        :param question:
+        :param top_k:
+        :param schema_key:
+        :param sql:
+        :param has_context: 会话中是否已有上一次的SQL或对话历史，有时不写入
+        :return:
+        '''
+        if has_context:
+            return
+        normalized = normalize_question(question)
+        with self._lock:
+            self._entries[(normalized, top_k, schema_key)] = {
+                "sql": sql,
+                "grams": char_ngrams(normalized),
+                "signature": meaning_signature(normalized),
+                "created": time.monotonic(),
+            }
+            self._entries.move_to_end((normalized, top_k, schema_key))
+            self._stats["puts"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        '''
+        命中统计
+        :return:
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["exact_hits"] + stats["similar_hits"]
+        lookups = hits + stats["misses"]
+        stats["hit_rate"] = hits / lookups if lookups else 0.0
+        return stats
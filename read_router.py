@@ -0,0 +1,211 @@
+#----------------------只读副本路由---------------------------------
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import text
+from logger import logger
+from tracing import DB_ROUTES
+
+PRIMARY = "primary"
+#连接信息（Connection.info）中记录本次分配的节点名称的键
+NODE_INFO_KEY = "read_node"
+
+
+class _Node:
+    def __init__(self, name: str, engine, weight: float):
+        self.name = name
+        self.engine = engine
+        self.weight = weight
+        #未检查前视为可用
+        self.healthy = True
+        self.watermark = None
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self.routed = 0
+        self.failures = 0
+
+
+class _RouterPool:
+    '''
+    各节点连接池的状态（SqlExecutor.metrics读取）
+    '''
+
+    def __init__(self, nodes: List[_Node]):
+        self._nodes = nodes
+
+    def status(self) -> str:
+        return "; ".join(f"{node.name}: {node.engine.pool.status()}" for node in self._nodes)
+
+
+class ReadRouter:
+    '''
+    只读查询的节点路由：按权重在主库与副本间分配连接，后台定期检查各节点是否可用与数据延迟。
+    延迟以水位SQL（事实表最新的交易日）衡量，副本落后主库超过max_lag时不再分配，追上后恢复；
+    获取连接失败时标记该节点不可用并改用其他节点（主库兜底），下次检查成功后恢复。
+    对只使用connect()/dialect/pool的组件（直接执行、游标、导出、代价评估）可以替代Engine；写入仍使用主库
+    '''
+
+    def __init__(self, primary, replicas: List[Tuple[str, object, float]], primary_weight: float = 1,
+                 check_interval: float = 10, watermark_sql: str = "", max_lag: float = 0):
+        '''
+        :param primary: 主库引擎
+        :param replicas: [(名称, 引擎, 权重)]
+        :param primary_weight: 主库参与读查询的权重，0表示只在副本都不可用时使用
+        :param check_interval: 检查间隔（秒）
+        :param watermark_sql: 返回数据水位（数值）的SQL，为空时不检查延迟
+        :param max_lag: 副本水位落后主库的上限
+        '''
+        self.primary = _Node(PRIMARY, primary, primary_weight)
+        self.replicas = [_Node(name, engine, weight) for name, engine, weight in replicas]
+        self.nodes = [self.primary] + self.replicas
+        self.check_interval = check_interval
+        self.watermark_sql = watermark_sql
+        self.max_lag = max_lag
+        self.pool = _RouterPool(self.nodes)
+        self._lock = threading.Lock()
+        self._started = False
+        self._stats = {"failovers": 0, "checks": 0}
+
+    @property
+    def dialect(self):
+        return self.primary.engine.dialect
+
+    def engine(self, name: str):
+        '''
+        按名称获取节点的引擎（表结构反射固定使用一个节点）
+        :param name: primary或副本名称
+        :return:
+        '''
+        for node in self.nodes:
+            if node.name == name:
+                return node.engine
+        raise ValueError(f"没有名为{name}的数据库节点")
+
+    def start(self):
+        '''
+        启动后台检查线程（服务启动时调用）
+        :return:
+        '''
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="replica-check", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"数据库节点检查失败：{str(e)}")
+            time.sleep(self.check_interval)
+
+    def _probe(self, node: _Node):
+        try:
+            with node.engine.connect() as connection:
+                connection.execute(text("SELECT 1"))
+                watermark = connection.execute(text(self.watermark_sql)).scalar() if self.watermark_sql else None
+        except Exception as e:
+            if node.healthy:
+                logger.warning(f"数据库节点{node.name}不可用：{str(e)}")
+            node.healthy, node.error = False, str(e)
+        else:
+            if not node.healthy:
+                logger.info(f"数据库节点{node.name}已恢复")
+            node.healthy, node.error, node.watermark = True, None, watermark
+        node.checked_at = time.time()
+
+    def check(self):
+        '''
+        检查各节点是否可用并更新副本延迟
+        :return:
+        '''
+        for node in self.nodes:
+            self._probe(node)
+        primary_watermark = self.primary.watermark
+        for node in self.replicas:
+            try:
+                node.lag = float(primary_watermark) - float(node.watermark)
+            except (TypeError, ValueError):
+                # 主库不可用或没有水位时不判断延迟
+                node.lag = None
+        with self._lock:
+            self._stats["checks"] += 1
+
+    def _eligible(self, node: _Node) -> bool:
+        if not node.healthy:
+            return False
+        return node is self.primary or node.lag is None or node.lag <= self.max_lag
+
+    def _order(self) -> List[_Node]:
+        '''
+        本次连接尝试的节点顺序：可用节点按权重随机排列，主库兜底
+        :return:
+        '''
+        candidates = [node for node in self.nodes if node.weight > 0 and self._eligible(node)]
+        order = []
+        while candidates:
+            node = random.choices(candidates, weights=[candidate.weight for candidate in candidates])[0]
+            candidates.remove(node)
+            order.append(node)
+        if self.primary not in order:
+            order.append(self.primary)
+        return order
+
+    def connect(self):
+        '''
+        获取只读连接，节点连接失败时依次改用其他节点
+        :return: SQLAlchemy Connection
+        '''
+        error = None
+        for node in self._order():
+            try:
+                connection = node.engine.connect()
+            except Exception as e:
+                error = e
+                logger.warning(f"数据库节点{node.name}连接失败，改用其他节点：{str(e)}")
+                with self._lock:
+                    node.healthy, node.error = False, str(e)
+                    node.failures += 1
+                    self._stats["failovers"] += 1
+                continue
+            with self._lock:
+                node.routed += 1
+            DB_ROUTES.inc(node=node.name)
+            connection.info[NODE_INFO_KEY] = node.name
+            return connection
+        raise error
+
+    def is_fresh(self, name: Optional[str], since: float) -> bool:
+        '''
+        节点上读取的数据是否不早于since：主库总是最新；副本需在since之后检查过且当时参与分配。
+        水位按交易日计算，日内导入时副本水位不变，只能以检查时间判断
+        :param name: 节点名称（连接信息中的NODE_INFO_KEY），None表示未经路由
+        :param since: 时间戳（time.time()），如相关表最近一次数据变化的时间
+        :return:
+        '''
+        if name is None or name == PRIMARY:
+            return True
+        for node in self.replicas:
+            if node.name == name:
+                with self._lock:
+                    return node.checked_at is not None and node.checked_at >= since and self._eligible(node)
+        return False
+
+    def stats(self) -> Dict:
+        '''
+        各节点的权重、可用状态、水位与延迟、分配的连接数与连接失败次数
+        :return:
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats["nodes"] = [
+                {"name": node.name, "weight": node.weight, "healthy": node.healthy, "eligible": self._eligible(node),
+                 "watermark": node.watermark, "lag": node.lag, "routed": node.routed, "failures": node.failures,
+                 "error": node.error, "checked_at": node.checked_at}
+                for node in self.nodes
+            ]
+        stats["max_lag"] = self.max_lag
+        return stats
@@ -0,0 +1,186 @@
+#----------------------查询结果缓存---------------------------------
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+from sqlglot.errors import SqlglotError
+from sql_ast import canonicalize
+from logger import logger
+
+
+class ResultCache:
+    '''
+    以规范化SQL为键的查询结果缓存
+    LRU + TTL淘汰并限制总内存；按引用的表建立索引，某张表数据变化时只失效读取该表的条目。
+    键中不含LIMIT：缓存的结果行数足够（或已是完整结果）时，不同LIMIT的相同查询可直接截取命中
+    '''
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024):
+        '''
+        :param ttl: 条目存活时间（秒）
+        :param max_entries: 最多缓存条目数
+        :param max_bytes: 缓存结果总大小上限（按JSON长度估算）
+        '''
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._table_index: Dict[str, set] = {}
+        self._bytes = 0
+        #各表最近一次失效的时间（time.time()），clear时记录在"*"下
+        self._invalidated: Dict[str, float] = {}
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0, "expirations": 0, "invalidations": 0,
+                       "stale_puts": 0}
+
+    @staticmethod
+    def make_key(sql: str):
+        '''
+        计算缓存键，无法解析的SQL返回None（不缓存）
+        :param sql:
+        :return: (键, LIMIT值, 引用的表)
+        '''
+        try:
+            canonical_sql, limit, tables = canonicalize(sql)
+        except SqlglotError:
+            return None, None, set()
+        return hashlib.sha1(canonical_sql.encode("utf-8")).hexdigest(), limit, tables
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry["size"]
+        for table in entry["tables"]:
+            keys = self._table_index.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._table_index[table]
+
+    def get(self, sql: str) -> Optional[Dict]:
+        '''
+        查询缓存
+        :param sql:
+        :return: 命中时返回结果（按请求的LIMIT截取），否则None
+        '''
+        key, limit, _ = self.make_key(sql)
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry["created"] > self.ttl:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                entry = None
+            # 缓存行数不足以覆盖请求的LIMIT时视为未命中
+            if entry is not None and not self._covers(entry, limit):
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            result = entry["result"]
+        rows = result["rows"] if limit is None else result["rows"][:limit]
+        return dict(result, rows=rows, row_count=len(rows), cached=True)
+
+    @staticmethod
+    def _covers(entry: Dict, limit: Optional[int]) -> bool:
+        cached_limit = entry["limit"]
+        row_count = entry["result"]["row_count"]
+        if not entry["result"].get("truncated") and (cached_limit is None or row_count < cached_limit):
+            # 已是完整结果
+            return True
+        return limit is not None and limit <= row_count
+
+    def put(self, sql: str, result: Dict, started: Optional[float] = None):
+        '''
+        写入缓存
+        :param sql:
+        :param result: SqlExecutor.execute的返回值
+        :param started: 开始执行查询的时间（time.time()），执行期间引用的表已失效时不写入（结果可能是变化前的数据）
+        :return:
+        '''
+        key, limit, tables = self.make_key(sql)
+        if key is None:
+            return
+        size = len(json.dumps(result["rows"], ensure_ascii=False, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if started is not None and self._invalidated_at(tables) > started:
+                self._stats["stale_puts"] += 1
+                return
+            self._remove(key)
+            self._entries[key] = {
+                "result": result,
+                "limit": limit,
+                "tables": tables,
+                "size": size,
+                "created": time.monotonic(),
+            }
+            self._bytes += size
+            for table in tables:
+                self._table_index.setdefault(table, set()).add(key)
+            self._stats["puts"] += 1
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate_tables(self, tables: Iterable[str]) -> int:
+        '''
+        失效读取了指定表的缓存条目
+        :param tables:
+        :return: 失效的条目数
+        '''
+        tables = [table.lower() for table in tables]
+        removed = 0
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._invalidated[table] = now
+                for key in list(self._table_index.get(table, ())):
+                    self._remove(key)
+                    removed += 1
+            self._stats["invalidations"] += removed
+        if removed:
+            logger.info(f"结果缓存已失效 {removed} 条，涉及表: {tables}")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._invalidated = {"*": time.time()}
+            removed = len(self._entries)
+            self._entries.clear()
+            self._table_index.clear()
+            self._bytes = 0
+            self._stats["invalidations"] += removed
+
+    def invalidated_at(self, sql: str) -> float:
+        '''
+        SQL引用的表最近一次失效（数据变化）的时间
+        :param sql:
+        :return: 时间戳（time.time()），从未失效时为0
+        '''
+        _, _, tables = self.make_key(sql)
+        with self._lock:
+            return self._invalidated_at(tables)
+
+    def _invalidated_at(self, tables) -> float:
+        return max([self._invalidated.get(table, 0.0) for table in tables] + [self._invalidated.get("*", 0.0)])
+
+    def stats(self) -> Dict:
+        '''
+        命中/未命中/淘汰统计
+        :return:
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
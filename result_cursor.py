@@ -0,0 +1,280 @@
+#----------------------大结果集分批读取与翻页---------------------------------
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from sqlglot.errors import SqlglotError
+from logger import logger
+from read_router import NODE_INFO_KEY
+from sql_ast import ordered_on_unique_key, parse_sql
+from sql_executor import exec_driver_sql, is_interrupted, override_execution_time, restore_execution_time, to_plain
+
+
+class _Cursor:
+    '''
+    一个查询的读取位置；connection为None时表示游标未打开（已过期或被淘汰），resumable时再次读取会重新执行并跳过已读取的行
+    '''
+
+    def __init__(self, sql: str, session_id: str):
+        self.id = uuid.uuid4().hex
+        self.sql = sql
+        self.session_id = session_id
+        self.columns: List[str] = []
+        self.offset = 0
+        self.done = False
+        #结果的顺序是否确定（按唯一键排序），否则重新执行后跳过的行与已读取的行不一致，不能续读
+        self.resumable = False
+        #读取位置小于pinned时（第一页仍在推送）不因打开数量超过上限被淘汰，仍按ttl关闭
+        self.pinned = 0
+        self.connection = None
+        #连接上的max_execution_time是否已改为游标的设置（关闭时恢复）
+        self.overridden = False
+        #最近一次执行查询的只读节点
+        self.node = None
+        self.result = None
+        self.touched = time.monotonic()
+        # 同一游标的读取串行进行（读取在执行线程中进行）
+        self.lock = threading.Lock()
+
+
+class ResultCursors:
+    '''
+    服务端游标：查询结果按批读取（MySQL使用SSCursor，结果集不在服务进程中缓存），内存占用与结果大小无关；
+    结果未读完时游标保持打开，翻页从上次的位置继续读取，无需重新生成SQL。
+    打开的游标各占用一个数据库连接，数量超过max_open（第一页仍在推送的除外）或空闲超过ttl时关闭；SQL按唯一键排序时，之后翻页重新执行查询并跳过已读取的行，
+    否则（重新执行的结果顺序不确定，配置只读副本时还可能在另一个节点执行）游标失效，需重新查询
+    '''
+
+    def __init__(self, engine, batch_size: int = 200, max_open: int = 4, ttl: float = 30, max_cursors: int = 1000,
+                 executor=None, unique_keys=None, max_execution_time: Optional[int] = None):
+        '''
+        :param engine: SQLAlchemy引擎
+        :param batch_size: 每批读取的行数
+        :param max_open: 同时保持打开的游标数上限（第一页仍在推送的游标不计入淘汰）
+        :param ttl: 游标空闲多久后关闭（秒），MySQL需小于net_write_timeout
+        :param max_cursors: 保留的游标（读取位置）数上限，超出时删除最早的
+        :param executor: SqlExecutor，打开游标时登记连接，超时或取消时中断查询
+        :param unique_keys: 表名 -> 主键与唯一键字段集合的函数，用于判断关闭的游标能否续读；为None时不续读
+        :param max_execution_time: 游标查询的MySQL最长执行时间（毫秒，0为不限制），None时沿用连接的会话设置；
+                                   翻页在查询开始后读取，连接级的max_execution_time会中断之后的翻页
+        '''
+        self._engine = engine
+        self.max_execution_time = max_execution_time
+        self._executor = executor
+        self._unique_keys = unique_keys
+        self.batch_size = batch_size
+        self.max_open = max_open
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self._lock = threading.Lock()
+        self._cursors: "OrderedDict[str, _Cursor]" = OrderedDict()
+        self._stats = {"opened": 0, "reopened": 0, "lost": 0, "expired": 0, "evicted": 0, "batches": 0, "rows": 0}
+        threading.Thread(target=self._sweep, name="cursor-sweep", daemon=True).start()
+
+    def _execute(self, cursor: _Cursor, token=None):
+        connection = self._engine.connect().execution_options(stream_results=True)
+        if self._executor is not None:
+            self._executor.register(token, connection)
+        try:
+            cursor.overridden = override_execution_time(connection, self.max_execution_time)
+            result = exec_driver_sql(connection, cursor.sql)
+            skip = cursor.offset
+            while skip > 0:
+                rows = result.fetchmany(min(skip, self.batch_size))
+                if not rows:
+                    break
+                skip -= len(rows)
+        except Exception:
+            self._unregister(token)
+            connection.close()
+            raise
+        cursor.connection, cursor.result = connection, result
+        cursor.node = connection.info.get(NODE_INFO_KEY)
+        cursor.columns = list(result.keys())
+
+    def _resumable(self, sql: str) -> bool:
+        if self._unique_keys is None:
+            return False
+        try:
+            return ordered_on_unique_key(parse_sql(sql), self._unique_keys)
+        except SqlglotError:
+            return False
+
+    def _unregister(self, token):
+        if self._executor is not None:
+            self._executor.unregister(token)
+
+    def _release(self, cursor: _Cursor):
+        '''
+        关闭游标占用的连接：未读完时直接废弃连接，避免关闭游标时读取剩余的全部结果
+        :param cursor:
+        :return:
+        '''
+        if cursor.connection is None:
+            return
+        try:
+            if cursor.done:
+                if cursor.overridden:
+                    # 连接归还连接池前恢复原来的设置
+                    restore_execution_time(cursor.connection)
+                cursor.connection.close()
+            else:
+                cursor.connection.invalidate()
+        except Exception as e:
+            logger.warning(f"关闭游标失败：{str(e)}")
+            cursor.connection.invalidate()
+        cursor.connection = cursor.result = None
+
+    def _limit_open(self, keep: _Cursor):
+        with self._lock:
+            opened = [cursor for cursor in self._cursors.values()
+                      if cursor.connection is not None and cursor is not keep and cursor.offset >= cursor.pinned]
+        # 按最近使用顺序关闭最早的游标（正在读取的跳过）
+        for cursor in opened[:max(0, len(opened) + 1 - self.max_open)]:
+            if cursor.lock.acquire(blocking=False):
+                try:
+                    self._release(cursor)
+                    with self._lock:
+                        self._stats["evicted"] += 1
+                finally:
+                    cursor.lock.release()
+
+    def _sweep(self):
+        while True:
+            time.sleep(max(1.0, self.ttl / 2))
+            deadline = time.monotonic() - self.ttl
+            with self._lock:
+                idle = [cursor for cursor in self._cursors.values()
+                        if cursor.connection is not None and cursor.touched < deadline]
+            for cursor in idle:
+                if cursor.lock.acquire(blocking=False):
+                    try:
+                        self._release(cursor)
+                        with self._lock:
+                            self._stats["expired"] += 1
+                    finally:
+                        cursor.lock.release()
+
+    def open(self, sql: str, session_id: str, pin: int = 0, token=None) -> Dict:
+        '''
+        执行查询并读取第一批（同步，需在执行线程中调用，可由SqlExecutor.acall中断）
+        :param sql:
+        :param session_id: 只有同一会话可以翻页
+        :param pin: 第一页的行数，读取到该位置之前游标不被淘汰（调用方接着推送第一页的其余部分）
+        :param token: SqlExecutor.acall传入的CancelToken
+        :return: 同fetch
+        '''
+        cursor = _Cursor(sql, session_id)
+        cursor.resumable = self._resumable(sql)
+        cursor.pinned = pin
+        with cursor.lock:
+            self._execute(cursor, token)
+        with self._lock:
+            self._stats["opened"] += 1
+            self._cursors[cursor.id] = cursor
+            dropped = [self._cursors.popitem(last=False)[1] for _ in range(len(self._cursors) - self.max_cursors)]
+        for oldest in dropped:
+            with oldest.lock:
+                self._release(oldest)
+        self._limit_open(cursor)
+        try:
+            page = self.fetch(cursor.id, session_id)
+        finally:
+            self._unregister(token)
+        if token is not None and token.cancelled:
+            # 调用方已超时或取消，游标不会再被读取，立即释放连接
+            self.close(cursor.id)
+            raise TimeoutError("查询已取消")
+        return page
+
+    def fetch(self, cursor_id: str, session_id: str, size: int = 0) -> Dict:
+        '''
+        从上次的位置继续读取一批（同步，需在执行线程中调用）
+        :param cursor_id:
+        :param session_id:
+        :param size: 读取的行数，默认batch_size
+        :return: {"cursor", "columns", "rows", "offset": 本批第一行的位置, "has_more": 是否可能还有数据, "node": 执行查询的只读节点}
+        '''
+        size = size or self.batch_size
+        with self._lock:
+            cursor = self._cursors.get(cursor_id)
+            if cursor is None or cursor.session_id != session_id:
+                raise KeyError("游标不存在或已过期，请重新查询")
+            self._cursors.move_to_end(cursor_id)
+        with cursor.lock:
+            rows = []
+            if not cursor.done:
+                if cursor.connection is None:
+                    if not cursor.resumable:
+                        with self._lock:
+                            self._cursors.pop(cursor_id, None)
+                            self._stats["lost"] += 1
+                        raise KeyError("游标不存在或已过期，请重新查询")
+                    self._execute(cursor)
+                    with self._lock:
+                        self._stats["reopened"] += 1
+                try:
+                    rows = self._read(cursor, size)
+                except Exception as e:
+                    self._release(cursor)
+                    if not (cursor.resumable and is_interrupted(e)):
+                        raise
+                    # 查询在服务端超时或被中断：结果顺序确定的游标重新执行并跳过已读取的行
+                    logger.warning(f"游标读取被中断，重新执行查询：{str(e)}")
+                    self._execute(cursor)
+                    with self._lock:
+                        self._stats["reopened"] += 1
+                    try:
+                        rows = self._read(cursor, size)
+                    except Exception:
+                        self._release(cursor)
+                        raise
+                cursor.touched = time.monotonic()
+                if len(rows) < size:
+                    cursor.done = True
+                    self._release(cursor)
+            offset = cursor.offset
+            cursor.offset += len(rows)
+        if cursor.connection is not None:
+            self._limit_open(cursor)
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["rows"] += len(rows)
+        return {"cursor": cursor.id, "columns": cursor.columns, "rows": rows, "offset": offset,
+                "has_more": not cursor.done, "node": cursor.node}
+
+    @staticmethod
+    def _read(cursor: _Cursor, size: int) -> List[list]:
+        return [[to_plain(value) for value in row] for row in cursor.result.fetchmany(size)]
+
+    def sql(self, cursor_id: str, session_id: str) -> str:
+        '''
+        游标对应的SQL（导出结果时使用）
+        :param cursor_id:
+        :param session_id:
+        :return:
+        '''
+        with self._lock:
+            cursor = self._cursors.get(cursor_id)
+            if cursor is None or cursor.session_id != session_id:
+                raise KeyError("游标不存在或已过期，请重新查询")
+            return cursor.sql
+
+    def close(self, cursor_id: str):
+        with self._lock:
+            cursor = self._cursors.pop(cursor_id, None)
+        if cursor is not None:
+            with cursor.lock:
+                self._release(cursor)
+
+    def stats(self) -> Dict:
+        '''
+        游标数、打开的游标数与累计的读取批次、行数
+        :return:
+        '''
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cursors"] = len(self._cursors)
+            stats["open"] = sum(1 for cursor in self._cursors.values() if cursor.connection is not None)
+        return stats
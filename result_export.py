@@ -0,0 +1,206 @@
+#----------------------查询结果导出---------------------------------
+import csv
+import io
+from typing import Dict, List, Optional, Tuple
+from logger import logger
+from sql_executor import exec_driver_sql, override_execution_time, restore_execution_time
+
+#导出格式 -> (Content-Type, 文件扩展名)
+EXPORT_FORMATS: Dict[str, Tuple[str, str]] = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+class _Sink:
+    '''
+    收集编码器写出的字节，每批编码后取走发送
+    '''
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(data if isinstance(data, bytes) else bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class _CsvEncoder:
+    def __init__(self, columns: List[str]):
+        self._columns = columns
+        self._header = True
+
+    def encode(self, rows) -> bytes:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if self._header:
+            writer.writerow(self._columns)
+            self._header = False
+        writer.writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def finish(self) -> bytes:
+        return self.encode([]) if self._header else b''
+
+
+class _ArrowEncoder:
+    '''
+    每批按列转为Arrow数组组成RecordBatch，列缓冲区直接交给IPC/Parquet写入器，不再经过逐行的字典或JSON
+    列类型由第一批数据推断：全为NULL的列按字符串处理，DECIMAL列放宽精度以容纳后续批次
+    '''
+
+    def __init__(self, columns: List[str], fmt: str):
+        import pyarrow
+        self._pa = pyarrow
+        self._columns = columns
+        self._fmt = fmt
+        self._schema = None
+        self._as_text: set = set()
+        self._sink = _Sink()
+        self._writer = None
+
+    def _infer(self, arrays):
+        pa = self._pa
+        fields = []
+        for index, (name, array) in enumerate(zip(self._columns, arrays)):
+            data_type = array.type
+            if pa.types.is_null(data_type):
+                data_type = pa.string()
+                self._as_text.add(index)
+            elif pa.types.is_decimal(data_type):
+                data_type = pa.decimal128(38, data_type.scale)
+            fields.append(pa.field(name, data_type))
+        self._schema = pa.schema(fields)
+        if self._fmt == 'parquet':
+            import pyarrow.parquet
+            self._writer = pyarrow.parquet.ParquetWriter(self._sink, self._schema)
+        else:
+            self._writer = pa.ipc.new_stream(self._sink, self._schema)
+
+    def encode(self, rows) -> bytes:
+        pa = self._pa
+        values = list(zip(*rows)) if rows else [() for _ in self._columns]
+        if self._schema is None:
+            arrays = [pa.array(column, from_pandas=False) for column in values]
+            self._infer(arrays)
+        for index in self._as_text:
+            values[index] = [None if value is None else str(value) for value in values[index]]
+        arrays = [pa.array(column, type=field.type) for column, field in zip(values, self._schema)]
+        if rows:
+            self._writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self._schema))
+        return self._sink.take()
+
+    def finish(self) -> bytes:
+        if self._writer is None:
+            self.encode([])
+        self._writer.close()
+        return self._sink.take()
+
+
+class ResultExport:
+    '''
+    一次导出：通过服务端游标按批读取查询结果（MySQL为SSCursor），每批编码后即发送，
+    内存占用只与batch_size有关；csv使用标准库，arrow（IPC流）与parquet需要pyarrow
+    open/next_chunk/close为同步调用，需在执行线程中运行
+    '''
+
+    def __init__(self, engine, sql: str, fmt: str = 'csv', batch_size: int = 10000,
+                 max_execution_time: Optional[int] = None):
+        '''
+        :param engine: SQLAlchemy引擎
+        :param sql: 已校验的SQL
+        :param fmt: EXPORT_FORMATS之一
+        :param batch_size: 每批读取并编码的行数
+        :param max_execution_time: 导出查询的MySQL最长执行时间（毫秒，0为不限制），None时沿用连接的会话设置；
+                                   服务端游标读取期间查询一直在执行，连接级的max_execution_time会中断较大的导出
+        '''
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"不支持的导出格式：{fmt}")
+        if fmt != 'csv':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ValueError(f"导出{fmt}格式需要安装pyarrow")
+        self.sql = sql
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.max_execution_time = max_execution_time
+        self.rows = 0
+        self.done = False
+        self._engine = engine
+        self._connection = None
+        self._overridden = False
+        self._result = None
+        self._encoder = None
+
+    @property
+    def media_type(self) -> str:
+        return EXPORT_FORMATS[self.fmt][0]
+
+    @property
+    def filename(self) -> str:
+        return f"result.{EXPORT_FORMATS[self.fmt][1]}"
+
+    def open(self):
+        '''
+        执行查询，SQL错误在开始发送前抛出
+        :return:
+        '''
+        self._connection = self._engine.connect().execution_options(stream_results=True)
+        try:
+            self._overridden = override_execution_time(self._connection, self.max_execution_time)
+            self._result = exec_driver_sql(self._connection, self.sql)
+            columns = list(self._result.keys())
+            self._encoder = _CsvEncoder(columns) if self.fmt == 'csv' else _ArrowEncoder(columns, self.fmt)
+        except Exception:
+            self.close()
+            raise
+
+    def next_chunk(self) -> Optional[bytes]:
+        '''
+        读取并编码下一批，读完后返回文件尾（parquet的footer、arrow的结束标记）
+        :return: 编码后的字节，导出结束时返回None
+        '''
+        if self.done:
+            return None
+        rows = self._result.fetchmany(self.batch_size)
+        if rows:
+            self.rows += len(rows)
+            return self._encoder.encode(rows)
+        self.done = True
+        data = self._encoder.finish()
+        self.close()
+        return data
+
+    def close(self):
+        '''
+        释放连接：未读完时（客户端中途断开）直接废弃连接，避免读取剩余的结果
+        :return:
+        '''
+        connection, self._connection, self._result = self._connection, None, None
+        if connection is None:
+            return
+        try:
+            if self.done:
+                if self._overridden:
+                    # 连接归还连接池前恢复原来的设置
+                    restore_execution_time(connection)
+                connection.close()
+            else:
+                connection.invalidate()
+        except Exception as e:
+            logger.warning(f"关闭导出连接失败：{str(e)}")
+            connection.invalidate()
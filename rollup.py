@@ -0,0 +1,535 @@
+#----------------------汇总表物化与查询改写---------------------------------
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from sqlalchemy import inspect, text
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from logger import logger
+from sql_ast import DIALECT, parse_sql
+from tracing import ROLLUP_ROUTES
+
+#汇总表与水位表的表名前缀（不向LLM提供，也不参与表结构变化检测）
+ROLLUP_PREFIX = "rollup_"
+WATERMARK_TABLE = "rollup_watermark"
+#支持从汇总表重新聚合的聚合函数
+_MEASURE_FUNCS = {exp.Sum: "sum", exp.Min: "min", exp.Max: "max", exp.Count: "count", exp.Avg: "avg"}
+
+
+class _Miss(Exception):
+    '''
+    查询不能由汇总表回答，参数为原因
+    '''
+
+
+def _tables(tree: exp.Select) -> Tuple[Dict[str, str], List[str]]:
+    '''
+    FROM与JOIN中的表
+    :param tree:
+    :return: ({别名或表名: 表名}, 表名列表)
+    '''
+    sources = [tree.find(exp.From).this] + [join.this for join in tree.args.get("joins") or []]
+    aliases, names = {}, []
+    for source in sources:
+        if not isinstance(source, exp.Table) or source.args.get("db"):
+            raise _Miss("tables")
+        name = source.name.lower()
+        aliases[source.alias_or_name.lower()] = name
+        aliases.setdefault(name, name)
+        names.append(name)
+    return aliases, names
+
+
+def _canonical(node: exp.Expression, aliases: Dict[str, str], columns: Dict[str, Set[str]]) -> Optional[str]:
+    '''
+    表达式的规范形式：字段统一写为“表名.字段名”（小写），无法确定字段所属的表时返回None
+    :param node:
+    :param aliases: {别名或表名: 表名}
+    :param columns: {表名: 字段名集合}，用于确定未写表名的字段
+    :return:
+    '''
+    node = node.copy()
+    for column in list(node.find_all(exp.Column)):
+        name = column.name.lower()
+        if column.table:
+            table = aliases.get(column.table.lower())
+        else:
+            candidates = {table for table in aliases.values() if name in columns.get(table, ())}
+            table = candidates.pop() if len(candidates) == 1 else None
+        if table is None:
+            return None
+        column.set("this", exp.to_identifier(name))
+        column.set("table", exp.to_identifier(table))
+    return node.sql(dialect=DIALECT)
+
+
+def _join_keys(tree: exp.Select, aliases: Dict[str, str], columns: Dict[str, Set[str]]) -> Set[FrozenSet[str]]:
+    '''
+    JOIN的等值关联条件，只接受INNER JOIN ... ON a = b [AND ...]
+    :return: {frozenset(两侧字段的规范形式)}
+    '''
+    keys = set()
+    for join in tree.args.get("joins") or []:
+        if join.side or (join.kind and join.kind.upper() != "INNER") or join.args.get("using"):
+            raise _Miss("join")
+        condition = join.args.get("on")
+        if condition is None:
+            raise _Miss("join")
+        for predicate in condition.flatten() if isinstance(condition, exp.And) else [condition]:
+            if not isinstance(predicate, exp.EQ) or not all(isinstance(side, exp.Column) for side in (predicate.this, predicate.expression)):
+                raise _Miss("join")
+            pair = frozenset((_canonical(predicate.this, aliases, columns), _canonical(predicate.expression, aliases, columns)))
+            if None in pair:
+                raise _Miss("join")
+            keys.add(pair)
+    return keys
+
+
+class RollupDef:
+    '''
+    汇总表定义：一条按维度分组的聚合查询。SELECT中的非聚合表达式为维度，聚合表达式为度量，
+    均需指定别名（即汇总表的字段名）；度量只使用NOT NULL字段，COUNT(*)为行数。
+    grain为day/month时按date_id水位增量刷新（bucket为对应的维度字段），为None时每次变化全量重算
+    '''
+
+    def __init__(self, name: str, sql: str, grain: Optional[str] = None, bucket: Optional[str] = None):
+        '''
+        :param name: 汇总表名，需以ROLLUP_PREFIX开头
+        :param sql: 定义查询（MySQL语法，字段需写明表别名，JOIN只沿外键从事实表关联到维度表）
+        :param grain: day=按交易日，month=按月，None=快照表
+        :param bucket: 时间粒度对应的维度字段
+        '''
+        if not name.startswith(ROLLUP_PREFIX):
+            raise ValueError(f"汇总表名需以{ROLLUP_PREFIX}开头：{name}")
+        self.name = name
+        self.sql = sql
+        self.grain = grain
+        self.bucket = bucket
+        self.digest = hashlib.sha1(sql.encode("utf-8")).hexdigest()
+        self.tree = parse_sql(sql)
+        self.aliases, names = _tables(self.tree)
+        self.fact = names[0]
+        self.fact_alias = self.tree.find(exp.From).this.alias_or_name
+        self.tables = set(names)
+        self.columns: List[str] = []
+        #{维度表达式的规范形式: 字段名}
+        self.dimensions: Dict[str, str] = {}
+        #{(聚合函数, 参数的规范形式): 字段名}
+        self.measures: Dict[Tuple[str, str], str] = {}
+        self.joins: Set[FrozenSet[str]] = set()
+        self.row_count: Optional[str] = None
+
+    def bind(self, columns: Dict[str, Set[str]]):
+        '''
+        按数据库中的字段解析定义（字段规范化需要知道每张表的字段）
+        :param columns: {表名: 字段名集合}
+        :return:
+        '''
+        self.columns, self.dimensions, self.measures = [], {}, {}
+        for projection in self.tree.expressions:
+            if not isinstance(projection, exp.Alias):
+                raise ValueError(f"汇总表{self.name}的字段需指定别名：{projection.sql(dialect=DIALECT)}")
+            name, node = projection.alias, projection.this
+            self.columns.append(name)
+            kind = _MEASURE_FUNCS.get(type(node))
+            if kind is None:
+                self.dimensions[_canonical(node, self.aliases, columns)] = name
+            elif kind == "count" and isinstance(node.this, exp.Star):
+                self.row_count = name
+            else:
+                self.measures[(kind, _canonical(node.this, self.aliases, columns))] = name
+        self.joins = _join_keys(self.tree, self.aliases, columns)
+        if self.row_count is None:
+            raise ValueError(f"汇总表{self.name}需包含COUNT(*)")
+
+    def select(self, since: Optional[int] = None, empty: bool = False) -> exp.Select:
+        '''
+        定义查询，可限定事实表date_id >= since（增量刷新）或不返回数据（建表）
+        :return:
+        '''
+        tree = self.tree.copy()
+        if empty:
+            tree = tree.where("1 = 0")
+        elif since is not None:
+            tree = tree.where(f"{self.fact_alias}.date_id >= {int(since)}")
+        return tree
+
+
+class RollupRouter:
+    '''
+    查询改写：生成的SQL可以被某个汇总表证明等价回答时，改写为对汇总表的查询
+    条件：单条SELECT（无子查询、窗口函数），表与JOIN条件与汇总表定义一致（外键关联不改变事实表行数），
+    WHERE/GROUP BY/非聚合输出只使用维度，聚合只有SUM/MIN/MAX/AVG/COUNT(*)且参数为度量（MIN/MAX也可以是维度）；
+    改写后输出字段名保持不变
+    '''
+
+    def __init__(self, rollups: List[RollupDef], max_memo: int = 1000):
+        self.rollups = rollups
+        self.columns: Dict[str, Set[str]] = {}
+        #可以使用的（已刷新到最新水位的）汇总表
+        self.fresh: Set[str] = set()
+        self._memo: "OrderedDict[Tuple, Tuple[Optional[str], str]]" = OrderedDict()
+        self._max_memo = max_memo
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "hits": 0, "hit_by_rollup": {}, "miss_by_reason": {}}
+
+    def _measure(self, node: exp.AggFunc, rollup: RollupDef, aliases, columns) -> exp.Expression:
+        kind = _MEASURE_FUNCS.get(type(node))
+        if kind is None:
+            raise _Miss("aggregate")
+        argument = node.this
+        if isinstance(argument, exp.Distinct):
+            raise _Miss("distinct")
+        if kind == "count":
+            if not isinstance(argument, exp.Star) and (
+                    ("sum", _canonical(argument, aliases, columns)) not in rollup.measures):
+                raise _Miss("aggregate")
+            return exp.func("COALESCE", exp.func("SUM", exp.column(rollup.row_count, "r")), exp.Literal.number(0))
+        key = _canonical(argument, aliases, columns)
+        if kind in ("min", "max") and key in rollup.dimensions:
+            return exp.func(kind.upper(), exp.column(rollup.dimensions[key], "r"))
+        if kind == "avg":
+            if ("sum", key) not in rollup.measures:
+                raise _Miss("aggregate")
+            total = exp.func("SUM", exp.column(rollup.measures[("sum", key)], "r"))
+            return exp.paren(exp.Div(this=exp.Mul(this=total, expression=exp.Literal.number("1.0")),
+                                     expression=exp.func("SUM", exp.column(rollup.row_count, "r"))))
+        if (kind, key) not in rollup.measures:
+            raise _Miss("aggregate")
+        return exp.func(kind.upper(), exp.column(rollup.measures[(kind, key)], "r"))
+
+    def _rewrite(self, tree: exp.Select, rollup: RollupDef) -> str:
+        aliases, names = _tables(tree)
+        if rollup.fact not in names or not set(names) <= rollup.tables or len(set(names)) != len(names):
+            raise _Miss("tables")
+        expected = {key for key in rollup.joins if all(column.split(".")[0] in names for column in key)}
+        if _join_keys(tree, aliases, self.columns) != expected:
+            raise _Miss("join")
+        output_aliases = {projection.alias.lower() for projection in tree.expressions if isinstance(projection, exp.Alias)}
+
+        def replace(node: exp.Expression, allow_aggregate: bool, alias_mode: Optional[str] = None) -> exp.Expression:
+            '''
+            :param alias_mode: 是否可以引用输出别名，order=别名优先（ORDER BY），group=FROM中的字段优先（GROUP BY/HAVING）
+            '''
+            def visit(child):
+                if isinstance(child, exp.AggFunc):
+                    if not allow_aggregate:
+                        raise _Miss("where")
+                    return self._measure(child, rollup, aliases, self.columns)
+                is_alias = (alias_mode and isinstance(child, exp.Column) and not child.table
+                            and child.name.lower() in output_aliases)
+                if is_alias and alias_mode == "order":
+                    return child
+                if isinstance(child, (exp.Column, exp.Func)):
+                    key = _canonical(child, aliases, self.columns)
+                    if key in rollup.dimensions:
+                        return exp.column(rollup.dimensions[key], "r")
+                    if is_alias and key is None:
+                        return child
+                if isinstance(child, (exp.Column, exp.Star)):
+                    raise _Miss("dimension")
+                return child
+            return node.transform(visit)
+
+        projections = []
+        for projection in tree.expressions:
+            if isinstance(projection, exp.Alias):
+                name, node = projection.alias, projection.this
+            else:
+                name, node = (projection.name if isinstance(projection, exp.Column) else projection.sql(dialect=DIALECT)), projection
+            projections.append(exp.alias_(replace(node, True), name, quoted=not name.isidentifier()))
+        rewritten = tree.copy()
+        rewritten.set("expressions", projections)
+        rewritten.set("joins", None)
+        rewritten.from_(exp.to_table(rollup.name).as_("r"), copy=False)
+        if tree.args.get("where"):
+            rewritten.set("where", exp.Where(this=replace(tree.args["where"].this, False)))
+        if tree.args.get("group"):
+            rewritten.set("group", exp.Group(expressions=[replace(node, False, "group") for node in tree.args["group"].expressions]))
+        if tree.args.get("having"):
+            rewritten.set("having", exp.Having(this=replace(tree.args["having"].this, True, "group")))
+        if tree.args.get("order"):
+            rewritten.set("order", exp.Order(expressions=[replace(node, True, "order") for node in tree.args["order"].expressions]))
+        return rewritten.sql(dialect=DIALECT)
+
+    def _decide(self, sql: str) -> Tuple[Optional[str], str]:
+        try:
+            tree = parse_sql(sql)
+        except SqlglotError:
+            return None, "parse"
+        if not isinstance(tree, exp.Select) or any(
+                node is not tree for node in tree.find_all(exp.Select, exp.Subquery, exp.SetOperation, exp.Window, exp.CTE)):
+            return None, "shape"
+        if not tree.args.get("group") and not tree.args.get("distinct") and not tree.find(exp.AggFunc):
+            return None, "detail"
+        reason = "tables"
+        for rollup in self.rollups:
+            if rollup.name not in self.fresh:
+                continue
+            try:
+                return self._rewrite(tree, rollup), rollup.name
+            except _Miss as e:
+                # 记录第一个表匹配的汇总表的未命中原因
+                if reason == "tables":
+                    reason = e.args[0]
+        return None, reason
+
+    def route(self, sql: str, count: bool = True) -> Optional[Tuple[str, str]]:
+        '''
+        改写为汇总表查询
+        :param sql: 已校验的SQL
+        :param count: 是否计入命中率（执行前的代价评估不计入）
+        :return: (改写后的SQL, 汇总表名)，不能由汇总表回答时返回None
+        '''
+        key = (sql, frozenset(self.fresh))
+        with self._lock:
+            decision = self._memo.get(key)
+            if decision is not None:
+                self._memo.move_to_end(key)
+        if decision is None:
+            decision = self._decide(sql)
+            with self._lock:
+                self._memo[key] = decision
+                while len(self._memo) > self._max_memo:
+                    self._memo.popitem(last=False)
+        rewritten, result = decision
+        if count:
+            with self._lock:
+                self._stats["queries"] += 1
+                if rewritten is not None:
+                    self._stats["hits"] += 1
+                    self._stats["hit_by_rollup"][result] = self._stats["hit_by_rollup"].get(result, 0) + 1
+                else:
+                    self._stats["miss_by_reason"][result] = self._stats["miss_by_reason"].get(result, 0) + 1
+            ROLLUP_ROUTES.inc(result=result if rewritten is not None else "miss")
+        return (rewritten, result) if rewritten is not None else None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = {key: dict(value) if isinstance(value, dict) else value for key, value in self._stats.items()}
+        stats["hit_rate"] = stats["hits"] / stats["queries"] if stats["queries"] else 0.0
+        return stats
+
+
+class RollupManager:
+    '''
+    汇总表刷新：水位表记录每个汇总表已汇总到的事实表date_id（快照表为最大id）与定义摘要；
+    后台线程每interval秒检查一次，事实表有新数据时按时间粒度重算水位所在的日/月及之后的数据，
+    定义变化或数据被删除（水位回退）时全量重建。事实表按date_id追加写入，历史数据更正后需全量刷新
+    '''
+
+    def __init__(self, engine, rollups: List[RollupDef], router: RollupRouter, interval: float = 300,
+                 enabled: bool = True):
+        '''
+        :param engine: SQLAlchemy引擎（需要建表与写入权限）
+        :param rollups:
+        :param router: 刷新完成后更新可用的汇总表
+        :param interval: 检查间隔（秒）
+        :param enabled: 为False时不建表、不刷新，也不改写查询
+        '''
+        self._engine = engine
+        self.rollups = rollups
+        self.router = router
+        self.interval = interval
+        self.enabled = enabled
+        #_lock只保护_state、_dirty与_marks（持有时间很短，mark_stale在请求的执行线程中调用）；
+        #_refresh_lock使刷新串行执行，重建期间持有
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        #数据变化后需要重算的快照表（快照表没有date_id水位）
+        self._dirty: Set[str] = set()
+        #每个汇总表被mark_stale的次数：刷新期间又有数据变化时，刷新结果不能标记为可用
+        self._marks: Counter = Counter()
+        self._state: Dict[str, Dict] = {
+            rollup.name: {"watermark": None, "fresh": False, "refreshed_at": None, "seconds": None,
+                          "mode": None, "error": None, "refreshes": 0}
+            for rollup in rollups
+        }
+        self._started = False
+
+    def start(self):
+        '''
+        启动后台刷新线程（服务启动预热时调用，导入模块时不连接数据库）
+        :return:
+        '''
+        with self._lock:
+            if self._started or not self.enabled:
+                return
+            self._started = True
+        threading.Thread(target=self._loop, name="rollup-refresh", daemon=True).start()
+
+    def _loop(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"汇总表刷新失败：{str(e)}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def mark_stale(self, tables: List[str]):
+        '''
+        事实表变化时（表结构缓存检测到UPDATE_TIME变化）停止使用相关的汇总表，并立即刷新
+        :param tables: 发生变化的表
+        :return:
+        '''
+        changed = {table.lower() for table in tables}
+        stale = [rollup.name for rollup in self.rollups if rollup.tables & changed]
+        if not stale or not self.enabled:
+            return
+        with self._lock:
+            for name in stale:
+                self._state[name]["fresh"] = False
+                self._marks[name] += 1
+            self._dirty.update(rollup.name for rollup in self.rollups if rollup.name in stale and rollup.grain is None)
+            self.router.fresh = {name for name, state in self._state.items() if state["fresh"]}
+        self._wakeup.set()
+
+    def _source_watermark(self, connection, rollup: RollupDef) -> Optional[int]:
+        key = "date_id" if rollup.grain else "id"
+        return connection.execute(text(f"SELECT MAX({key}) FROM {rollup.fact}")).scalar()
+
+    def _insert(self, connection, rollup: RollupDef, since: Optional[int] = None):
+        select = rollup.select(since).sql(dialect=self._engine.dialect.name)
+        connection.execute(text(f"INSERT INTO {rollup.name} ({', '.join(rollup.columns)}) {select}"))
+
+    def _rebuild(self, connection, rollup: RollupDef):
+        connection.execute(text(f"DROP TABLE IF EXISTS {rollup.name}"))
+        connection.execute(text(f"CREATE TABLE {rollup.name} AS {rollup.select(empty=True).sql(dialect=self._engine.dialect.name)}"))
+        if rollup.bucket:
+            connection.execute(text(f"CREATE INDEX idx_{rollup.name}_{rollup.bucket} ON {rollup.name} ({rollup.bucket})"))
+        self._insert(connection, rollup)
+
+    def _restate(self, connection, rollup: RollupDef, watermark: int):
+        '''
+        重算水位所在的日/月及之后的数据（最后一天/一月可能只导入了一部分）
+        :return:
+        '''
+        if rollup.grain == "day":
+            connection.execute(text(f"DELETE FROM {rollup.name} WHERE {rollup.bucket} >= :start"), {"start": watermark})
+            self._insert(connection, rollup, watermark)
+            return
+        trade_date = connection.execute(text("SELECT trade_date FROM trade_date WHERE date_id = :id"), {"id": watermark}).scalar()
+        month = str(trade_date)[:7]
+        start = connection.execute(text("SELECT MIN(date_id) FROM trade_date WHERE trade_date >= :day"),
+                                   {"day": f"{month}-01"}).scalar()
+        connection.execute(text(f"DELETE FROM {rollup.name} WHERE {rollup.bucket} >= :month"), {"month": month})
+        self._insert(connection, rollup, start)
+
+    def _refresh_one(self, connection, rollup: RollupDef, full: bool, recompute: bool) -> Tuple[Optional[int], Optional[str]]:
+        '''
+        :param full: 删除并重建汇总表
+        :param recompute: 水位没有变化时也重算（快照表的数据变化）
+        :return: (刷新后的水位, 刷新方式：full/incremental/None=无变化)
+        '''
+        row = connection.execute(text(f"SELECT digest, watermark FROM {WATERMARK_TABLE} WHERE name = :name"),
+                                 {"name": rollup.name}).first()
+        exists = inspect(connection).has_table(rollup.name)
+        source = self._source_watermark(connection, rollup)
+        if full or row is None or row[0] != rollup.digest or not exists or (source or 0) < (row[1] or 0):
+            mode = "full"
+            self._rebuild(connection, rollup)
+        elif source == row[1] and not recompute:
+            return row[1], None
+        elif rollup.grain and row[1]:
+            mode = "incremental"
+            self._restate(connection, rollup, row[1])
+        else:
+            mode = "full"
+            connection.execute(text(f"DELETE FROM {rollup.name}"))
+            self._insert(connection, rollup)
+        connection.execute(text(f"DELETE FROM {WATERMARK_TABLE} WHERE name = :name"), {"name": rollup.name})
+        connection.execute(text(f"INSERT INTO {WATERMARK_TABLE} (name, digest, watermark, refreshed_at) "
+                                f"VALUES (:name, :digest, :watermark, :refreshed_at)"),
+                           {"name": rollup.name, "digest": rollup.digest, "watermark": source,
+                            "refreshed_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+        return source, mode
+
+    def _published(self, connection, rollup: RollupDef) -> Tuple[Optional[int], bool]:
+        '''
+        其他worker正在刷新时，按水位表判断汇总表是否可用：定义摘要一致且水位等于事实表当前的水位
+        :return: (水位表中的水位, 是否可用)
+        '''
+        row = connection.execute(text(f"SELECT digest, watermark FROM {WATERMARK_TABLE} WHERE name = :name"),
+                                 {"name": rollup.name}).first()
+        if row is None or row[0] != rollup.digest or not inspect(connection).has_table(rollup.name):
+            return None, False
+        return row[1], row[1] == self._source_watermark(connection, rollup)
+
+    def _refresh_rollup(self, rollup: RollupDef, columns: Dict, full: bool):
+        state = self._state[rollup.name]
+        with self._lock:
+            marks = self._marks[rollup.name]
+            recompute = rollup.name in self._dirty
+            self._dirty.discard(rollup.name)
+        start = time.perf_counter()
+        mode = None
+        try:
+            rollup.bind(columns)
+            # 多个worker共用数据库时由一个worker刷新（MySQL命名锁），其余worker读取水位判断是否可用
+            with self._engine.begin() as connection:
+                if self._engine.dialect.name == "mysql" and not connection.execute(
+                        text("SELECT GET_LOCK(:name, 0)"), {"name": rollup.name}).scalar():
+                    watermark, fresh = self._published(connection, rollup)
+                    if recompute:
+                        # 快照表的数据变化不改变水位，无法判断持有锁的worker是否已重算，下一次刷新时再确认
+                        fresh = False
+                        with self._lock:
+                            self._dirty.add(rollup.name)
+                else:
+                    try:
+                        watermark, mode = self._refresh_one(connection, rollup, full, recompute)
+                        fresh = True
+                    finally:
+                        if self._engine.dialect.name == "mysql":
+                            connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": rollup.name})
+        except Exception as e:
+            with self._lock:
+                if recompute:
+                    self._dirty.add(rollup.name)
+                state.update(fresh=False, error=str(e))
+            logger.error(f"汇总表{rollup.name}刷新失败：{str(e)}")
+            return
+        with self._lock:
+            # 刷新期间又检测到数据变化时保持不可用，等待下一次刷新（mark_stale已唤醒刷新线程）
+            state.update(watermark=watermark, fresh=fresh and self._marks[rollup.name] == marks, error=None)
+            if mode:
+                state.update(mode=mode, seconds=time.perf_counter() - start,
+                             refreshed_at=time.strftime("%Y-%m-%d %H:%M:%S"), refreshes=state["refreshes"] + 1)
+        if mode:
+            logger.info(f"汇总表{rollup.name}已刷新（{mode}），水位 {watermark}，耗时 {state['seconds']:.2f}s")
+
+    def refresh(self, name: Optional[str] = None, full: bool = False) -> Dict:
+        '''
+        刷新汇总表（后台线程定时调用，或数据导入后由管理接口调用）
+        :param name: 只刷新指定的汇总表，其他汇总表的待重算标记保留到下一次刷新
+        :param full: 全量重建
+        :return: 刷新后的状态
+        '''
+        if not self.enabled:
+            return self.stats()
+        with self._refresh_lock:
+            with self._engine.begin() as connection:
+                connection.execute(text(f"CREATE TABLE IF NOT EXISTS {WATERMARK_TABLE} (name VARCHAR(64) PRIMARY KEY, "
+                                        f"digest VARCHAR(40) NOT NULL, watermark BIGINT, refreshed_at VARCHAR(32))"))
+            columns = {table: {column["name"].lower() for column in inspect(self._engine).get_columns(table)}
+                       for table in set().union(*(rollup.tables for rollup in self.rollups))}
+            self.router.columns = columns
+            for rollup in self.rollups:
+                if not name or rollup.name == name:
+                    self._refresh_rollup(rollup, columns, full)
+            with self._lock:
+                self.router.fresh = {name for name, state in self._state.items() if state["fresh"]}
+        return self.stats()
+
+    def stats(self) -> Dict:
+        '''
+        每个汇总表的水位、是否可用、最近一次刷新方式与耗时，以及查询改写命中率
+        :return:
+        '''
+        with self._lock:
+            rollups = {name: dict(state) for name, state in self._state.items()}
+        return {"enabled": self.enabled, "rollups": rollups, "router": self.router.stats()}
@@ -1,4 +1,40 @@
+import time
+#应用导入耗时（各模块导入与组件创建），在/readyz与/metrics中报告
+_import_start=time.perf_counter()
+import asyncio
+import contextlib
 import initapp
+import settings
+from startup import startup_state
 from urls.sys_urls import sys_router
-app=initapp.fastapi_init()
+from urls.admin_urls import admin_router
+from urls.metrics_urls import metrics_router
+from urls.health_urls import health_router
+from texttosql import warm_up,start_services
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    '''
+    服务启动后在后台预热（不阻塞端口监听），退出时取消未完成的预热
+    :param app:
+    :return:
+    '''
+    task=None
+    if settings.startup_warmup:
+        task=asyncio.create_task(startup_state.run(warm_up,settings.warmup_retry_interval))
+    else:
+        start_services()
+        startup_state.status='ready'
+    yield
+    if task is not None:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+app=initapp.fastapi_init(lifespan=lifespan)
 app.include_router(sys_router,prefix='/default',tags=['自然语义查询'])
+app.include_router(metrics_router,tags=['监控'])
+app.include_router(health_router,tags=['监控'])
+app.include_router(admin_router,prefix='/admin',tags=['系统管理'])
+startup_state.record_import(time.perf_counter()-_import_start)
@@ -0,0 +1,327 @@
+#----------------------表结构缓存---------------------------------
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from langchain_community.utilities import SQLDatabase
+from sqlalchemy import MetaData, inspect, text
+from logger import logger
+from tracing import record_db
+
+
+class CachedSQLDatabase(SQLDatabase):
+    '''
+    带表结构缓存的SQLDatabase
+    get_table_info()按表缓存渲染后的建表语句与样例数据，只有information_schema
+    反映出DDL变化（字段校验和、建表时间）或手动刷新时才重新反射；
+    数据变化（UPDATE_TIME）只清除对应表的缓存并通知监听者
+    '''
+
+    def __init__(self, engine, *, check_interval: float = 60, hidden_table_prefix: str = "",
+                 lazy: bool = False, read_engine=None, **kwargs):
+        '''
+        :param check_interval: 两次检查表结构指纹的最小间隔（秒）
+        :param hidden_table_prefix: 以此为前缀的表（服务自己维护的汇总表）不提供给LLM，也不参与变化检测
+        :param lazy: 为True时创建对象不连接数据库，首次使用表结构（或调用load()）时再反射
+        :param read_engine: agent执行查询使用的引擎（只读副本路由），默认与反射使用同一个engine
+        '''
+        self._hidden_table_prefix = hidden_table_prefix
+        self._read_engine = read_engine
+        # 反射前dialect与run()已可使用
+        self._engine = engine
+        self._schema = kwargs.get("schema")
+        self._max_string_length = kwargs.get("max_string_length", 300)
+        self._init_kwargs = kwargs
+        self._check_interval = check_interval
+        self._schema_lock = threading.RLock()
+        self._table_info_cache: Dict[tuple, str] = {}
+        self._table_columns: Optional[Dict[str, Set[str]]] = None
+        self._unique_keys: Dict[str, List[Set[str]]] = {}
+        self._schema_listeners: List[Callable] = []
+        self._fingerprint: Dict[str, str] = {}
+        self._data_fingerprint: Dict[str, str] = {}
+        self._checked_at = 0.0
+        self.loaded = False
+        self._reflecting = False
+        self.schema_version = 1
+        #最近一次刷新时发生变化的表
+        self.changed_tables: List[str] = []
+        self._metrics = {
+            "warm_count": 0,
+            "warm_seconds_total": 0.0,
+            "cold_count": 0,
+            "cold_seconds_total": 0.0,
+            "last_cold_seconds": 0.0,
+            "check_count": 0,
+            "check_seconds_total": 0.0,
+            "refresh_count": 0,
+            "data_change_count": 0,
+            "load_seconds": 0.0,
+        }
+        if not lazy:
+            self.load()
+
+    def load(self):
+        '''
+        连接数据库读取表名并计算表结构指纹（只执行一次）
+        :return:
+        '''
+        if self.loaded:
+            return
+        with self._schema_lock:
+            if self.loaded:
+                return
+            start = time.perf_counter()
+            # SQLDatabase.__init__会调用get_usable_table_names
+            self._reflecting = True
+            try:
+                super().__init__(self._engine, **self._init_kwargs)
+            finally:
+                self._reflecting = False
+            self._fingerprint, self._data_fingerprint = self._schema_fingerprint()
+            self._checked_at = time.monotonic()
+            self.loaded = True
+            self._metrics["load_seconds"] = time.perf_counter() - start
+        logger.info(f"表结构已加载，表数量: {len(self._fingerprint)}，耗时: {self._metrics['load_seconds'] * 1000:.1f}ms")
+
+    #------------------------------变化检测------------------------------------------------
+    def _schema_fingerprint(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        '''
+        计算每张表的结构指纹（字段定义、建表时间）与数据指纹（MySQL的UPDATE_TIME）
+        :return: ({表名: 结构指纹}, {表名: 数据指纹})
+        '''
+        digests, data = {}, {}
+        if self.dialect == "mysql":
+            with self._engine.connect() as connection:
+                for table_name, create_time, update_time in connection.execute(text(
+                        "SELECT TABLE_NAME, CREATE_TIME, UPDATE_TIME FROM information_schema.TABLES "
+                        "WHERE TABLE_SCHEMA = DATABASE() ORDER BY TABLE_NAME")):
+                    digests.setdefault(table_name, hashlib.sha1()).update(repr(create_time).encode("utf-8"))
+                    data[table_name] = repr(update_time)
+                # 每行第一列为表名
+                for row in connection.execute(text(
+                        "SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_KEY, COLUMN_COMMENT "
+                        "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() "
+                        "ORDER BY TABLE_NAME, ORDINAL_POSITION")):
+                    digests.setdefault(row[0], hashlib.sha1()).update(repr(tuple(row)).encode("utf-8"))
+        elif self.dialect == "sqlite":
+            with self._engine.connect() as connection:
+                for row in connection.execute(text("SELECT tbl_name, type, name, sql FROM sqlite_master ORDER BY tbl_name, type, name")):
+                    digests.setdefault(row[0], hashlib.sha1()).update(repr(tuple(row)).encode("utf-8"))
+        else:
+            inspector = inspect(self._engine)
+            for table_name in inspector.get_table_names(schema=self._schema):
+                digest = digests.setdefault(table_name, hashlib.sha1())
+                for column in inspector.get_columns(table_name, schema=self._schema):
+                    digest.update(f"{column['name']}:{column['type']}".encode("utf-8"))
+        structure = {table_name: digest.hexdigest() for table_name, digest in digests.items() if not self._hidden(table_name)}
+        return structure, {table_name: value for table_name, value in data.items() if table_name in structure}
+
+    def _hidden(self, table_name: str) -> bool:
+        return bool(self._hidden_table_prefix) and table_name.lower().startswith(self._hidden_table_prefix)
+
+    def get_usable_table_names(self):
+        if not self._reflecting:
+            self.load()
+        return [table_name for table_name in super().get_usable_table_names() if not self._hidden(table_name)]
+
+    def _reset_reflection(self):
+        self._inspector = inspect(self._engine)
+        self._all_tables = set(self._inspector.get_table_names(schema=self._schema))
+        usable_tables = self.get_usable_table_names()
+        self._usable_tables = set(usable_tables) if usable_tables else self._all_tables
+        self._metadata = MetaData()
+        self._table_info_cache.clear()
+        self._table_columns = None
+        self._unique_keys = {}
+
+    def check_schema(self, force: bool = False) -> bool:
+        '''
+        检查表结构与数据是否发生变化并通知监听者（changed_tables为发生变化的表）。
+        结构变化（字段、建表时间）时清空全部缓存、重新反射并升级schema_version；
+        只有数据变化（导入数据后UPDATE_TIME变化）时只清除这些表的缓存（样例数据），不升级版本
+        :param force: 忽略检查间隔，且无论指纹是否变化都刷新表结构
+        :return: 是否有变化
+        '''
+        self.load()
+        if not force and time.monotonic() - self._checked_at < self._check_interval:
+            return False
+        with self._schema_lock:
+            if not force and time.monotonic() - self._checked_at < self._check_interval:
+                return False
+            start = time.perf_counter()
+            try:
+                fingerprint, data_fingerprint = self._schema_fingerprint()
+            except Exception as e:
+                # 检查失败时继续使用旧缓存
+                logger.error(f"表结构指纹检查失败：{str(e)}")
+                fingerprint, data_fingerprint = self._fingerprint, self._data_fingerprint
+            self._checked_at = time.monotonic()
+            self._metrics["check_count"] += 1
+            self._metrics["check_seconds_total"] += time.perf_counter() - start
+            structure_changed = sorted(
+                table_name for table_name in set(fingerprint) | set(self._fingerprint)
+                if fingerprint.get(table_name) != self._fingerprint.get(table_name)
+            )
+            data_changed = sorted(
+                table_name for table_name in set(data_fingerprint) & set(self._data_fingerprint)
+                if data_fingerprint[table_name] != self._data_fingerprint[table_name]
+            )
+            if not force and not structure_changed and not data_changed:
+                return False
+            self.changed_tables = sorted(set(structure_changed) | set(data_changed))
+            self._fingerprint, self._data_fingerprint = fingerprint, data_fingerprint
+            if force or structure_changed:
+                self._reset_reflection()
+                self.schema_version += 1
+                self._metrics["refresh_count"] += 1
+                message = f"表结构缓存已刷新，版本: {self.schema_version}"
+            else:
+                for key in [key for key in self._table_info_cache if key[0] in data_changed]:
+                    del self._table_info_cache[key]
+                self._metrics["data_change_count"] += 1
+                message = f"表数据已变化: {', '.join(data_changed)}"
+        logger.info(message)
+        for listener in list(self._schema_listeners):
+            try:
+                listener(self)
+            except Exception as e:
+                logger.error(f"表结构变化回调执行失败：{str(e)}")
+        return True
+
+    def refresh_schema(self) -> bool:
+        '''
+        强制刷新表结构缓存（管理接口调用）
+        :return:
+        '''
+        return self.check_schema(force=True)
+
+    def add_schema_listener(self, listener: Callable):
+        '''
+        注册表结构变化回调，参数为当前数据库对象
+        :param listener:
+        :return:
+        '''
+        self._schema_listeners.append(listener)
+
+    #------------------------------查询执行------------------------------------------------
+    def run(self, command, *args, **kwargs):
+        '''
+        agent工具执行的查询，记录数据库耗时
+        '''
+        start = time.perf_counter()
+        try:
+            return super().run(command, *args, **kwargs)
+        finally:
+            record_db("agent_query", time.perf_counter() - start)
+
+    def _execute(self, command, fetch="all", *, parameters=None, execution_options=None):
+        '''
+        配置了read_engine时查询在其连接上执行（反射与样例数据仍使用固定的节点）
+        '''
+        if self._read_engine is None or self._read_engine is self._engine:
+            return super()._execute(command, fetch, parameters=parameters, execution_options=execution_options)
+        if fetch not in ("all", "one"):
+            raise ValueError("Fetch parameter must be either 'one' or 'all'")
+        if isinstance(command, str):
+            command = text(command)
+        with self._read_engine.connect() as connection, connection.begin():
+            cursor = connection.execute(command, parameters or {}, execution_options=execution_options or {})
+            if not cursor.returns_rows:
+                return []
+            if fetch == "all":
+                return [row._asdict() for row in cursor.fetchall()]
+            row = cursor.fetchone()
+            return [] if row is None else [row._asdict()]
+
+    #------------------------------缓存读取------------------------------------------------
+    def get_table_info(
+        self, table_names: Optional[List[str]] = None, get_col_comments: bool = False
+    ) -> str:
+        self.check_schema()
+        start = time.perf_counter()
+        all_table_names = self.get_usable_table_names()
+        if table_names is not None:
+            missing_tables = set(table_names).difference(all_table_names)
+            if missing_tables:
+                raise ValueError(f"table_names {missing_tables} not found in database")
+            all_table_names = table_names
+        tables = []
+        missing = []
+        for table_name in all_table_names:
+            cached = self._table_info_cache.get((table_name, get_col_comments))
+            if cached is None:
+                missing.append(table_name)
+            else:
+                tables.append(cached)
+        if not missing:
+            self._metrics["warm_count"] += 1
+            self._metrics["warm_seconds_total"] += time.perf_counter() - start
+        else:
+            with self._schema_lock:
+                for table_name in missing:
+                    table_info = super().get_table_info([table_name], get_col_comments=get_col_comments)
+                    self._table_info_cache[(table_name, get_col_comments)] = table_info
+                    tables.append(table_info)
+            cost = time.perf_counter() - start
+            self._metrics["cold_count"] += 1
+            self._metrics["cold_seconds_total"] += cost
+            self._metrics["last_cold_seconds"] = cost
+        tables.sort()
+        return "\n\n".join(table_info for table_info in tables if table_info)
+
+    def table_columns(self) -> Dict[str, Set[str]]:
+        '''
+        每张表的字段名集合（小写），用于SQL校验
+        :return:
+        '''
+        self.check_schema()
+        table_columns = self._table_columns
+        if table_columns is None:
+            with self._schema_lock:
+                inspector = inspect(self._engine)
+                table_columns = {
+                    table_name.lower(): {column['name'].lower() for column in inspector.get_columns(table_name, schema=self._schema)}
+                    for table_name in self.get_usable_table_names()
+                }
+                self._table_columns = table_columns
+        return table_columns
+
+    def unique_keys(self, table_name: str) -> List[Set[str]]:
+        '''
+        表的主键与唯一键（字段名小写），用于判断查询结果的顺序是否确定
+        :param table_name:
+        :return: [字段集合]
+        '''
+        self.check_schema()
+        keys = self._unique_keys.get(table_name)
+        if keys is None:
+            with self._schema_lock:
+                inspector = inspect(self._engine)
+                try:
+                    constraints = [inspector.get_pk_constraint(table_name, schema=self._schema)]
+                    constraints += inspector.get_unique_constraints(table_name, schema=self._schema)
+                    indexes = [index for index in inspector.get_indexes(table_name, schema=self._schema) if index.get("unique")]
+                    nullable = {column['name'].lower() for column in inspector.get_columns(table_name, schema=self._schema)
+                                if column.get('nullable')}
+                except Exception:
+                    # 表不存在等情况视为没有唯一键
+                    constraints, indexes, nullable = [], [], set()
+                keys = [{column.lower() for column in constraint.get("constrained_columns") or constraint.get("column_names") or []}
+                        for constraint in constraints + indexes]
+                # 唯一键允许多个NULL，含可空字段的不能确定顺序（主键不为NULL）
+                keys = [key for index, key in enumerate(keys) if key and (index == 0 or not key & nullable)]
+                self._unique_keys[table_name] = keys
+        return keys
+
+    def schema_metrics(self) -> Dict:
+        '''
+        表结构缓存指标：冷（反射）/热（命中）次数与耗时
+        :return:
+        '''
+        metrics = dict(self._metrics)
+        metrics["loaded"] = self.loaded
+        metrics["schema_version"] = self.schema_version
+        metrics["cached_tables"] = len(self._table_info_cache)
+        metrics["check_interval"] = self._check_interval
+        return metrics
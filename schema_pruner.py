@@ -0,0 +1,176 @@
+#----------------------表结构裁剪---------------------------------
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Set
+from sqlalchemy import inspect
+from logger import logger
+
+WORD_PATTERN = re.compile(r'[a-z0-9]+|[\u4e00-\u9fff]+')
+
+
+def tokenize(text: str) -> List[str]:
+    '''
+    分词：英文/数字按单词切分（下划线视为分隔符），中文按字二元组切分
+    :param text:
+    :return:
+    '''
+    tokens = []
+    for word in WORD_PATTERN.findall((text or '').lower()):
+        if word.isascii():
+            tokens.append(word)
+        elif len(word) == 1:
+            tokens.append(word)
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class SchemaPruner:
+    '''
+    基于BM25的表相关性索引
+    索引内容为表名、表注释、字段名、字段注释以及外键关联表，针对用户问题选出最相关的
+    top_n张表并补全外键闭包；置信度不足时返回None，由调用方回退到完整表结构
+    '''
+
+    def __init__(self, db, top_n: int = 3, min_score: float = 1.0, relative_cutoff: float = 0.5,
+                 k1: float = 1.5, b: float = 0.75):
+        '''
+        :param db: CachedSQLDatabase，表结构版本变化时重建索引
+        :param top_n: 最多选取的表数量（不含外键闭包）
+        :param min_score: 最高得分低于该值视为置信度不足
+        :param relative_cutoff: 得分低于最高分该比例的表不入选
+        '''
+        self._db = db
+        self.top_n = top_n
+        self.min_score = min_score
+        self.relative_cutoff = relative_cutoff
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._version = None
+        self._docs: Dict[str, Counter] = {}
+        self._doc_len: Dict[str, int] = {}
+        self._avg_len = 0.0
+        self._idf: Dict[str, float] = {}
+        self._references: Dict[str, Set[str]] = {}
+        self.column_comments: Dict[str, str] = {}
+
+    #------------------------------构建索引------------------------------------------------
+    def _build(self):
+        inspector = inspect(self._db._engine)
+        table_names = sorted(self._db.get_usable_table_names())
+        comments = {}
+        columns = {}
+        references = {}
+        for table_name in table_names:
+            try:
+                comments[table_name] = inspector.get_table_comment(table_name).get('text') or ''
+            except NotImplementedError:
+                comments[table_name] = ''
+            columns[table_name] = inspector.get_columns(table_name)
+            references[table_name] = {
+                fk['referred_table'] for fk in inspector.get_foreign_keys(table_name)
+                if fk.get('referred_table') in table_names and fk['referred_table'] != table_name
+            }
+        docs = {}
+        column_comments = {}
+        for table_name in table_names:
+            tokens = tokenize(table_name) + tokenize(comments[table_name])
+            for column in columns[table_name]:
+                tokens += tokenize(column['name']) + tokenize(column.get('comment') or '')
+                if column.get('comment'):
+                    column_comments.setdefault(column['name'], column['comment'])
+            for neighbour in references[table_name]:
+                tokens += tokenize(neighbour) + tokenize(comments[neighbour])
+            docs[table_name] = Counter(tokens)
+        doc_len = {name: sum(doc.values()) for name, doc in docs.items()}
+        document_frequency = Counter()
+        for doc in docs.values():
+            document_frequency.update(doc.keys())
+        total = len(docs)
+        self._docs = docs
+        self._doc_len = doc_len
+        self._avg_len = (sum(doc_len.values()) / total) if total else 0.0
+        self._idf = {
+            token: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for token, freq in document_frequency.items()
+        }
+        self._references = references
+        self.column_comments = column_comments
+        logger.info(f"表结构相关性索引已构建，表数量: {total}")
+
+    def _ensure_index(self):
+        version = getattr(self._db, 'schema_version', None)
+        if self._version == version and self._docs:
+            return
+        with self._lock:
+            if self._version == version and self._docs:
+                return
+            self._build()
+            self._version = version
+
+    def column_labels(self) -> Dict[str, str]:
+        '''
+        字段名到字段注释（中文列名）的映射
+        :return:
+        '''
+        self._ensure_index()
+        return self.column_comments
+
+    #------------------------------检索------------------------------------------------
+    def score(self, query: str) -> Dict[str, float]:
+        '''
+        计算问题与每张表的BM25得分
+        :param query:
+        :return:
+        '''
+        self._ensure_index()
+        query_tokens = set(tokenize(query))
+        scores = {}
+        for table_name, doc in self._docs.items():
+            length_norm = 1 - self.b + self.b * self._doc_len[table_name] / (self._avg_len or 1)
+            score = 0.0
+            for token in query_tokens:
+                freq = doc.get(token)
+                if freq:
+                    score += self._idf[token] * freq * (self.k1 + 1) / (freq + self.k1 * length_norm)
+            scores[table_name] = score
+        return scores
+
+    def fk_closure(self, tables) -> Set[str]:
+        '''
+        补全外键引用的维表（递归）
+        :param tables:
+        :return:
+        '''
+        closure = set(tables)
+        pending = list(tables)
+        while pending:
+            for referred in self._references.get(pending.pop(), ()):
+                if referred not in closure:
+                    closure.add(referred)
+                    pending.append(referred)
+        return closure
+
+    def select_tables(self, query: str, last_sql: Optional[str] = None) -> Optional[List[str]]:
+        '''
+        选出与问题相关的表
+        :param query: 用户问题
+        :param last_sql: 上一次执行的SQL，问题置信度足够时其中引用的表一并入选（追问场景）
+        :return: 表名列表，置信度不足时返回None表示使用完整表结构（问题可能与上一次无关，不只给出上一次的表）
+        '''
+        scores = self.score(query)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if not ranked or ranked[0][1] < self.min_score:
+            logger.debug("表结构裁剪置信度不足，使用完整表结构")
+            return None
+        cutoff = ranked[0][1] * self.relative_cutoff
+        selected = {name for name, score in ranked[:self.top_n] if score >= cutoff}
+        if last_sql:
+            sql_words = set(re.findall(r'[a-z0-9_]+', last_sql.lower()))
+            selected |= {name for name in self._docs if name.lower() in sql_words}
+        tables = sorted(self.fk_closure(selected))
+        logger.debug("表结构裁剪结果: %s", tables)
+        return tables
@@ -0,0 +1,133 @@
+#----------------------会话记忆---------------------------------
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+#每个会话对象及每条记录的固定开销估算（字节）
+SESSION_OVERHEAD = 256
+RECORD_OVERHEAD = 64
+
+
+class _Session:
+    __slots__ = ('turns', 'last_sql', 'bytes', 'accessed')
+
+    def __init__(self, max_turns: int):
+        self.turns = deque(maxlen=max_turns)
+        self.last_sql = None
+        self.bytes = SESSION_OVERHEAD
+        self.accessed = time.monotonic()
+
+
+def _record_size(record: Tuple) -> int:
+    return RECORD_OVERHEAD + sum(len(field.encode('utf-8')) for field in record if field)
+
+
+class SessionMemory:
+    '''
+    会话记忆：每轮对话只保存提示词需要的字段（问题、SQL、时间），每个会话为固定长度的环形缓冲
+    空闲超过ttl的会话被淘汰；会话数或总大小超过上限时淘汰最久未访问的会话
+    '''
+
+    def __init__(self, max_turns: int = 10, ttl: float = 3600, max_sessions: int = 10000,
+                 max_bytes: int = 32 * 1024 * 1024):
+        '''
+        :param max_turns: 每个会话保留的对话轮数
+        :param ttl: 会话空闲多久后淘汰（秒）
+        :param max_sessions: 最多保留的会话数
+        :param max_bytes: 所有会话的总大小上限（按字段UTF-8长度估算）
+        '''
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"expired": 0, "evicted": 0, "appends": 0}
+
+    def _drop(self, session_id: str):
+        session = self._sessions.pop(session_id)
+        self._bytes -= session.bytes
+
+    def _evict(self, now: float):
+        # 会话按访问时间排列，最早访问的在前
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.accessed <= self.ttl:
+                break
+            self._drop(session_id)
+            self._stats["expired"] += 1
+        while self._sessions and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._sessions)))
+            self._stats["evicted"] += 1
+
+    def load(self, session_id: str) -> Tuple[List[Dict], Optional[str]]:
+        '''
+        读取会话的对话历史与上一次执行的SQL
+        :param session_id:
+        :return: (对话历史, 上一次执行的SQL)
+        '''
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                return [], None
+            session.accessed = now
+            self._sessions.move_to_end(session_id)
+            history = [
+                {"user_query": user_query, "generated_sql": sql, "timestamp": timestamp}
+                for user_query, sql, timestamp in session.turns
+            ]
+            return history, session.last_sql
+
+    def append(self, session_id: str, user_query: str, sql: Optional[str], timestamp: str):
+        '''
+        追加一轮对话，超过max_turns时覆盖最早的一轮
+        :param session_id:
+        :param user_query:
+        :param sql:
+        :param timestamp:
+        :return:
+        '''
+        record = (user_query or '', sql, timestamp)
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_turns)
+                self._bytes += session.bytes
+            before = session.bytes
+            session.turns.append(record)
+            session.last_sql = sql
+            session.bytes = SESSION_OVERHEAD + sum(_record_size(turn) for turn in session.turns) + \
+                len((sql or '').encode('utf-8'))
+            self._bytes += session.bytes - before
+            session.accessed = now
+            self._sessions.move_to_end(session_id)
+            self._stats["appends"] += 1
+            self._evict(now)
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._lock:
+            if session_id is None:
+                self._sessions.clear()
+                self._bytes = 0
+            elif session_id in self._sessions:
+                self._drop(session_id)
+
+    def stats(self) -> Dict:
+        '''
+        会话数、总大小与每个会话占用的字节数
+        :return:
+        '''
+        with self._lock:
+            self._evict(time.monotonic())
+            sizes = [session.bytes for session in self._sessions.values()]
+            stats = dict(self._stats)
+            stats["sessions"] = len(sizes)
+            stats["bytes"] = self._bytes
+        stats["bytes_per_session_avg"] = sum(sizes) / len(sizes) if sizes else 0
+        stats["bytes_per_session_max"] = max(sizes) if sizes else 0
+        return stats
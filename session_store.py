@@ -0,0 +1,272 @@
+#----------------------会话记忆持久化存储---------------------------------
+import atexit
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import Column, Float, Index, Integer, MetaData, String, Table, Text, create_engine, event, func, select
+from sqlalchemy.exc import IntegrityError, OperationalError
+from logger import logger
+from session_memory import SessionMemory
+
+metadata = MetaData()
+session_turn = Table(
+    "session_turn", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), nullable=False),
+    Column("user_query", Text),
+    Column("generated_sql", Text),
+    Column("timestamp", String(32)),
+    Column("created", Float, nullable=False),
+    Index("idx_session_turn", "session_id", "id"),
+    Index("idx_session_turn_created", "created"),
+)
+#会话锁的租约：持有者与到期时间，持有的worker异常退出时到期后自动释放
+session_lock = Table(
+    "session_lock", metadata,
+    Column("session_id", String(64), primary_key=True),
+    Column("owner", String(32), nullable=False),
+    Column("expires", Float, nullable=False),
+)
+
+#同时建表时因表已存在而失败后的最多尝试次数（每个worker创建的表可能不同）
+CREATE_ATTEMPTS = 5
+
+
+def _enable_wal(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL模式下读写互不阻塞，多个worker进程可同时读取
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
+    cursor.close()
+
+
+class SqlSessionStore:
+    '''
+    基于数据库表的会话记忆，多个worker进程/实例共享：SQLite（WAL，单机多进程）或MySQL（集群）
+    每次append在一个事务中写入并提交，不在进程内缓冲（调用方在释放会话锁前完成），下一轮请求无论由哪个worker处理都能读到；
+    同一会话的请求跨worker串行：try_lock/unlock在存储上加会话锁（session_lock表中带到期时间的租约行）；
+    写入时裁剪该会话超出max_turns的旧记录，后台线程定期删除空闲超过ttl的会话；表在第一次使用时创建，导入时不连接数据库
+    '''
+
+    def __init__(self, uri: str, max_turns: int = 10, ttl: float = 3600, prune_interval: float = 60,
+                 lock_ttl: float = 300):
+        '''
+        :param uri: SQLAlchemy连接串
+        :param max_turns: 每个会话保留的对话轮数
+        :param ttl: 会话空闲多久后删除（秒）
+        :param prune_interval: 删除过期会话的间隔（秒）
+        :param lock_ttl: 会话锁的租约时间（秒），持有者异常退出时到期释放
+        '''
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.prune_interval = prune_interval
+        self.lock_ttl = lock_ttl
+        if uri.startswith("sqlite"):
+            self._engine = create_engine(uri)
+            event.listen(self._engine, "connect", _enable_wal)
+        else:
+            self._engine = create_engine(uri, pool_pre_ping=True, pool_recycle=3600)
+        self._lock = threading.Lock()
+        self._created = False
+        self._stopped = threading.Event()
+        self._stats = {"appends": 0, "write_seconds_total": 0.0, "write_errors": 0, "trimmed": 0, "expired": 0,
+                       "lock_waits": 0}
+        self._thread = threading.Thread(target=self._run, name="session-prune", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _engine_ready(self):
+        '''
+        第一次使用时建表（不在导入时连接数据库）
+        :return:
+        '''
+        if not self._created:
+            with self._lock:
+                if not self._created:
+                    for attempt in range(CREATE_ATTEMPTS):
+                        try:
+                            metadata.create_all(self._engine)
+                            break
+                        except OperationalError as e:
+                            # 其他worker（或实例）同时建表时检查与建表之间表或索引已存在，重新检查
+                            if "already exists" not in str(e).lower() or attempt == CREATE_ATTEMPTS - 1:
+                                raise
+                    self._created = True
+        return self._engine
+
+    def try_lock(self, session_id: str):
+        '''
+        尝试获取会话锁，不等待（同步，需在执行线程中调用）
+        锁为session_lock表中的租约行，插入成功即持有；持有期间不占用连接，同一请求的load/append与其他会话共用连接池
+        :param session_id:
+        :return: 获取成功时返回锁的凭据（传给unlock），会话已被其他请求锁定时返回None
+        '''
+        engine = self._engine_ready()
+        owner = uuid.uuid4().hex
+        now = time.time()
+        # 删除已到期的租约（持有的worker已退出）与插入分别提交，主键冲突说明其他请求持有未到期的租约
+        with engine.begin() as connection:
+            connection.execute(session_lock.delete().where(session_lock.c.session_id == session_id,
+                                                           session_lock.c.expires < now))
+        try:
+            with engine.begin() as connection:
+                connection.execute(session_lock.insert(), {
+                    "session_id": session_id, "owner": owner, "expires": now + self.lock_ttl,
+                })
+            return owner
+        except IntegrityError:
+            pass
+        with self._lock:
+            self._stats["lock_waits"] += 1
+        return None
+
+    def unlock(self, session_id: str, token):
+        '''
+        释放try_lock获取的会话锁（同步，需在执行线程中调用）
+        :param session_id:
+        :param token: try_lock返回的凭据，租约已到期并被其他请求取得时不影响新的持有者
+        :return:
+        '''
+        with self._engine_ready().begin() as connection:
+            connection.execute(session_lock.delete().where(session_lock.c.session_id == session_id,
+                                                           session_lock.c.owner == token))
+
+    def load(self, session_id: str) -> Tuple[List[Dict], Optional[str]]:
+        '''
+        读取会话的对话历史与上一次执行的SQL（同步，需在执行线程中调用）
+        :param session_id:
+        :return: (对话历史, 上一次执行的SQL)
+        '''
+        with self._engine_ready().connect() as connection:
+            rows = connection.execute(
+                select(session_turn.c.user_query, session_turn.c.generated_sql, session_turn.c.timestamp)
+                .where(session_turn.c.session_id == session_id)
+                .order_by(session_turn.c.id.desc())
+                .limit(self.max_turns)
+            ).fetchall()
+        history = [{"user_query": row[0], "generated_sql": row[1], "timestamp": row[2]} for row in reversed(rows)]
+        return history, history[-1]["generated_sql"] if history else None
+
+    def append(self, session_id: str, user_query: str, sql: Optional[str], timestamp: str):
+        '''
+        追加一轮对话并裁剪该会话超出max_turns的记录（同步，需在执行线程中调用）
+        :param session_id:
+        :param user_query:
+        :param sql:
+        :param timestamp:
+        :return:
+        '''
+        start = time.perf_counter()
+        try:
+            with self._engine_ready().begin() as connection:
+                connection.execute(session_turn.insert(), {
+                    "session_id": session_id,
+                    "user_query": user_query or "",
+                    "generated_sql": sql,
+                    "timestamp": timestamp,
+                    "created": time.time(),
+                })
+                boundary = connection.execute(
+                    select(session_turn.c.id)
+                    .where(session_turn.c.session_id == session_id)
+                    .order_by(session_turn.c.id.desc())
+                    .offset(self.max_turns).limit(1)
+                ).scalar()
+                trimmed = 0
+                if boundary is not None:
+                    trimmed = connection.execute(
+                        session_turn.delete().where(session_turn.c.session_id == session_id,
+                                                    session_turn.c.id <= boundary)
+                    ).rowcount
+        except Exception:
+            with self._lock:
+                self._stats["write_errors"] += 1
+            raise
+        with self._lock:
+            self._stats["appends"] += 1
+            self._stats["trimmed"] += trimmed
+            self._stats["write_seconds_total"] += time.perf_counter() - start
+
+    def _run(self):
+        while not self._stopped.wait(self.prune_interval):
+            self.prune()
+
+    def prune(self):
+        '''
+        删除空闲超过ttl的会话（该会话的最后一轮早于ttl即整个会话过期）
+        :return:
+        '''
+        deadline = time.time() - self.ttl
+        try:
+            with self._engine_ready().begin() as connection:
+                active = select(session_turn.c.session_id).where(session_turn.c.created >= deadline).distinct()
+                # MySQL不允许在DELETE的子查询中直接读取目标表，套一层派生表
+                active = select(active.subquery().c.session_id)
+                removed = connection.execute(
+                    session_turn.delete().where(session_turn.c.created < deadline,
+                                                session_turn.c.session_id.not_in(active))
+                ).rowcount
+                # 到期的会话锁租约（持有的worker已退出）
+                connection.execute(session_lock.delete().where(session_lock.c.expires < time.time()))
+        except Exception as e:
+            logger.error(f"清理过期会话失败：{str(e)}")
+            return
+        with self._lock:
+            self._stats["expired"] += removed
+
+    def clear(self, session_id: Optional[str] = None):
+        with self._engine_ready().begin() as connection:
+            statement = session_turn.delete()
+            if session_id is not None:
+                statement = statement.where(session_turn.c.session_id == session_id)
+            connection.execute(statement)
+
+    def close(self):
+        '''
+        停止后台清理线程
+        :return:
+        '''
+        self._stopped.set()
+
+    def stats(self) -> Dict:
+        '''
+        写入次数与耗时、会话数与每个会话占用的字节数
+        :return:
+        '''
+        size = func.length(func.coalesce(session_turn.c.user_query, "")) + \
+            func.length(func.coalesce(session_turn.c.generated_sql, ""))
+        with self._engine_ready().connect() as connection:
+            rows = connection.execute(
+                select(func.sum(size)).group_by(session_turn.c.session_id)
+            ).fetchall()
+        sizes = [int(row[0] or 0) for row in rows]
+        with self._lock:
+            stats = dict(self._stats)
+        stats["backend"] = self._engine.dialect.name
+        stats["sessions"] = len(sizes)
+        stats["bytes"] = sum(sizes)
+        stats["bytes_per_session_avg"] = sum(sizes) / len(sizes) if sizes else 0
+        stats["bytes_per_session_max"] = max(sizes) if sizes else 0
+        return stats
+
+
+def create_session_memory(backend: str, uri: str, max_turns: int, ttl: float, max_sessions: int, max_bytes: int,
+                          lock_ttl: float = 300):
+    '''
+    按配置创建会话记忆：memory=进程内（单worker），sqlite/mysql=数据库表（多worker共享）
+    :param backend:
+    :param uri:
+    :param max_turns:
+    :param ttl:
+    :param max_sessions: 仅memory使用
+    :param max_bytes: 仅memory使用
+    :param lock_ttl: 会话锁的租约时间（sqlite/mysql）
+    :return:
+    '''
+    if backend == "memory":
+        return SessionMemory(max_turns=max_turns, ttl=ttl, max_sessions=max_sessions, max_bytes=max_bytes)
+    if backend in ("sqlite", "mysql"):
+        return SqlSessionStore(uri, max_turns=max_turns, ttl=ttl, lock_ttl=lock_ttl)
+    raise ValueError(f"不支持的会话存储类型：{backend}")
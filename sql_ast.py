@@ -0,0 +1,102 @@
+#----------------------SQL语法树工具---------------------------------
+from typing import Callable, List, Optional, Set, Tuple
+import sqlglot
+from sqlglot import exp
+
+DIALECT = "mysql"
+
+
+def parse_sql(sql: str) -> exp.Expression:
+    '''
+    解析单条SQL，语法错误时抛出sqlglot.errors.ParseError
+    :param sql:
+    :return:
+    '''
+    return sqlglot.parse_one(sql, read=DIALECT)
+
+
+def referenced_tables(tree: exp.Expression) -> Set[str]:
+    '''
+    SQL中引用的物理表（不含CTE名称），统一小写
+    :param tree:
+    :return:
+    '''
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    return {
+        table.name.lower() for table in tree.find_all(exp.Table)
+        if table.name and table.name.lower() not in cte_names
+    }
+
+
+def get_limit(tree: exp.Expression) -> Optional[int]:
+    '''
+    最外层查询的LIMIT值，无LIMIT或非整数常量时返回None
+    :param tree:
+    :return:
+    '''
+    limit = tree.args.get("limit")
+    if limit is None:
+        return None
+    value = limit.expression
+    if isinstance(value, exp.Literal) and not value.is_string:
+        try:
+            return int(value.this)
+        except ValueError:
+            return None
+    return None
+
+
+def canonicalize(sql: str) -> Tuple[str, Optional[int], Set[str]]:
+    '''
+    SQL规范化：统一空白与关键字/标识符大小写，IN列表常量与AND条件排序，
+    剥离最外层的LIMIT（无OFFSET时）以便不同LIMIT的相同查询共享结果
+    :param sql:
+    :return: (规范化SQL, 剥离的LIMIT值, 引用的表)
+    '''
+    tree = parse_sql(sql).copy()
+    for node in tree.find_all(exp.In):
+        values = node.expressions
+        if values and all(isinstance(value, (exp.Literal, exp.Neg)) for value in values):
+            node.set("expressions", sorted(values, key=lambda value: value.sql()))
+    for where in tree.find_all(exp.Where):
+        if isinstance(where.this, exp.And):
+            conditions = sorted(where.this.flatten(), key=lambda condition: condition.sql(dialect=DIALECT))
+            where.set("this", exp.and_(*conditions))
+    limit = None
+    if isinstance(tree, exp.Select) and tree.args.get("offset") is None:
+        limit = get_limit(tree)
+        if limit is not None:
+            tree.set("limit", None)
+    return tree.sql(dialect=DIALECT, normalize=True), limit, referenced_tables(tree)
+
+
+def _order_key(node: exp.Expression) -> str:
+    if isinstance(node, exp.Column):
+        return node.name.lower()
+    return node.sql(dialect=DIALECT, normalize=True)
+
+
+def ordered_on_unique_key(tree: exp.Expression, unique_keys: Callable[[str], List[Set[str]]]) -> bool:
+    '''
+    最外层查询的ORDER BY是否唯一确定行的顺序（重新执行后跳过前n行得到的仍是同样的剩余行）：
+    单表查询按该表的主键或某个唯一键的全部字段排序，或分组查询按全部分组字段排序
+    :param tree:
+    :param unique_keys: 表名（小写） -> 主键与唯一键的字段集合（小写）
+    :return:
+    '''
+    if not isinstance(tree, exp.Select) or tree.args.get("order") is None:
+        return False
+    aliases = {select.alias.lower(): select.this for select in tree.expressions if isinstance(select, exp.Alias)}
+    ordered = set()
+    for item in tree.args["order"].expressions:
+        node = item.this
+        if isinstance(node, exp.Column) and not node.table and node.name.lower() in aliases:
+            node = aliases[node.name.lower()]
+        ordered.add(_order_key(node))
+    group = tree.args.get("group")
+    if group is not None:
+        return bool(group.expressions) and {_order_key(node) for node in group.expressions} <= ordered
+    source = tree.find(exp.From)
+    if tree.args.get("joins") or source is None or source.parent is not tree or not isinstance(source.this, exp.Table):
+        return False
+    return any(key and key <= ordered for key in unique_keys(source.this.name.lower()))
@@ -0,0 +1,358 @@
+#----------------------SQL直接执行---------------------------------
+import asyncio
+import datetime
+import decimal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from logger import logger
+from read_router import NODE_INFO_KEY
+from tracing import current_trace, record_db
+
+#执行路径计数：direct=直接执行成功，agent_repair=直接执行失败后交由agent修正，agent=仅agent执行，interrupted=直接执行超时或被中断（不修正）
+exec_path_counter = Counter()
+
+
+def to_plain(value):
+    '''
+    将数据库返回值转换为可JSON序列化的基础类型
+    :param value:
+    :return:
+    '''
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, datetime.timedelta):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode('utf-8', errors='replace')
+    return value
+
+
+def clean_sql(sql: str) -> str:
+    '''
+    去除LLM输出中常见的代码块标记与前缀
+    :param sql:
+    :return:
+    '''
+    sql = (sql or '').strip()
+    if sql.startswith('```'):
+        sql = sql.strip('`').strip()
+        if sql[:3].lower() == 'sql':
+            sql = sql[3:]
+    if sql.lower().startswith('sqlquery:'):
+        sql = sql[len('sqlquery:'):]
+    return sql.strip().rstrip(';').strip()
+
+
+#MySQL：1317=查询被中断（KILL QUERY），3024=超出max_execution_time
+INTERRUPTED_ERROR_CODES = (1317, 3024)
+
+
+def is_interrupted(error: BaseException) -> bool:
+    '''
+    是否为超时或被中断的查询（重新执行或交给agent修正只会再次超时）
+    :param error:
+    :return:
+    '''
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return True
+    orig = getattr(error, 'orig', None) or error
+    if orig.args and orig.args[0] in INTERRUPTED_ERROR_CODES:
+        return True
+    return 'interrupted' in str(orig).lower()
+
+
+def driver_sql(sql: str, dialect) -> str:
+    '''
+    转为可直接交给驱动执行的SQL：format/pyformat参数风格的驱动（如pymysql）即使没有参数也会执行query % args，
+    SQL中的%（如LIKE '%银行%'、DATE_FORMAT(trade_date,'%Y-%m')）需转义为%%
+    :param sql:
+    :param dialect: SQLAlchemy方言
+    :return:
+    '''
+    if dialect.paramstyle in ('format', 'pyformat'):
+        return sql.replace('%', '%%')
+    return sql
+
+
+def exec_driver_sql(connection, sql: str):
+    '''
+    不经过SQLAlchemy的绑定参数解析执行SQL（避免误伤SQL中的字符串常量），并按驱动的参数风格转义%
+    :param connection:
+    :param sql:
+    :return:
+    '''
+    return connection.exec_driver_sql(driver_sql(sql, connection.dialect))
+
+
+def override_execution_time(connection, max_execution_time: Optional[int]) -> bool:
+    '''
+    在连接上改用另一个MySQL最长执行时间（毫秒，0为不限制），原来的设置保存在会话变量中，连接归还连接池前需restore_execution_time；
+    服务端游标读取期间语句一直在执行，引擎连接级的max_execution_time会中断读取较慢的游标与导出
+    :param connection:
+    :param max_execution_time: None时不修改
+    :return: 是否修改了设置
+    '''
+    if max_execution_time is None or connection.dialect.name != 'mysql':
+        return False
+    connection.exec_driver_sql(f"SET @saved_max_execution_time=@@SESSION.max_execution_time, "
+                               f"SESSION max_execution_time={int(max_execution_time)}")
+    return True
+
+
+def restore_execution_time(connection):
+    connection.exec_driver_sql("SET SESSION max_execution_time=@saved_max_execution_time")
+
+
+def rows_to_markdown(columns: List[str], rows: List[list], labels: Optional[Dict[str, str]] = None) -> str:
+    '''
+    查询结果转为markdown表格，labels用于将字段名替换为中文列名
+    :param columns:
+    :param rows:
+    :param labels:
+    :return:
+    '''
+    if not rows:
+        return ''
+    labels = labels or {}
+    header = [labels.get(column) or column for column in columns]
+    lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * len(header)]
+    for row in rows:
+        cells = ['' if value is None else str(value).replace('|', '\\|').replace('\n', ' ') for value in row]
+        lines.append('| ' + ' | '.join(cells) + ' |')
+    lines.append(f'\n共 {len(rows)} 条记录')
+    return '\n'.join(lines)
+
+
+class CancelToken:
+    '''
+    可中断调用的标识：cancel时中断数据库端的查询并置cancelled，
+    超时后仍在执行线程中完成的调用据此放弃结果（如关闭已打开的游标）
+    '''
+
+    def __init__(self):
+        self.cancelled = False
+
+
+class SqlExecutor:
+    '''
+    通过SQLAlchemy连接池直接执行已生成的SQL，返回字段名与结构化行数据
+    同步的数据库调用统一放到有界线程池中执行，避免阻塞事件循环；线程数与连接池大小一致
+    '''
+
+    def __init__(self, engine, max_rows: int = 1000, pool_size: int = 8, timeout: float = 30):
+        '''
+        :param engine: SQLAlchemy引擎（自带连接池）
+        :param max_rows: 单次查询最多读取的行数
+        :param pool_size: 执行线程数（同时执行的数据库调用上限）
+        :param timeout: 单次调用超时时间（秒）
+        '''
+        self._engine = engine
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='sql-exec')
+        self._pool_size = pool_size
+        self._metrics_lock = threading.Lock()
+        self._metrics = {
+            "calls": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "in_flight": 0,
+            "pool_wait_seconds_total": 0.0,
+            "pool_wait_seconds_max": 0.0,
+            "run_seconds_total": 0.0,
+            "cancelled": 0,
+            #超时后仍在执行线程中运行的调用（累计数与当前数）
+            "abandoned": 0,
+            "abandoned_running": 0,
+        }
+        #正在执行的查询：token -> 中断函数，请求取消或超时时用于中断数据库端的查询
+        self._running: Dict[object, object] = {}
+
+    def _interrupter(self, connection):
+        '''
+        获取用于中断当前连接上正在执行的查询的函数
+        :param connection:
+        :return:
+        '''
+        dbapi_connection = connection.connection.dbapi_connection
+        dialect = self._engine.dialect.name
+        if dialect == 'mysql' and hasattr(dbapi_connection, 'thread_id'):
+            thread_id = dbapi_connection.thread_id()
+            # 配置只读副本时self._engine为路由，KILL QUERY需发往执行查询的节点
+            return lambda: self._kill_query(connection.engine, thread_id)
+        if dialect == 'sqlite':
+            return dbapi_connection.interrupt
+        return None
+
+    def _kill_query(self, engine, thread_id: int):
+        '''
+        通过另一个连接执行KILL QUERY，只中断查询，不断开原连接
+        :param engine: 执行查询的节点的引擎
+        :param thread_id:
+        :return:
+        '''
+        def kill():
+            try:
+                with engine.connect() as connection:
+                    connection.exec_driver_sql(f"KILL QUERY {int(thread_id)}")
+            except Exception as e:
+                logger.warning(f"中断查询失败（thread_id={thread_id}）：{str(e)}")
+        # 执行线程可能已被占满，使用独立线程避免排队
+        threading.Thread(target=kill, name='sql-kill', daemon=True).start()
+
+    def register(self, token, connection):
+        '''
+        登记连接上正在执行的查询，cancel(token)时中断（执行结束后需调用unregister）
+        :param token: 为None时不登记
+        :param connection:
+        :return:
+        '''
+        if token is None:
+            return
+        interrupt = self._interrupter(connection)
+        if interrupt is not None:
+            self._running[token] = interrupt
+
+    def unregister(self, token):
+        self._running.pop(token, None)
+
+    def cancel(self, token) -> bool:
+        '''
+        中断token对应的正在执行的查询
+        :param token:
+        :return: 是否发出了中断
+        '''
+        if isinstance(token, CancelToken):
+            token.cancelled = True
+        interrupt = self._running.pop(token, None)
+        if interrupt is None:
+            return False
+        with self._metrics_lock:
+            self._metrics["cancelled"] += 1
+        interrupt()
+        return True
+
+    def execute(self, sql: str, token=None) -> Dict:
+        '''
+        执行查询（同步，运行在执行线程中）
+        :param sql:
+        :param token: 用于cancel的标识，为None时不可中断
+        :return: {"columns": [...], "rows": [[...]], "row_count": n, "truncated": 是否达到max_rows, "elapsed": 秒,
+                  "node": 执行查询的只读节点（配置只读副本时）}
+        '''
+        start = time.perf_counter()
+        with self._engine.connect() as connection:
+            self.register(token, connection)
+            try:
+                result = exec_driver_sql(connection, sql)
+                columns = list(result.keys())
+                rows = [[to_plain(value) for value in row] for row in result.fetchmany(self.max_rows)]
+                node = connection.info.get(NODE_INFO_KEY)
+            finally:
+                self.unregister(token)
+        return {
+            "columns": columns,
+            "rows": rows,
+            "row_count": len(rows),
+            "truncated": len(rows) >= self.max_rows,
+            "elapsed": time.perf_counter() - start,
+            "node": node,
+        }
+
+    async def run(self, func, *args, timeout: Optional[float] = None, db_time: bool = True):
+        '''
+        在执行线程池中运行同步的数据库调用。
+        超时后调用方不再等待，但线程中的调用会继续运行到结束并占用一个执行线程：查询通过acall/aexecute
+        在超时时中断，其他调用（表结构读取、会话读写等）只计入abandoned与abandoned_running指标
+        :param func:
+        :param args:
+        :param timeout: 超时时间（秒），默认使用self.timeout
+        :param db_time: 是否计入数据库耗时（DB_SECONDS），只做计算的调用（表裁剪、缓存读取）传False
+        :return:
+        '''
+        loop = asyncio.get_running_loop()
+        submitted = time.perf_counter()
+        # 执行线程中读取不到当前请求的上下文，提前取出追踪记录
+        trace = current_trace.get()
+        call = {"started": False, "done": False, "abandoned": False}
+
+        def task():
+            started = time.perf_counter()
+            waited = started - submitted
+            with self._metrics_lock:
+                call["started"] = True
+                self._metrics["in_flight"] += 1
+                self._metrics["pool_wait_seconds_total"] += waited
+                self._metrics["pool_wait_seconds_max"] = max(self._metrics["pool_wait_seconds_max"], waited)
+            try:
+                return func(*args)
+            finally:
+                seconds = time.perf_counter() - started
+                with self._metrics_lock:
+                    self._metrics["in_flight"] -= 1
+                    self._metrics["run_seconds_total"] += seconds
+                    call["done"] = True
+                    if call["abandoned"]:
+                        self._metrics["abandoned_running"] -= 1
+                if db_time:
+                    record_db(getattr(func, '__name__', 'call'), seconds, trace)
+
+        with self._metrics_lock:
+            self._metrics["calls"] += 1
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(self._pool, task), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            with self._metrics_lock:
+                self._metrics["timeouts"] += 1
+                if call["started"] and not call["done"]:
+                    # 排队中的调用已被取消；已开始执行的继续运行，记为abandoned直到结束
+                    call["abandoned"] = True
+                    self._metrics["abandoned"] += 1
+                    self._metrics["abandoned_running"] += 1
+            raise TimeoutError(f"数据库调用超时（{timeout or self.timeout}秒）")
+        except Exception:
+            with self._metrics_lock:
+                self._metrics["errors"] += 1
+            raise
+
+    async def acall(self, func, *args, timeout: Optional[float] = None):
+        '''
+        在执行线程池中运行可中断的调用func(*args, token)，超时或调用方被取消（如客户端断开连接）时
+        中断数据库端的查询；func需通过register/unregister登记执行查询的连接，并在token.cancelled时放弃结果
+        :param func:
+        :param args:
+        :param timeout:
+        :return:
+        '''
+        token = CancelToken()
+        try:
+            return await self.run(func, *args, token, timeout=timeout)
+        except (asyncio.CancelledError, TimeoutError):
+            self.cancel(token)
+            raise
+
+    async def aexecute(self, sql: str, timeout: Optional[float] = None) -> Dict:
+        '''
+        异步执行查询，超时或调用方被取消时中断数据库端的查询
+        :param sql:
+        :param timeout:
+        :return:
+        '''
+        return await self.acall(self.execute, sql, timeout=timeout)
+
+    def metrics(self) -> Dict:
+        '''
+        执行线程池与连接池指标
+        :return:
+        '''
+        with self._metrics_lock:
+            metrics = dict(self._metrics)
+        metrics["pool_size"] = self._pool_size
+        metrics["queued"] = self._pool._work_queue.qsize()
+        metrics["connection_pool"] = self._engine.pool.status()
+        return metrics
@@ -0,0 +1,111 @@
+#----------------------SQL校验---------------------------------
+from typing import Dict, Optional, Set, Tuple
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+from sql_ast import DIALECT, get_limit
+
+#只允许单条只读查询，语法树中出现以下节点即拒绝
+FORBIDDEN_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create, exp.Alter, exp.TruncateTable,
+    exp.LoadData, exp.Command, exp.Set, exp.Use, exp.Grant, exp.Transaction, exp.Commit, exp.Into, exp.Lock,
+)
+#有副作用或可被用于拖慢数据库的函数
+FORBIDDEN_FUNCTIONS = {'SLEEP', 'BENCHMARK', 'LOAD_FILE', 'GET_LOCK', 'RELEASE_LOCK', 'RELEASE_ALL_LOCKS'}
+
+
+def _check_database(tree: exp.Expression, database: Optional[str]) -> Optional[str]:
+    '''
+    带库名的表必须属于当前连接的库（拒绝information_schema、其他库中的同名表等）
+    :param tree:
+    :param database: 当前连接的库名，为None时不允许带库名
+    :return: 错误信息，无错误时返回None
+    '''
+    for table in tree.find_all(exp.Table):
+        if table.catalog or (table.db and (database is None or table.db.lower() != database.lower())):
+            return f"不允许访问其他数据库的表：{table.sql(dialect=DIALECT)}"
+    return None
+
+
+def _check_columns(tree: exp.Expression, schema: Dict[str, Set[str]]) -> Optional[str]:
+    '''
+    检查引用的表与字段是否存在
+    :param tree:
+    :param schema: {表名: 字段名集合}，均为小写
+    :return: 错误信息，无错误时返回None
+    '''
+    cte_names = {cte.alias_or_name.lower() for cte in tree.find_all(exp.CTE)}
+    aliases = {}
+    for table in tree.find_all(exp.Table):
+        name = table.name.lower()
+        if name in cte_names:
+            continue
+        if name not in schema:
+            return f"表不存在：{table.name}"
+        aliases[table.alias_or_name.lower()] = name
+    # 含CTE或派生表时字段来源难以静态确定，只校验表
+    if cte_names or any(isinstance(source.this, exp.Subquery) for source in tree.find_all(exp.From, exp.Join)):
+        return None
+    output_aliases = {alias.alias.lower() for alias in tree.find_all(exp.Alias)}
+    all_columns = set().union(*(schema[name] for name in aliases.values())) if aliases else set()
+    for column in tree.find_all(exp.Column):
+        if isinstance(column.this, exp.Star):
+            continue
+        column_name = column.name.lower()
+        qualifier = column.table.lower()
+        if qualifier:
+            table_name = aliases.get(qualifier)
+            if table_name is None:
+                return f"未知的表或别名：{column.table}"
+            if column_name not in schema[table_name]:
+                return f"字段不存在：{column.table}.{column.name}"
+        elif column_name not in all_columns and column_name not in output_aliases:
+            return f"字段不存在：{column.name}"
+    return None
+
+
+def validate_sql(sql: str, schema: Optional[Dict[str, Set[str]]] = None, default_limit: int = 10,
+                 max_limit: int = 1000, database: Optional[str] = None) -> Tuple[Optional[str], Optional[str]]:
+    '''
+    基于语法树的SQL校验
+    只接受单条只读SELECT/WITH查询；表只能属于当前连接的库；校验表和字段存在；没有LIMIT时补充default_limit，超过max_limit时截断
+    :param sql:
+    :param schema: {表名: 字段名集合}，为None时跳过表和字段校验
+    :param default_limit: 未指定LIMIT时补充的条数
+    :param max_limit: LIMIT上限
+    :param database: 当前连接的库名，表名带其他库名时拒绝
+    :return: (校验后的SQL, 错误信息)，校验通过时错误信息为None
+    '''
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read=DIALECT) if statement is not None]
+    except SqlglotError as e:
+        return None, f"SQL语法错误：{str(e).splitlines()[0]}"
+    if len(statements) != 1:
+        return None, "只允许执行单条SQL语句"
+    tree = statements[0]
+    if isinstance(tree, exp.Subquery):
+        tree = tree.unnest()
+    if not isinstance(tree, (exp.Select, exp.SetOperation)):
+        return None, f"只允许查询语句，当前语句类型：{tree.key.upper()}"
+    for node in tree.walk():
+        if isinstance(node, FORBIDDEN_NODES):
+            return None, f"SQL包含危险操作：{node.key.upper()}"
+        if isinstance(node, exp.Func):
+            function_name = node.name.upper() if isinstance(node, exp.Anonymous) else node.sql_name()
+            if function_name in FORBIDDEN_FUNCTIONS:
+                return None, f"SQL包含禁止使用的函数：{function_name}"
+    error = _check_database(tree, database)
+    if error:
+        return None, error
+    if schema is not None:
+        error = _check_columns(tree, schema)
+        if error:
+            return None, error
+    limit = get_limit(tree)
+    if tree.args.get("limit") is not None and limit is None:
+        return None, "LIMIT必须为整数常量"
+    if limit is None:
+        return tree.limit(default_limit).sql(dialect=DIALECT), None
+    if limit > max_limit:
+        return tree.limit(max_limit).sql(dialect=DIALECT), None
+    return sql, None
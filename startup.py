@@ -0,0 +1,90 @@
+#----------------------启动与预热状态---------------------------------
+import asyncio
+import time
+from typing import Dict, Optional
+from logger import logger
+from tracing import STARTUP_SECONDS
+
+
+class StartupState:
+    '''
+    进程启动过程：导入耗时与预热（提示词、表结构、查询链、工作流编译）各步骤的耗时
+    预热完成前服务已可接收请求（首个请求按需加载），就绪检查在预热完成后才返回成功
+    '''
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.import_seconds: Optional[float] = None
+        self.status = "starting"
+        self.steps: Dict[str, float] = {}
+        self.warmup_seconds: Optional[float] = None
+        self.attempts = 0
+        self.error: Optional[str] = None
+
+    def record_import(self, seconds: float):
+        self.import_seconds = round(seconds, 4)
+        STARTUP_SECONDS.set(self.import_seconds, phase="import")
+        logger.info(f"应用导入完成，耗时: {self.import_seconds * 1000:.1f}ms")
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    async def step(self, name: str, func, *args):
+        '''
+        执行一个预热步骤并记录耗时；同步函数在线程中执行，不阻塞事件循环
+        :param name:
+        :param func: 同步函数或协程函数
+        :return:
+        '''
+        start = time.perf_counter()
+        if asyncio.iscoroutinefunction(func):
+            result = await func(*args)
+        else:
+            result = await asyncio.to_thread(func, *args)
+        self.steps[name] = round(time.perf_counter() - start, 4)
+        STARTUP_SECONDS.set(self.steps[name], phase=name)
+        return result
+
+    async def run(self, warm_up, retry_interval: float = 10):
+        '''
+        执行预热，失败时（如数据库暂不可用）间隔retry_interval秒重试，直至成功或被取消
+        :param warm_up: 预热协程函数，参数为当前状态
+        :param retry_interval:
+        :return:
+        '''
+        while True:
+            self.attempts += 1
+            self.status = "warming"
+            self.steps = {}
+            start = time.perf_counter()
+            try:
+                await warm_up(self)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.status = "failed"
+                self.error = str(e)
+                logger.error(f"启动预热失败（第{self.attempts}次），{retry_interval}秒后重试：{str(e)}")
+                await asyncio.sleep(retry_interval)
+                continue
+            self.warmup_seconds = round(time.perf_counter() - start, 4)
+            STARTUP_SECONDS.set(self.warmup_seconds, phase="warmup")
+            self.status = "ready"
+            self.error = None
+            logger.info(f"启动预热完成，耗时: {self.warmup_seconds * 1000:.1f}ms，各步骤: {self.steps}")
+            return
+
+    def snapshot(self) -> Dict:
+        return {
+            "status": self.status,
+            "uptime_seconds": round(time.time() - self.started_at, 3),
+            "import_seconds": self.import_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "steps": dict(self.steps),
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+startup_state = StartupState()
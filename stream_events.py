@@ -0,0 +1,39 @@
+#----------------------查询流式事件---------------------------------
+import base64
+import gzip
+import json
+from typing import Any
+
+#事件类型：progress=进度消息，sql=生成的SQL，rows=结构化查询结果，markdown=文本结果，
+#chart=ECharts配置，done=处理完成，error=处理出错
+EVENT_TYPES = ('progress', 'sql', 'rows', 'markdown', 'chart', 'done', 'error')
+
+
+def encode_sse(event: str, data: Any, compress_min_bytes: int = 0) -> bytes:
+    '''
+    编码为一条SSE消息，数据只做一次JSON序列化；超过compress_min_bytes的数据（大结果集）
+    gzip压缩后base64编码，以{"encoding": "gzip", "payload": ...}发送，压缩后没有变小时原样发送
+    :param event: EVENT_TYPES之一
+    :param data:
+    :param compress_min_bytes: 0表示不压缩
+    :return:
+    '''
+    payload = json.dumps(data, ensure_ascii=False, default=str, separators=(',', ':'))
+    if compress_min_bytes and len(payload) >= compress_min_bytes:
+        raw = payload.encode('utf-8')
+        compressed = base64.b64encode(gzip.compress(raw, compresslevel=5)).decode('ascii')
+        if len(compressed) < len(raw):
+            payload = json.dumps({'encoding': 'gzip', 'payload': compressed}, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'.encode('utf-8')
+
+
+def decode_sse(data: str) -> Any:
+    '''
+    解析一条SSE消息的数据（解压encode_sse压缩的数据）
+    :param data: data行的内容
+    :return:
+    '''
+    value = json.loads(data)
+    if isinstance(value, dict) and value.get('encoding') == 'gzip' and set(value) == {'encoding', 'payload'}:
+        value = json.loads(gzip.decompress(base64.b64decode(value['payload'])).decode('utf-8'))
+    return value
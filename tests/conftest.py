@@ -0,0 +1,12 @@
+#----------------------测试公共配置---------------------------------
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+#settings导入时要求的环境变量，测试不访问真实的数据库与模型
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("MYSQL_DB_URI", "sqlite://")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
@@ -0,0 +1,27 @@
+#----------------------管理接口访问校验---------------------------------
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+import settings
+from urls.admin_urls import admin_router
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(admin_router, prefix='/admin')
+    return TestClient(app)
+
+
+def test_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", "")
+    assert client.get('/admin/cache/result').status_code == 404
+    assert client.post('/admin/rollup/refresh', json={"full": True}, headers={"X-Admin-Token": ""}).status_code == 404
+
+
+def test_requires_matching_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "admin_token", "secret")
+    assert client.get('/admin/cache/result').status_code == 401
+    assert client.post('/admin/cache/result/invalidate', json={"tables": ["t"]},
+                       headers={"X-Admin-Token": "wrong"}).status_code == 401
+    assert client.get('/admin/cache/result', headers={"X-Admin-Token": "secret"}).status_code == 200
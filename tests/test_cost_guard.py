@@ -0,0 +1,73 @@
+#----------------------查询代价评估---------------------------------
+from cost_guard import CostGuard, parse_explain
+
+
+def table(name, access_type, examined=None, produced=None, key=None, possible_keys=None, **extra):
+    value = {"table_name": name, "access_type": access_type, **extra}
+    if examined is not None:
+        value["rows_examined_per_scan"] = examined
+    if produced is not None:
+        value["rows_produced_per_join"] = produced
+    if key:
+        value["key"] = key
+    if possible_keys:
+        value["possible_keys"] = possible_keys
+    return {"table": value}
+
+
+JOIN = {"query_block": {"select_id": 1, "cost_info": {"query_cost": "1250.40"}, "nested_loop": [
+    table("stock_basic", "ALL", 1000, 200, possible_keys=["PRIMARY"]),
+    table("stock_market_cap", "ref", 30, 6000, key="idx_stock_date", possible_keys=["idx_stock_date"]),
+]}}
+
+
+def test_join_rows_follow_nested_loop():
+    estimate = parse_explain(JOIN)
+    #驱动表扫描1000行，产生200行，每行再扫描被驱动表30行
+    assert estimate["rows_examined"] == 1000 + 200 * 30
+    assert estimate["query_cost"] == 1250.4
+    assert [t["table"] for t in estimate["tables"]] == ["stock_basic", "stock_market_cap"]
+    assert estimate["full_scans"] == ["stock_basic"]
+
+
+def test_subquery_tables_are_counted():
+    derived = table("d", "ALL", 50, 50, materialized_from_subquery={"query_block": {"select_id": 2, "nested_loop": [
+        table("stock_inst_hold", "index", 8000, 8000),
+        table("institution", "eq_ref", 1, 8000, key="PRIMARY"),
+    ]}})
+    plan = {"query_block": {"select_id": 1, "cost_info": {"query_cost": "99"}, "nested_loop": [
+        derived, table("stock_basic", "eq_ref", 1, 50, key="PRIMARY"),
+    ]}}
+    estimate = parse_explain(plan)
+    assert estimate["rows_examined"] == 50 + 50 * 1 + 8000 + 8000 * 1
+    assert estimate["full_scans"] == ["d", "stock_inst_hold"]
+    assert {t["table"] for t in estimate["tables"]} == {"d", "stock_basic", "stock_inst_hold", "institution"}
+
+
+def test_attached_subquery_single_table():
+    plan = {"query_block": {"select_id": 1, "table": dict(table("stock_basic", "ALL", 1000)["table"], attached_subqueries=[
+        {"query_block": {"select_id": 2, **table("stock_market_cap", "ALL", 500)}},
+    ])}}
+    estimate = parse_explain(plan)
+    assert estimate["rows_examined"] == 1500
+    assert estimate["full_scans"] == ["stock_basic", "stock_market_cap"]
+
+
+def test_missing_rows_examined_per_scan():
+    #const表、Impossible WHERE等没有rows_examined_per_scan，按0行计，也不放大后续表
+    plan = {"query_block": {"select_id": 1, "nested_loop": [
+        table("institution", "const", key="PRIMARY"),
+        table("stock_inst_hold", "ref", 40, 40, key="idx_inst"),
+    ]}}
+    estimate = parse_explain(plan)
+    assert estimate["rows_examined"] == 40
+    assert estimate["query_cost"] == 0.0
+    assert estimate["tables"][0]["rows"] == 0.0
+    assert parse_explain({"query_block": {"select_id": 1, "message": "Impossible WHERE"}})["rows_examined"] == 0.0
+
+
+def test_check_feedback():
+    guard = CostGuard(engine=None, max_rows_examined=5000)
+    feedback = guard.check(parse_explain(JOIN))
+    assert "7000" in feedback and "stock_basic" in feedback and "stock_basic(PRIMARY)" in feedback
+    assert CostGuard(engine=None, max_rows_examined=10000).check(parse_explain(JOIN)) is None
@@ -0,0 +1,71 @@
+#----------------------追问改写---------------------------------
+import pytest
+from followup_rewriter import parse_cn_number, rewrite_follow_up
+
+LAST_SQL = "SELECT stock_name, pe_ttm FROM stock_market_cap WHERE pe_ttm > 30 ORDER BY pe_ttm ASC LIMIT 10"
+BASE = "SELECT stock_name, pe_ttm FROM stock_market_cap WHERE pe_ttm > 30 ORDER BY pe_ttm"
+
+
+@pytest.mark.parametrize("question,limit", [
+    ("只需要前两条", 2),
+    ("前20条", 20),
+    ("前十五名", 15),
+    ("top 3", 3),
+])
+def test_limit(question, limit):
+    assert rewrite_follow_up(question, LAST_SQL) == f"{BASE} ASC LIMIT {limit}"
+
+
+def test_limit_added_when_missing():
+    assert rewrite_follow_up("前5条", "SELECT a FROM t") == "SELECT a FROM t LIMIT 5"
+
+
+@pytest.mark.parametrize("question,direction", [
+    ("降序", "DESC"),
+    ("从高到低排序", "DESC"),
+    ("升序", "ASC"),
+    ("反过来", "DESC"),
+])
+def test_ordering(question, direction):
+    assert rewrite_follow_up(question, LAST_SQL) == f"{BASE} {direction} LIMIT 10"
+
+
+def test_reverse_order_phrase_means_descending():
+    #“倒序”视为降序，不是把现有排序反过来
+    assert rewrite_follow_up("倒序", LAST_SQL) == f"{BASE} DESC LIMIT 10"
+    assert rewrite_follow_up("倒序", "SELECT a FROM t ORDER BY a DESC") == "SELECT a FROM t ORDER BY a DESC"
+    assert rewrite_follow_up("反过来", "SELECT a FROM t ORDER BY a DESC") == "SELECT a FROM t ORDER BY a ASC"
+
+
+@pytest.mark.parametrize("question,condition", [
+    ("改成大于50", "pe_ttm > 50"),
+    ("换成50", "pe_ttm > 50"),
+    ("小于20的", "pe_ttm < 20"),
+    ("不超过15", "pe_ttm <= 15"),
+])
+def test_filter_replacement(question, condition):
+    expected = f"SELECT stock_name, pe_ttm FROM stock_market_cap WHERE {condition} ORDER BY pe_ttm ASC LIMIT 10"
+    assert rewrite_follow_up(question, LAST_SQL) == expected
+
+
+def test_combined_filter_and_limit():
+    assert rewrite_follow_up("小于20的前5条", LAST_SQL) == \
+        "SELECT stock_name, pe_ttm FROM stock_market_cap WHERE pe_ttm < 20 ORDER BY pe_ttm ASC LIMIT 5"
+
+
+@pytest.mark.parametrize("question,last_sql", [
+    ("按行业分组", LAST_SQL),
+    ("前两条的行业", LAST_SQL),
+    ("市值最高的股票", LAST_SQL),
+    ("降序", "SELECT a FROM t"),
+    ("改成大于50", "SELECT a FROM t WHERE a > 1 AND b < 2"),
+    ("前两条", None),
+])
+def test_not_rewritten(question, last_sql):
+    #意图不明确、没有可调整的排序或条件不唯一时交给LLM
+    assert rewrite_follow_up(question, last_sql) is None
+
+
+@pytest.mark.parametrize("text,value", [("两", 2), ("十", 10), ("二十", 20), ("十五", 15), ("一百", 100), ("35", 35), ("千", None)])
+def test_parse_cn_number(text, value):
+    assert parse_cn_number(text) == value
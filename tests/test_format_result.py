@@ -0,0 +1,27 @@
+#----------------------结果格式化---------------------------------
+import asyncio
+import pytest
+import texttosql
+
+
+def format_result(exec_result):
+    state = {"exec_result": exec_result, "streaming_queue": [], "user_query": "q", "session_id": "s",
+             "batch": True, "chart": False, "generated_sql": "SELECT 1"}
+
+    async def run():
+        async for _ in texttosql.format_result_node(state):
+            pass
+    asyncio.run(run())
+    return state["formatted_result"]
+
+
+def test_direct_result_with_error_text_is_not_an_error():
+    result = format_result({"columns": ["name"], "rows": [["Error Bars Ltd"]],
+                            "raw_output": "| name |\n|---|\n| Error Bars Ltd |", "intermediate": []})
+    assert "查询出现错误" not in result
+    assert "Error Bars Ltd" in result
+
+
+@pytest.mark.parametrize("raw_output", ["Error: no such table: stock_basics"])
+def test_agent_error_output_is_reported(raw_output):
+    assert "查询出现错误" in format_result({"raw_output": raw_output, "intermediate": []})
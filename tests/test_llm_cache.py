@@ -0,0 +1,90 @@
+#----------------------LLM响应缓存---------------------------------
+import asyncio
+import time
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llm_cache import CassetteMiss, LLMCache, dump_result, load_result
+from llm_gateway import GatewayChatModel, LLMGateway
+from tracing import current_node
+
+VALUE = "x" * 100
+
+
+def cache(tmp_path, mode, **kwargs):
+    return LLMCache(str(tmp_path / "llm_cache.db"), mode=mode, **kwargs)
+
+
+def test_on_mode_reads_and_writes(tmp_path):
+    llm_cache = cache(tmp_path, "on", nodes=["generate_sql"])
+    assert llm_cache.get("k") is None
+    llm_cache.put("k", "generate_sql", VALUE)
+    assert llm_cache.get("k") == VALUE
+    assert llm_cache.stats()["hits"] == 1 and llm_cache.stats()["misses"] == 1
+
+
+def test_per_node_flags(tmp_path):
+    #on模式只缓存配置的节点；record/replay对所有节点生效；off全部关闭
+    assert cache(tmp_path, "on", nodes=["generate_sql"]).enabled("generate_sql")
+    assert not cache(tmp_path, "on", nodes=["generate_sql"]).enabled("gen_chart")
+    assert cache(tmp_path, "record").enabled("gen_chart")
+    assert cache(tmp_path, "replay").enabled("gen_chart")
+    assert not cache(tmp_path, "off", nodes=["generate_sql"]).enabled("generate_sql")
+
+
+def test_record_then_replay(tmp_path):
+    recorder = cache(tmp_path, "record")
+    recorder.put("k", "generate_sql", VALUE)
+    #录制时不读取已有的响应，每次都调用模型
+    assert recorder.get("k") is None
+    player = cache(tmp_path, "replay")
+    assert player.get("k") == VALUE
+    #回放模式不写入
+    player.put("other", "generate_sql", VALUE)
+    with pytest.raises(CassetteMiss):
+        player.get("other")
+
+
+def test_lru_eviction_by_used(tmp_path):
+    llm_cache = cache(tmp_path, "on", max_bytes=250)
+    llm_cache.put("a", "n", VALUE)
+    time.sleep(0.01)
+    llm_cache.put("b", "n", VALUE)
+    time.sleep(0.01)
+    #读取a使其成为最近使用，超出上限时淘汰b
+    assert llm_cache.get("a") == VALUE
+    time.sleep(0.01)
+    llm_cache.put("c", "n", VALUE)
+    assert llm_cache.get("b") is None
+    assert llm_cache.get("a") == VALUE and llm_cache.get("c") == VALUE
+    assert llm_cache.stats()["evicted"] == 1
+    assert llm_cache.stats()["bytes"] <= 250
+
+
+def test_record_mode_does_not_evict(tmp_path):
+    llm_cache = cache(tmp_path, "record", max_bytes=150)
+    for key in "abc":
+        llm_cache.put(key, "n", VALUE)
+    assert llm_cache.stats()["entries"] == 3
+
+
+def test_result_round_trip_drops_usage():
+    message = AIMessage(content="SELECT 1", usage_metadata={"input_tokens": 3, "output_tokens": 2, "total_tokens": 5})
+    result = load_result(dump_result(ChatResult(generations=[ChatGeneration(message=message)])))
+    assert result.generations[0].message.content == "SELECT 1"
+    assert result.generations[0].message.usage_metadata is None
+
+
+def test_replay_does_not_call_model(tmp_path):
+    async def call(llm_cache):
+        model = GatewayChatModel(model=FakeListChatModel(responses=["SELECT 1"]), gateway=LLMGateway(),
+                                 response_cache=llm_cache)
+        token = current_node.set("generate_sql")
+        try:
+            return (await model.ainvoke("q")).content, model.gateway.stats()["calls"]
+        finally:
+            current_node.reset(token)
+
+    assert asyncio.run(call(cache(tmp_path, "record"))) == ("SELECT 1", 1)
+    assert asyncio.run(call(cache(tmp_path, "replay"))) == ("SELECT 1", 0)
@@ -0,0 +1,216 @@
+#----------------------LLM调用调度---------------------------------
+import asyncio
+import json
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.runnables import RunnableLambda, RunnableParallel, RunnablePassthrough
+from llm_gateway import GatewayChatModel
+
+
+class CountingGateway:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate(self, key, call):
+        self.calls += 1
+        return await call()
+
+
+class StructuredFakeModel(FakeListChatModel):
+    '''
+    按参数返回不同形状的结构化输出链：绑定参数的模型 | 解析器、include_raw时的RunnableParallel、不含模型的链
+    '''
+
+    def with_structured_output(self, schema, **kwargs):
+        bound = self.bind(response_format={"type": "json_object"})
+        if kwargs.get("include_raw"):
+            return RunnableParallel(raw=bound) | RunnablePassthrough.assign(
+                parsed=lambda value: json.loads(value["raw"].content))
+        if kwargs.get("opaque"):
+            return RunnableLambda(lambda value: {})
+        return bound | RunnableLambda(lambda message: json.loads(message.content))
+
+
+@pytest.fixture
+def model():
+    gateway = CountingGateway()
+    return GatewayChatModel(model=StructuredFakeModel(responses=['{"x": 1}']), gateway=gateway), gateway
+
+
+def test_structured_output_goes_through_gateway(model):
+    chat, gateway = model
+    assert asyncio.run(chat.with_structured_output(dict).ainvoke("q")) == {"x": 1}
+    assert gateway.calls == 1
+
+
+def test_structured_output_include_raw_goes_through_gateway(model):
+    chat, gateway = model
+    result = asyncio.run(chat.with_structured_output(dict, include_raw=True).ainvoke("q"))
+    assert result["parsed"] == {"x": 1}
+    assert gateway.calls == 1
+
+
+def test_structured_output_without_model_raises(model):
+    chat, _ = model
+    with pytest.raises(ValueError, match="无法经调度调用"):
+        chat.with_structured_output(dict, opaque=True)
+
+
+#----------------------调度：合并、排队、优先级与限流---------------------------------
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from llm_gateway import LLMGateway
+
+
+def chat_result(text):
+    return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+class RateLimited(Exception):
+    status_code = 429
+
+
+def test_identical_calls_are_coalesced():
+    async def run():
+        gateway = LLMGateway()
+        release = asyncio.Event()
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await release.wait()
+            return chat_result("a")
+
+        leader = asyncio.create_task(gateway.generate("k", call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(gateway.generate("k", call))
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(leader, follower)
+        return gateway, calls, results
+    gateway, calls, results = asyncio.run(run())
+    assert len(calls) == 1
+    assert [result.generations[0].message.content for result in results] == ["a", "a"]
+    assert gateway.stats()["coalesced"] == 1
+    assert gateway.stats()["inflight_keys"] == 0
+
+
+def test_follower_retries_when_leader_is_cancelled():
+    async def run():
+        gateway = LLMGateway()
+        started = asyncio.Event()
+        calls = []
+
+        async def slow():
+            calls.append("leader")
+            started.set()
+            await asyncio.sleep(10)
+
+        async def fast():
+            calls.append("follower")
+            return chat_result("b")
+
+        leader = asyncio.create_task(gateway.generate("k", slow))
+        await started.wait()
+        follower = asyncio.create_task(gateway.generate("k", fast))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return gateway, calls, await follower
+    gateway, calls, result = asyncio.run(run())
+    #等待方收到_LeaderCancelled后自己发起调用
+    assert calls == ["leader", "follower"]
+    assert result.generations[0].message.content == "b"
+    assert gateway.stats()["active"] == 0
+
+
+def test_cancel_while_queued_does_not_take_a_slot():
+    async def run():
+        gateway = LLMGateway(max_concurrency=1)
+        await gateway._acquire("high")
+        waiter = asyncio.create_task(gateway._acquire("high"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert gateway._active == 1
+        gateway._release()
+        return gateway
+    gateway = asyncio.run(run())
+    #已取消的等待方在分配时被跳过
+    assert gateway._active == 0
+    assert gateway.stats()["queue_depth"] == {"high": 0, "low": 0}
+
+
+def test_cancel_after_slot_granted_returns_it():
+    async def run():
+        gateway = LLMGateway(max_concurrency=1)
+        await gateway._acquire("high")
+        waiter = asyncio.create_task(gateway._acquire("high"))
+        await asyncio.sleep(0)
+        #名额已分配给等待方（future已完成），等待方恢复运行前被取消
+        gateway._release()
+        assert gateway._active == 1
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return gateway
+    assert asyncio.run(run())._active == 0
+
+
+def test_high_priority_waiters_go_first():
+    async def run():
+        gateway = LLMGateway(max_concurrency=1)
+        await gateway._acquire("high")
+        order = []
+
+        async def wait(name, lane):
+            await gateway._acquire(lane)
+            order.append(name)
+            gateway._release()
+
+        tasks = []
+        for name, lane in (("low1", "low"), ("high1", "high"), ("low2", "low"), ("high2", "high")):
+            tasks.append(asyncio.create_task(wait(name, lane)))
+            await asyncio.sleep(0)
+        gateway._release()
+        await asyncio.gather(*tasks)
+        return order
+    assert asyncio.run(run()) == ["high1", "high2", "low1", "low2"]
+
+
+def test_rate_limit_halves_limit_and_recovers_additively():
+    async def run():
+        gateway = LLMGateway(max_concurrency=8, backoff_base=0.001, backoff_max=0.001)
+        failures = [RateLimited("429")]
+
+        async def call():
+            if failures:
+                raise failures.pop()
+            return chat_result("ok")
+
+        await gateway.generate("k0", call)
+        after_429 = gateway.limit
+        #连续成功的调用数（含重试成功的第一次调用）达到当前上限时上限加一
+        for i in range(after_429 - 2):
+            await gateway.generate(f"k{i + 1}", call)
+        before_recovery = gateway.limit
+        await gateway.generate("last", call)
+        return gateway, after_429, before_recovery
+    gateway, after_429, before_recovery = asyncio.run(run())
+    assert after_429 == 4
+    assert before_recovery == 4
+    assert gateway.limit == 5
+    assert gateway.stats()["rate_limited"] == 1 and gateway.stats()["retries"] == 1
+
+
+def test_non_retryable_error_is_raised():
+    async def call():
+        raise ValueError("bad request")
+
+    gateway = LLMGateway()
+    with pytest.raises(ValueError):
+        asyncio.run(gateway.generate("k", call))
+    assert gateway.stats()["errors"] == 1
+    assert gateway.stats()["active"] == 0
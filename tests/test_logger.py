@@ -0,0 +1,16 @@
+#----------------------日志模块---------------------------------
+import logging
+import queue
+from logger import _QueueHandler
+from tracing import LOG_DROPPED, render_metrics
+
+
+def test_dropped_records_are_exported():
+    handler = _QueueHandler(queue.Queue(maxsize=1), 100)
+    record = logging.LogRecord("texttosql", logging.INFO, __file__, 1, "message", None, None)
+    before = LOG_DROPPED._values.get((), 0)
+    for _ in range(3):
+        handler.handle(record)
+    assert handler.dropped == 2
+    assert LOG_DROPPED._values.get((), 0) == before + 2
+    assert f"text2sql_log_dropped_total {before + 2}" in render_metrics()
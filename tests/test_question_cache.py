@@ -0,0 +1,79 @@
+#----------------------问题到SQL的缓存---------------------------------
+import pytest
+from question_cache import QuestionCache
+
+SCHEMA_KEY = ("v1", ("stock_basic", "stock_market_cap_2"))
+
+
+@pytest.mark.parametrize("cached,asked", [
+    ("市盈率大于30的股票", "市盈率小于30的股票"),
+    ("按市值升序列出股票", "按市值降序列出股票"),
+    ("市盈率最高的股票", "市盈率最低的股票"),
+    ("市盈率大于30的股票", "市盈率不大于30的股票"),
+    ("市盈率大于30的股票", "市盈率大于50的股票"),
+])
+def test_opposite_questions_miss(cached, asked):
+    #阈值足够低，只能由数字与方向词的检查拒绝
+    cache = QuestionCache(threshold=0.3)
+    cache.put(cached, 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get(asked, 10, SCHEMA_KEY) is None
+    assert cache.get(cached, 10, SCHEMA_KEY) == "SELECT 1"
+
+
+@pytest.mark.parametrize("cached,asked", [
+    ("平安银行的市盈率", "招商银行的市盈率"),
+    ("上海交易所市值最高的股票", "深圳交易所市值最高的股票"),
+    ("银行行业市值最高的股票", "医药行业市值最高的股票"),
+])
+def test_entity_swaps_miss(cached, asked):
+    #公司、交易所、行业不同时字面仍很相近，只能由措辞用字的检查拒绝
+    cache = QuestionCache(threshold=0.3)
+    cache.put(cached, 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get(asked, 10, SCHEMA_KEY) is None
+
+
+def test_default_matches_exactly():
+    cache = QuestionCache()
+    cache.put("列出市值最高的10只股票", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("市值最高的10只股票", 10, SCHEMA_KEY) is None
+
+
+def test_near_duplicate_hits():
+    cache = QuestionCache(threshold=0.85)
+    cache.put("列出市值最高的10只股票", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("市值最高的10只股票", 10, SCHEMA_KEY) == "SELECT 1"
+    assert cache.stats()["similar_hits"] == 1
+
+
+def test_threshold_above_one_matches_exactly():
+    cache = QuestionCache(threshold=1.1)
+    cache.put("列出市值最高的10只股票", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("市值最高的10只股票", 10, SCHEMA_KEY) is None
+
+
+def test_normalized_question_hits():
+    cache = QuestionCache()
+    cache.put("市盈率大于30的股票？", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get(" 市盈率大于30的股票 ", 10, SCHEMA_KEY) == "SELECT 1"
+
+
+def test_key_includes_top_k_and_schema():
+    cache = QuestionCache()
+    cache.put("市盈率最高的股票", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("市盈率最高的股票", 20, SCHEMA_KEY) is None
+    assert cache.get("市盈率最高的股票", 10, ("v2", SCHEMA_KEY[1])) is None
+
+
+def test_session_context_skips_cache():
+    cache = QuestionCache()
+    cache.put("按市值降序", 10, SCHEMA_KEY, "SELECT 1", has_context=True)
+    assert cache.stats()["puts"] == 0
+    cache.put("按市值降序", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("按市值降序", 10, SCHEMA_KEY, has_context=True) is None
+    assert cache.stats()["skipped_context"] == 1
+
+
+def test_expired_entry_misses():
+    cache = QuestionCache(ttl=0)
+    cache.put("市盈率最高的股票", 10, SCHEMA_KEY, "SELECT 1")
+    assert cache.get("市盈率最高的股票", 10, SCHEMA_KEY) is None
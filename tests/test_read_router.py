@@ -0,0 +1,90 @@
+#----------------------只读副本路由---------------------------------
+import random
+import time
+import pytest
+from sqlalchemy import create_engine
+from read_router import NODE_INFO_KEY, PRIMARY, ReadRouter
+
+WATERMARK_SQL = "SELECT MAX(date_id) FROM wm"
+
+
+def node_engine(path, watermark):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE wm (date_id INTEGER)")
+        connection.exec_driver_sql(f"INSERT INTO wm VALUES ({watermark})")
+    return engine
+
+
+@pytest.fixture
+def engines(tmp_path):
+    engines = {"primary": node_engine(tmp_path / "primary.db", 10), "r1": node_engine(tmp_path / "r1.db", 10),
+               "lagging": node_engine(tmp_path / "lagging.db", 7),
+               #所在目录不存在，连接失败
+               "down": create_engine(f"sqlite:///{tmp_path / 'missing' / 'down.db'}")}
+    yield engines
+    for engine in engines.values():
+        engine.dispose()
+
+
+def routed(router, count):
+    nodes = []
+    for _ in range(count):
+        with router.connect() as connection:
+            nodes.append(connection.info[NODE_INFO_KEY])
+    return nodes
+
+
+def test_weighted_selection(engines):
+    random.seed(0)
+    router = ReadRouter(engines["primary"], [("r1", engines["r1"], 3)], primary_weight=1)
+    nodes = routed(router, 2000)
+    assert 0.7 < nodes.count("r1") / len(nodes) < 0.8
+    #主库权重为0时只在副本不可用时使用
+    router = ReadRouter(engines["primary"], [("r1", engines["r1"], 1)], primary_weight=0)
+    assert set(routed(router, 50)) == {"r1"}
+
+
+def test_failover_when_replica_is_down(engines):
+    router = ReadRouter(engines["primary"], [("down", engines["down"], 1)], primary_weight=0,
+                        watermark_sql=WATERMARK_SQL)
+    router.check()
+    assert not router.stats()["nodes"][1]["healthy"]
+    assert routed(router, 5) == [PRIMARY] * 5
+
+
+def test_failover_on_connect_failure(engines):
+    #检查前视为可用：连接失败时标记不可用并改用主库
+    router = ReadRouter(engines["primary"], [("down", engines["down"], 1)], primary_weight=0)
+    assert routed(router, 2) == [PRIMARY, PRIMARY]
+    assert router.stats()["failovers"] == 1
+
+
+def test_lag_threshold(engines):
+    router = ReadRouter(engines["primary"], [("r1", engines["r1"], 1), ("lagging", engines["lagging"], 1)],
+                        primary_weight=0, watermark_sql=WATERMARK_SQL, max_lag=2)
+    router.check()
+    lags = {node["name"]: node["lag"] for node in router.stats()["nodes"]}
+    assert lags["r1"] == 0 and lags["lagging"] == 3
+    assert set(routed(router, 50)) == {"r1"}
+    #副本追上后恢复分配
+    with engines["lagging"].begin() as connection:
+        connection.exec_driver_sql("INSERT INTO wm VALUES (9)")
+    router.check()
+    assert "lagging" in set(routed(router, 50))
+
+
+def test_is_fresh(engines):
+    router = ReadRouter(engines["primary"], [("r1", engines["r1"], 1), ("lagging", engines["lagging"], 1)],
+                        watermark_sql=WATERMARK_SQL, max_lag=2)
+    changed = time.time()
+    #主库与未经路由的连接总是最新
+    assert router.is_fresh(PRIMARY, changed) and router.is_fresh(None, changed)
+    #数据变化后副本还没有检查过
+    assert not router.is_fresh("r1", changed)
+    router.check()
+    assert router.is_fresh("r1", changed)
+    #检查过但延迟超出上限
+    assert not router.is_fresh("lagging", changed)
+    assert not router.is_fresh("r1", time.time() + 1)
+    assert not router.is_fresh("unknown", 0)
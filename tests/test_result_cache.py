@@ -0,0 +1,89 @@
+#----------------------查询结果缓存---------------------------------
+import time
+from result_cache import ResultCache
+
+SQL = "SELECT stock_name FROM stock_basic WHERE industry = '银行' ORDER BY stock_id"
+
+
+def result(rows, truncated=False):
+    return {"columns": ["v"], "rows": [[i] for i in range(rows)], "row_count": rows, "truncated": truncated}
+
+
+def test_limit_is_stripped_and_sliced():
+    cache = ResultCache()
+    cache.put(SQL + " LIMIT 10", result(10))
+    hit = cache.get(SQL + " LIMIT 5")
+    assert hit["rows"] == [[i] for i in range(5)] and hit["row_count"] == 5 and hit["cached"]
+    #缓存的10行不足以回答LIMIT 20
+    assert cache.get(SQL + " LIMIT 20") is None
+    assert cache.get(SQL) is None
+
+
+def test_complete_result_covers_any_limit():
+    cache = ResultCache()
+    #LIMIT 10只返回3行：已是完整结果
+    cache.put(SQL + " LIMIT 10", result(3))
+    assert cache.get(SQL + " LIMIT 100")["row_count"] == 3
+    assert cache.get(SQL)["row_count"] == 3
+
+
+def test_truncated_result_only_covers_smaller_limits():
+    cache = ResultCache()
+    #达到max_rows被截断：不是完整结果
+    cache.put(SQL, result(10, truncated=True))
+    assert cache.get(SQL) is None
+    assert cache.get(SQL + " LIMIT 10")["row_count"] == 10
+    assert cache.get(SQL + " LIMIT 11") is None
+
+
+def test_in_list_and_and_conditions_share_key():
+    cache = ResultCache()
+    cache.put("SELECT a FROM t WHERE b IN (3, 1, 2) AND c > 1 LIMIT 5", result(2))
+    assert cache.get("select a from t where c > 1 and b in (1,2,3) limit 5") is not None
+    assert cache.get("SELECT a FROM t WHERE b IN (1, 2) AND c > 1 LIMIT 5") is None
+
+
+def test_invalidate_tables():
+    cache = ResultCache()
+    cache.put("SELECT a FROM t1 LIMIT 5", result(2))
+    cache.put("SELECT a FROM t1 JOIN t2 ON t1.id = t2.id LIMIT 5", result(2))
+    cache.put("SELECT a FROM t3 LIMIT 5", result(2))
+    assert cache.invalidate_tables(["T1"]) == 2
+    assert cache.get("SELECT a FROM t1 LIMIT 5") is None
+    assert cache.get("SELECT a FROM t3 LIMIT 5") is not None
+    assert cache.invalidated_at("SELECT a FROM t1") > 0
+    assert cache.invalidated_at("SELECT a FROM t3") == 0
+
+
+def test_put_after_invalidation_during_execution_is_skipped():
+    #执行开始后表数据变化：结果可能是变化前的数据，不写入
+    cache = ResultCache()
+    started = time.time()
+    cache.invalidate_tables(["stock_basic"])
+    cache.put(SQL + " LIMIT 10", result(3), started)
+    assert cache.get(SQL + " LIMIT 10") is None
+    assert cache.stats()["stale_puts"] == 1
+    cache.put(SQL + " LIMIT 10", result(3), time.time())
+    assert cache.get(SQL + " LIMIT 10") is not None
+
+
+def test_ttl():
+    cache = ResultCache(ttl=0)
+    cache.put(SQL, result(3))
+    time.sleep(0.01)
+    assert cache.get(SQL) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_byte_cap_evicts_oldest():
+    size = len('[[0], [1], [2]]')
+    cache = ResultCache(max_bytes=size * 2)
+    for table in ("t1", "t2", "t3"):
+        cache.put(f"SELECT a FROM {table}", result(3))
+    assert cache.get("SELECT a FROM t1") is None
+    assert cache.get("SELECT a FROM t3") is not None
+    assert cache.stats()["bytes"] <= size * 2
+    assert cache.stats()["evictions"] == 1
+    #超过上限的单个结果不缓存
+    cache.put("SELECT a FROM t4", result(100))
+    assert cache.get("SELECT a FROM t4") is None
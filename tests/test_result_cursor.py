@@ -0,0 +1,69 @@
+#----------------------大结果集分批读取---------------------------------
+import pytest
+from sqlalchemy import create_engine
+from result_cursor import ResultCursors
+
+ROWS = 500
+PAGE = 300
+BATCH = 50
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'cursor.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (id INTEGER, v INTEGER)")
+        connection.exec_driver_sql(f"WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {ROWS}) "
+                                   "INSERT INTO t SELECT i, i * 2 FROM n")
+    yield engine
+    engine.dispose()
+
+
+def test_streams_beyond_max_open(engine):
+    #结果顺序不确定，游标关闭后不能续读；第一页推送期间不应被其他查询淘汰
+    cursors = ResultCursors(engine, batch_size=BATCH, max_open=2)
+    streams = {}
+    for i in range(cursors.max_open + 3):
+        page = cursors.open(f"SELECT id, v FROM t WHERE id % {i + 2} >= 0", "s", PAGE)
+        streams[page["cursor"]] = len(page["rows"])
+    assert cursors.stats()["open"] == len(streams)
+    #轮流读取各游标第一页的其余部分
+    while any(read < PAGE for read in streams.values()):
+        for cursor_id, read in streams.items():
+            if read < PAGE:
+                streams[cursor_id] += len(cursors.fetch(cursor_id, "s", min(BATCH, PAGE - read))["rows"])
+    assert cursors.stats()["lost"] == 0
+    #第一页推送完后恢复按上限淘汰
+    assert cursors.stats()["open"] <= cursors.max_open
+
+
+def test_unpinned_cursor_is_evicted(engine):
+    cursors = ResultCursors(engine, batch_size=BATCH, max_open=1)
+    first = cursors.open("SELECT id FROM t", "s")
+    cursors.open("SELECT v FROM t", "s")
+    with pytest.raises(KeyError):
+        cursors.fetch(first["cursor"], "s")
+    assert cursors.stats()["lost"] == 1
+
+
+class _Interrupted:
+    def fetchmany(self, size):
+        raise TimeoutError("Query execution was interrupted, maximum statement execution time exceeded")
+
+
+def test_interrupted_read_reexecutes_resumable_cursor(engine):
+    #服务端超时中断读取时，按唯一键排序的游标重新执行并跳过已读取的行
+    cursors = ResultCursors(engine, batch_size=BATCH, unique_keys=lambda table: [{"id"}])
+    page = cursors.open("SELECT id FROM t ORDER BY id", "s")
+    cursors._cursors[page["cursor"]].result = _Interrupted()
+    batch = cursors.fetch(page["cursor"], "s")
+    assert batch["rows"][0] == [BATCH + 1]
+    assert cursors.stats()["reopened"] == 1
+
+
+def test_interrupted_read_of_unordered_cursor_fails(engine):
+    cursors = ResultCursors(engine, batch_size=BATCH, unique_keys=lambda table: [{"id"}])
+    page = cursors.open("SELECT id FROM t", "s")
+    cursors._cursors[page["cursor"]].result = _Interrupted()
+    with pytest.raises(TimeoutError):
+        cursors.fetch(page["cursor"], "s")
@@ -0,0 +1,84 @@
+#----------------------查询结果导出---------------------------------
+import asyncio
+import csv
+import io
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sqlalchemy import create_engine
+import settings
+import texttosql
+from result_export import ResultExport
+
+ROWS = 25
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'export.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE stock_basic (id INTEGER, name TEXT, pe REAL)")
+        connection.exec_driver_sql(f"WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {ROWS}) "
+                                   "INSERT INTO stock_basic SELECT i, '股票' || i, i * 1.5 FROM n")
+    yield engine
+    engine.dispose()
+
+
+def read_all(export):
+    export.open()
+    chunks = []
+    while (chunk := export.next_chunk()) is not None:
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+def test_csv(engine):
+    export = ResultExport(engine, "SELECT id, name FROM stock_basic WHERE name LIKE '%1%' ORDER BY id", 'csv', batch_size=4)
+    rows = list(csv.reader(io.StringIO(read_all(export).decode('utf-8-sig'))))
+    assert rows[0] == ['id', 'name']
+    assert rows[1] == ['1', '股票1']
+    assert len(rows) - 1 == export.rows == 12
+
+
+def test_arrow(engine):
+    export = ResultExport(engine, "SELECT id, pe FROM stock_basic ORDER BY id", 'arrow', batch_size=10)
+    table = pa.ipc.open_stream(read_all(export)).read_all()
+    assert table.column_names == ['id', 'pe']
+    assert table.num_rows == ROWS
+    assert table.column('pe')[1].as_py() == 3.0
+
+
+def test_parquet(engine):
+    export = ResultExport(engine, "SELECT id, name FROM stock_basic ORDER BY id", 'parquet', batch_size=10)
+    table = pq.read_table(io.BytesIO(read_all(export)))
+    assert table.num_rows == ROWS
+    assert table.column('name')[-1].as_py() == f'股票{ROWS}'
+
+
+def test_empty_result(engine):
+    export = ResultExport(engine, "SELECT id FROM stock_basic WHERE id < 0", 'parquet')
+    assert pq.read_table(io.BytesIO(read_all(export))).num_rows == 0
+
+
+class _Schema:
+    def table_columns(self):
+        return {"stock_basic": {"id", "name", "pe"}}
+
+
+def test_session_export_is_not_limited_to_the_chat_rows(engine, monkeypatch):
+    #会话中的查询只展示sql_default_limit条，导出需读取完整结果
+    monkeypatch.setattr(texttosql, "db", _Schema())
+    monkeypatch.setattr(texttosql, "read_engine", engine)
+    monkeypatch.setattr(settings, "rollup_enabled", False)
+    state = {"generated_sql": "SELECT name FROM stock_basic", "streaming_queue": [], "batch": False}
+
+    async def run():
+        async for _ in texttosql.validate_sql_node(state):
+            pass
+        await texttosql.sql_executor.run(texttosql.session_memory.append, "export-test", "q", state["session_sql"], "t")
+        export = await texttosql.open_export("export-test", "csv")
+        return b''.join([chunk async for chunk in texttosql.export_chunks(export)]), export
+    data, export = asyncio.run(run())
+    assert f"LIMIT {settings.sql_default_limit}" in state["generated_sql"]
+    assert export.rows == ROWS
+    assert len(data.decode('utf-8-sig').splitlines()) == ROWS + 1
@@ -0,0 +1,115 @@
+#----------------------汇总表改写的等价性---------------------------------
+import pytest
+import sqlglot
+from sqlalchemy import create_engine
+import fixture
+import settings
+from rollup import RollupDef, RollupManager, RollupRouter
+
+HITS = [
+    "SELECT b.industry, AVG(t.price) AS avg_price FROM stock_daily_trade_1 t JOIN stock_basic b ON b.stock_id = t.stock_id "
+    "GROUP BY b.industry",
+    "SELECT b.stock_name, SUM(t.turnover) AS turnover FROM stock_daily_trade_1 t JOIN stock_basic b ON b.stock_id = t.stock_id "
+    "GROUP BY b.stock_name ORDER BY turnover DESC LIMIT 10",
+    "SELECT d.trade_date, SUM(volume), COUNT(*) FROM stock_daily_trade_1 t JOIN trade_date d ON d.date_id = t.date_id "
+    "WHERE d.trade_date >= '2024-01-10' GROUP BY d.trade_date ORDER BY d.trade_date LIMIT 5",
+    "SELECT i.inst_type, COUNT(*) AS n, MAX(h.hold_ratio) FROM stock_inst_hold_3 h JOIN institution i ON h.inst_id = i.inst_id "
+    "GROUP BY i.inst_type",
+    "SELECT DATE_FORMAT(d.trade_date, '%Y-%m') AS m, b.industry, MAX(t.price) FROM stock_daily_trade_1 t "
+    "JOIN trade_date d ON d.date_id = t.date_id JOIN stock_basic b ON b.stock_id=t.stock_id GROUP BY m, b.industry ORDER BY m LIMIT 5",
+    "SELECT COUNT(*) FROM stock_daily_trade_1",
+    "SELECT b.industry, AVG(c.pe_ratio) pe FROM stock_market_cap_2 c JOIN stock_basic b ON b.stock_id = c.stock_id "
+    "WHERE c.date_id = 3 GROUP BY b.industry HAVING pe > 10 ORDER BY pe DESC",
+]
+
+#（SQL, 未命中原因）
+MISSES = [
+    ("SELECT b.stock_name, c.pe_ratio FROM stock_basic b JOIN stock_market_cap_2 c ON b.stock_id = c.stock_id "
+     "WHERE c.pe_ratio > 30 ORDER BY c.pe_ratio DESC LIMIT 20", "detail"),
+    ("SELECT b.industry, COUNT(DISTINCT t.stock_id) FROM stock_daily_trade_1 t JOIN stock_basic b ON b.stock_id = t.stock_id "
+     "GROUP BY b.industry", "distinct"),
+    ("SELECT t.stock_id, SUM(t.volume) FROM stock_daily_trade_1 t LEFT JOIN stock_basic b ON b.stock_id = t.stock_id "
+     "GROUP BY t.stock_id", "join"),
+    ("SELECT b.industry, SUM(t.price) FROM stock_daily_trade_1 t JOIN stock_basic b ON b.stock_id = t.stock_id "
+     "WHERE t.price > 10 GROUP BY b.industry", "dimension"),
+]
+
+
+@pytest.fixture(scope="module")
+def rollups(tmp_path_factory):
+    path = tmp_path_factory.mktemp("rollup") / "stock.db"
+    fixture.build(f"sqlite:///{path}", 50, 60)
+    engine = create_engine(f"sqlite:///{path}")
+    router = RollupRouter([RollupDef(**definition) for definition in settings.rollup_definitions])
+    manager = RollupManager(engine, router.rollups, router, interval=3600, enabled=False)
+    manager.enabled = True
+    status = manager.refresh()
+    assert all(rollup["error"] is None for rollup in status["rollups"].values())
+    yield engine, router
+    engine.dispose()
+
+
+def run(connection, sql):
+    result = connection.exec_driver_sql(sqlglot.transpile(sql, "mysql", "sqlite")[0])
+    rows = sorted(tuple(round(float(value), 4) if isinstance(value, (int, float)) else value for value in row)
+                  for row in result.fetchall())
+    return list(result.keys()), rows
+
+
+@pytest.mark.parametrize("sql", HITS)
+def test_rewrite_equivalent(rollups, sql):
+    engine, router = rollups
+    routed = router.route(sql)
+    assert routed is not None
+    with engine.connect() as connection:
+        assert run(connection, routed[0]) == run(connection, sql)
+
+
+@pytest.mark.parametrize("sql,reason", MISSES)
+def test_not_rewritten(rollups, sql, reason):
+    engine, router = rollups
+    before = router.stats()["miss_by_reason"].get(reason, 0)
+    assert router.route(sql) is None
+    assert router.stats()["miss_by_reason"][reason] == before + 1
+
+
+@pytest.fixture
+def manager(tmp_path):
+    path = tmp_path / "stock.db"
+    fixture.build(f"sqlite:///{path}", 20, 10)
+    engine = create_engine(f"sqlite:///{path}")
+    router = RollupRouter([RollupDef(**definition) for definition in settings.rollup_definitions])
+    manager = RollupManager(engine, router.rollups, router, interval=3600)
+    manager.refresh()
+    yield engine, manager
+    engine.dispose()
+
+
+def hold_rows(engine):
+    with engine.connect() as connection:
+        source = connection.exec_driver_sql("SELECT COUNT(*) FROM stock_inst_hold_3").scalar()
+        rollup = connection.exec_driver_sql("SELECT SUM(row_count) FROM rollup_hold_inst").scalar()
+    return source, rollup
+
+
+def test_named_refresh_keeps_other_stale_snapshots(manager):
+    #只刷新指定的汇总表时，其他快照表的待重算标记保留到下一次全量刷新
+    engine, manager = manager
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DELETE FROM stock_inst_hold_3 WHERE id = (SELECT MIN(id) FROM stock_inst_hold_3)")
+    manager.mark_stale(["stock_inst_hold_3"])
+    assert "rollup_hold_inst" not in manager.router.fresh
+    manager.refresh(name="rollup_trade_industry_day")
+    assert "rollup_hold_inst" not in manager.router.fresh
+    manager.refresh()
+    assert "rollup_hold_inst" in manager.router.fresh
+    source, rollup = hold_rows(engine)
+    assert rollup == source
+
+
+def test_mark_stale_does_not_wait_for_refresh(manager):
+    engine, manager = manager
+    with manager._refresh_lock:
+        #刷新进行中（持有刷新锁）时，请求线程中的mark_stale立即返回
+        manager.mark_stale(["stock_inst_hold_3"])
+    assert "rollup_hold_inst" not in manager.router.fresh
@@ -0,0 +1,43 @@
+#----------------------表结构裁剪---------------------------------
+import pytest
+from sqlalchemy import create_engine
+from schema_pruner import SchemaPruner
+
+
+class _Database:
+    schema_version = 1
+
+    def __init__(self, engine):
+        self._engine = engine
+
+    def get_usable_table_names(self):
+        return ["institution", "stock_basic", "stock_inst_hold", "stock_market_cap"]
+
+
+@pytest.fixture
+def pruner(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE stock_basic (stock_id INTEGER PRIMARY KEY, stock_name TEXT, industry TEXT)")
+        connection.exec_driver_sql("CREATE TABLE institution (inst_id INTEGER PRIMARY KEY, inst_name TEXT)")
+        connection.exec_driver_sql("CREATE TABLE stock_market_cap (stock_id INTEGER REFERENCES stock_basic(stock_id), "
+                                   "market_cap REAL, pe_ttm REAL)")
+        connection.exec_driver_sql("CREATE TABLE stock_inst_hold (stock_id INTEGER REFERENCES stock_basic(stock_id), "
+                                   "inst_id INTEGER REFERENCES institution(inst_id), hold_ratio REAL)")
+    yield SchemaPruner(_Database(engine), top_n=1, min_score=1.0)
+    engine.dispose()
+
+
+def test_selects_relevant_table_with_fk_closure(pruner):
+    assert pruner.select_tables("hold_ratio inst_name") == ["institution", "stock_basic", "stock_inst_hold"]
+
+
+def test_confident_question_keeps_last_sql_tables(pruner):
+    tables = pruner.select_tables("market_cap pe_ttm", "SELECT inst_name FROM institution")
+    assert tables == ["institution", "stock_basic", "stock_market_cap"]
+
+
+def test_low_confidence_question_uses_full_schema(pruner):
+    #与上一次无关、置信度不足的问题不能只给出上一次SQL的表
+    assert pruner.select_tables("今天天气怎么样", "SELECT inst_name FROM institution") is None
+    assert pruner.select_tables("今天天气怎么样") is None
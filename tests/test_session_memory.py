@@ -0,0 +1,83 @@
+#----------------------会话记忆---------------------------------
+import pytest
+import session_memory
+from session_memory import RECORD_OVERHEAD, SESSION_OVERHEAD, SessionMemory
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(session_memory.time, "monotonic", clock)
+    return clock
+
+
+def session_bytes(turns, last_sql):
+    return SESSION_OVERHEAD + sum(RECORD_OVERHEAD + sum(len(f.encode('utf-8')) for f in turn if f) for turn in turns) + \
+        len((last_sql or '').encode('utf-8'))
+
+
+def test_ring_buffer_keeps_last_turns(clock):
+    memory = SessionMemory(max_turns=3)
+    for i in range(5):
+        memory.append("s", f"问题{i}", f"SELECT {i}", f"t{i}")
+    history, last_sql = memory.load("s")
+    assert [turn["user_query"] for turn in history] == ["问题2", "问题3", "问题4"]
+    assert history[-1] == {"user_query": "问题4", "generated_sql": "SELECT 4", "timestamp": "t4"}
+    assert last_sql == "SELECT 4"
+    #被覆盖的轮次不再计入大小
+    turns = [(f"问题{i}", f"SELECT {i}", f"t{i}") for i in range(2, 5)]
+    assert memory.stats()["bytes"] == session_bytes(turns, "SELECT 4")
+
+
+def test_ttl_expiry(clock):
+    memory = SessionMemory(ttl=60)
+    memory.append("old", "q", "SELECT 1", "t")
+    clock.now += 30
+    memory.append("new", "q", "SELECT 2", "t")
+    clock.now += 31
+    assert memory.load("old") == ([], None)
+    assert memory.load("new")[1] == "SELECT 2"
+    #读取会刷新访问时间
+    clock.now += 59
+    assert memory.load("new")[1] == "SELECT 2"
+    stats = memory.stats()
+    assert stats["expired"] == 1 and stats["sessions"] == 1
+    clock.now += 61
+    assert memory.stats()["sessions"] == 0 and memory.stats()["bytes"] == 0
+
+
+def test_evicts_least_recently_used_over_max_sessions(clock):
+    memory = SessionMemory(max_sessions=2)
+    memory.append("a", "q", "SELECT 1", "t")
+    memory.append("b", "q", "SELECT 2", "t")
+    memory.load("a")
+    memory.append("c", "q", "SELECT 3", "t")
+    assert memory.load("b") == ([], None)
+    assert memory.load("a")[1] == "SELECT 1" and memory.load("c")[1] == "SELECT 3"
+    assert memory.stats()["evicted"] == 1
+
+
+def test_evicts_over_max_bytes_with_byte_accounting(clock):
+    turn = ("问题", "SELECT name FROM stock_basic", "t")
+    size = session_bytes([turn], turn[1])
+    memory = SessionMemory(max_bytes=size * 2)
+    memory.append("a", *turn)
+    memory.append("b", *turn)
+    assert memory.stats()["bytes"] == size * 2
+    #同一会话追加使总大小超出上限，淘汰最久未访问的会话
+    memory.append("b", "问题", "SELECT 1", "t")
+    stats = memory.stats()
+    assert memory.load("a") == ([], None)
+    assert stats["sessions"] == 1 and stats["evicted"] == 1
+    assert stats["bytes"] == session_bytes([turn, ("问题", "SELECT 1", "t")], "SELECT 1")
+    assert stats["bytes_per_session_max"] == stats["bytes"]
+    memory.clear("b")
+    assert memory.stats()["bytes"] == 0
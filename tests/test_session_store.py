@@ -0,0 +1,125 @@
+#----------------------会话记忆持久化存储---------------------------------
+import os
+import threading
+import time
+from session_store import SqlSessionStore
+
+
+def test_tables_created_on_first_use(tmp_path):
+    path = tmp_path / "session.db"
+    store = SqlSessionStore(f"sqlite:///{path}")
+    assert not os.path.exists(path)
+    assert store.load("s") == ([], None)
+    store.close()
+
+
+def test_lock_is_shared_between_stores(tmp_path):
+    #两个存储实例相当于两个worker进程
+    uri = f"sqlite:///{tmp_path / 'session.db'}"
+    first, second = SqlSessionStore(uri), SqlSessionStore(uri)
+    token = first.try_lock("s")
+    assert token is not None
+    assert second.try_lock("s") is None
+    other = second.try_lock("t")
+    assert other is not None
+    first.unlock("s", token)
+    assert second.try_lock("s") is not None
+    second.unlock("t", other)
+    assert second.stats()["lock_waits"] == 1
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'session.db'}"
+    first, second = SqlSessionStore(uri, lock_ttl=0), SqlSessionStore(uri)
+    stale = first.try_lock("s")
+    time.sleep(0.01)
+    token = second.try_lock("s")
+    assert token is not None
+    #过期的持有者释放时不影响新的持有者
+    first.unlock("s", stale)
+    assert first.try_lock("s") is None
+    second.unlock("s", token)
+
+
+def test_locked_turns_are_not_lost(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'session.db'}"
+    workers = [SqlSessionStore(uri, max_turns=50) for _ in range(4)]
+    #先建表，只测试会话锁下的并发读写（同时建表见test_concurrent_first_use）
+    for store in workers:
+        store.load("s")
+    errors = []
+
+    def turn(store, i):
+        try:
+            token = None
+            while token is None:
+                token = store.try_lock("s")
+                if token is None:
+                    time.sleep(0.001)
+            try:
+                history, _ = store.load("s")
+                store.append("s", f"q{len(history)}", f"SELECT {i}", "")
+            finally:
+                store.unlock("s", token)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=turn, args=(workers[i % 4], i)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    history, _ = workers[0].load("s")
+    assert [item["user_query"] for item in history] == [f"q{i}" for i in range(20)]
+
+
+def test_concurrent_first_use(tmp_path):
+    #多个worker同时第一次使用时都会建表，表已存在的失败视为成功
+    uri = f"sqlite:///{tmp_path / 'session.db'}"
+    workers = [SqlSessionStore(uri) for _ in range(8)]
+    barrier = threading.Barrier(len(workers))
+    errors = []
+
+    def first_use(store):
+        barrier.wait()
+        try:
+            store.load("s")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=first_use, args=(store,)) for store in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def test_more_locked_sessions_than_pool_size(tmp_path):
+    #持有会话锁不占用连接：同时持有锁的会话数超过连接池大小时，load/append仍能取得连接
+    store = SqlSessionStore(f"sqlite:///{tmp_path / 'session.db'}")
+    store.load("s")
+    pool = store._engine.pool
+    sessions = pool.size() + pool._max_overflow + 5
+    barrier = threading.Barrier(sessions, timeout=10)
+    errors = []
+
+    def turn(i):
+        try:
+            token = store.try_lock(f"s{i}")
+            assert token is not None
+            barrier.wait()
+            store.load(f"s{i}")
+            store.append(f"s{i}", "q", "SELECT 1", "")
+            store.unlock(f"s{i}", token)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=turn, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert store.stats()["sessions"] == sessions
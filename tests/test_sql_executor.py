@@ -0,0 +1,27 @@
+#----------------------SQL直接执行---------------------------------
+from sqlalchemy import create_engine
+from sqlalchemy.dialects.mysql.pymysql import MySQLDialect_pymysql
+from sqlalchemy.dialects.sqlite.pysqlite import SQLiteDialect_pysqlite
+from sql_executor import SqlExecutor, driver_sql
+
+SQL = "SELECT DATE_FORMAT(trade_date,'%Y-%m') AS m FROM stock_basic WHERE name LIKE '%银行%'"
+
+
+def test_percent_survives_pymysql_formatting():
+    #pymysql在没有参数时仍执行query % args（SQLAlchemy传入空字典）
+    escaped = driver_sql(SQL, MySQLDialect_pymysql())
+    assert escaped % {} == SQL
+
+
+def test_percent_unchanged_for_qmark_dialect():
+    assert driver_sql(SQL, SQLiteDialect_pysqlite()) == SQL
+
+
+def test_like_query_executes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'exec.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (name TEXT)")
+        connection.exec_driver_sql("INSERT INTO t VALUES ('xax'), ('b')")
+    result = SqlExecutor(engine).execute("SELECT name FROM t WHERE name LIKE '%a%'")
+    assert result["rows"] == [["xax"]]
+    engine.dispose()
@@ -0,0 +1,55 @@
+#----------------------SQL校验语料---------------------------------
+import logging
+import pytest
+import logger  # noqa: F401
+from bench_sql_validator import CORPUS, SCHEMA
+from sql_validator import validate_sql
+
+
+@pytest.mark.parametrize("sql,expected", CORPUS)
+def test_corpus(sql, expected):
+    validated, error = validate_sql(sql, SCHEMA)
+    assert (error is None) == expected, error
+
+
+def test_command_fallback_not_logged(caplog):
+    with caplog.at_level(logging.WARNING):
+        validate_sql("LOAD DATA INFILE '/tmp/x.csv' INTO TABLE stock_basic", SCHEMA)
+    assert not [record for record in caplog.records if record.name == "sqlglot"]
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM otherdb.stock_basic",
+    "SELECT * FROM information_schema.tables",
+    "SELECT b.stock_name FROM stock_basic b JOIN mysql.user u ON u.user = b.stock_name",
+    "SELECT * FROM def.text_to_sql.stock_basic",
+])
+def test_other_database_rejected(sql):
+    #白名单中存在同名的表时同样拒绝
+    schema = dict(SCHEMA, tables={"table_name"}, user={"user"})
+    validated, error = validate_sql(sql, schema, database="text_to_sql")
+    assert error is not None and "其他数据库" in error
+
+
+def test_connected_database_allowed():
+    validated, error = validate_sql("SELECT stock_name FROM text_to_sql.stock_basic", SCHEMA, database="text_to_sql")
+    assert error is None
+
+
+def test_schema_unavailable_fails_closed(monkeypatch):
+    import asyncio
+    import texttosql
+
+    def unavailable():
+        raise RuntimeError("数据库不可用")
+
+    monkeypatch.setattr(texttosql.db, "table_columns", unavailable)
+    state = {"generated_sql": "SELECT * FROM information_schema.tables", "streaming_queue": [], "retry_count": 0}
+
+    async def run():
+        async for item in texttosql.validate_sql_node(state):
+            pass
+        return await texttosql.sql_validate_route(state)
+
+    assert asyncio.run(run()) == "format_result"
+    assert state["sql_validation"] is False
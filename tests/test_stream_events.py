@@ -0,0 +1,37 @@
+#----------------------查询流式事件---------------------------------
+import base64
+import json
+import os
+import settings
+from stream_events import decode_sse, encode_sse
+
+
+def parse(message: bytes):
+    event, data, blank = message.decode('utf-8').split('\n', 2)
+    assert blank == '\n'
+    return event[len('event: '):], data[len('data: '):]
+
+
+def test_large_payload_round_trip():
+    rows = {"columns": ["stock_name", "pe"], "rows": [[f"股票{i}", i * 1.5] for i in range(5000)]}
+    size = len(json.dumps(rows, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+    assert size > settings.stream_compress_min_bytes
+    event, data = parse(encode_sse('rows', rows, settings.stream_compress_min_bytes))
+    assert event == 'rows'
+    wrapped = json.loads(data)
+    assert wrapped['encoding'] == 'gzip' and len(data) < size
+    assert decode_sse(data) == rows
+
+
+def test_small_payload_is_not_compressed():
+    event, data = parse(encode_sse('markdown', "共3条\n```", settings.stream_compress_min_bytes))
+    assert event == 'markdown'
+    assert data == '"共3条\\n```"'
+    assert decode_sse(data) == "共3条\n```"
+
+
+def test_incompressible_payload_is_sent_as_is():
+    #压缩加base64后没有变小
+    noise = base64.b85encode(os.urandom(2048)).decode('ascii')
+    _, data = parse(encode_sse('sql', noise, 1024))
+    assert decode_sse(data) == noise and json.loads(data) == noise
@@ -1,25 +1,121 @@
-from langchain_classic.agents import AgentType
-from langchain_classic.chains.sql_database.query import create_sql_query_chain
 from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits import SQLDatabaseToolkit,create_sql_agent
 from langgraph.graph import StateGraph,START,END
-from langgraph.checkpoint.memory import InMemorySaver
 from typing import Dict,List,Optional
 from langchain_core.prompts import PromptTemplate
 from typing_extensions import TypedDict
-import re,settings,traceback
+import re,os,settings,traceback,asyncio,uuid,json,weakref,threading,time
 from datetime import datetime
 from pydantic import BaseModel,Field
 from logger import logger
+from graph_registry import GraphRegistry
+from sqlalchemy import create_engine
+from schema_cache import CachedSQLDatabase
+from read_router import ReadRouter
+from schema_pruner import SchemaPruner
+from sql_executor import SqlExecutor,clean_sql,rows_to_markdown,exec_path_counter,is_interrupted
+from result_cache import ResultCache
+from result_cursor import ResultCursors
+from result_export import ResultExport
+from rollup import ROLLUP_PREFIX,RollupDef,RollupRouter,RollupManager
+from question_cache import QuestionCache
+from followup_rewriter import rewrite_follow_up
+from sql_validator import validate_sql
+from cost_guard import CostGuard,describe
+from chart_builder import build_chart
+from session_store import SqlSessionStore,create_session_memory
+from llm_gateway import LLMGateway,GatewayChatModel
+from llm_cache import LLMCache
+from tracing import LLMTracer,traced_node,start_trace,finish_trace,record_agent_iterations,record_retry,current_node
 
 #------------------------------全局设置-------------------------------------------------
-db=SQLDatabase.from_uri(settings.mysql_db_uri)
-llm=ChatOpenAI(model='qwen3-max', temperature=0)
-checkpoint=InMemorySaver()
+def engine_args(uri):
+    '''
+    连接池参数（SQLite本地调试时使用其默认连接池）
+    :param uri:
+    :return:
+    '''
+    if uri.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size':settings.sql_pool_size,
+        'max_overflow':settings.sql_max_overflow,
+        'pool_pre_ping':True,
+        'pool_recycle':3600,
+        #服务端查询超时：每个新连接都设置会话级max_execution_time，SQL直接执行与agent执行均受限
+        'connect_args':{'init_command':f'SET SESSION max_execution_time={int(settings.sql_max_execution_time)}'}
+    }
+#创建引擎不连接数据库
+primary_engine=create_engine(settings.mysql_db_uri,**engine_args(settings.mysql_db_uri))
+#只读副本：配置后只读查询按权重分配到主库与副本，未配置时read_engine即主库
+read_router=ReadRouter(primary_engine,
+                       [(replica['name'],create_engine(replica['uri'],**engine_args(replica['uri'])),replica.get('weight',1))
+                        for replica in settings.read_replicas],
+                       primary_weight=settings.primary_read_weight,check_interval=settings.replica_check_interval,
+                       watermark_sql=settings.replica_watermark_sql,max_lag=settings.replica_max_lag) if settings.read_replicas else None
+read_engine=read_router or primary_engine
+#SQL中允许的库名限定（主库与副本的库名相同；SQLite为main），带其他库名的表（如information_schema）校验时拒绝
+database_name=primary_engine.url.database if primary_engine.dialect.name=='mysql' else 'main'
+#导入时不连接数据库，表结构在启动预热或首次使用时加载；反射固定使用schema_node，agent执行的查询使用read_engine
+db=CachedSQLDatabase(read_router.engine(settings.schema_node) if read_router else primary_engine,
+                     check_interval=settings.schema_check_interval,hidden_table_prefix=ROLLUP_PREFIX,lazy=True,
+                     read_engine=read_engine)
+#LLM调用耗时、token与费用统计（流式调用时需开启stream_usage才会返回token用量）
+llm_tracer=LLMTracer(prompt_price=settings.llm_prompt_price,completion_price=settings.llm_completion_price)
+#LLM调用调度：并发上限、限速、相同调用合并与限流退避（重试由调度完成，关闭客户端自身的重试）
+llm_gateway=LLMGateway(max_concurrency=settings.llm_max_concurrency,rate=settings.llm_rate_limit,
+                       burst=settings.llm_rate_burst,max_retries=settings.llm_max_retries,
+                       backoff_base=settings.llm_backoff_base,backoff_max=settings.llm_backoff_max,
+                       low_priority_nodes=settings.llm_low_priority_nodes)
+#LLM响应缓存：temperature=0时相同的调用结果相同，命中时不再调用模型；也用于录制与离线回放
+llm_cache=LLMCache(settings.llm_cache_path,mode=settings.llm_cache_mode,max_bytes=settings.llm_cache_max_bytes,
+                   nodes=settings.llm_cache_nodes)
+llm=GatewayChatModel(model=ChatOpenAI(model='qwen3-max', temperature=0, stream_usage=True, max_retries=0),
+                     gateway=llm_gateway, response_cache=llm_cache if settings.llm_cache_mode!='off' else None,
+                     callbacks=[llm_tracer])
+#会话记忆：只保存每轮的问题与SQL，替代checkpointer保存完整的图状态；多worker部署时使用sqlite/mysql存储
+session_memory=create_session_memory(settings.session_backend,settings.session_store_uri,
+                                     max_turns=settings.session_max_turns,ttl=settings.session_ttl,
+                                     max_sessions=settings.session_max_sessions,max_bytes=settings.session_max_bytes,
+                                     lock_ttl=settings.session_lock_ttl)
+if settings.server_workers>1 and settings.session_backend=='memory':
+    logger.warning("多worker部署时进程内会话记忆无法共享，追问可能读取不到上一轮的SQL，请使用sqlite或mysql存储")
+#同一会话的请求串行处理，保证追问读取到上一轮的SQL
+session_locks=weakref.WeakValueDictionary()
+def session_lock(sid):
+    '''
+    获取会话锁（会话没有进行中的请求时自动释放）
+    :param sid:
+    :return:
+    '''
+    lock=session_locks.get(sid)
+    if lock is None:
+        lock=asyncio.Lock()
+        session_locks[sid]=lock
+    return lock
+async def lock_session_store(sid):
+    '''
+    在共享的会话存储上获取会话锁，使其他worker上同一会话的请求等待（进程内会话记忆只需进程内的锁）
+    :param sid:
+    :return: 锁的凭据，传给unlock_session_store；进程内会话记忆时为None
+    '''
+    if not isinstance(session_memory,SqlSessionStore):
+        return None
+    deadline=time.monotonic()+settings.session_lock_timeout
+    while True:
+        # 等待期间反复尝试，使用默认线程池，不占用查询的执行线程
+        token=await asyncio.to_thread(session_memory.try_lock,sid)
+        if token is not None:
+            return token
+        if time.monotonic()>=deadline:
+            raise TimeoutError("同一会话的上一轮请求仍在处理，请稍后重试")
+        await asyncio.sleep(settings.session_lock_poll)
+async def unlock_session_store(sid,token):
+    if token is not None:
+        await asyncio.to_thread(session_memory.unlock,sid,token)
 #----------------------------定义状态图-----------------------------------------------------
 class GraphState(TypedDict):
     user_query:str  #用户查询的问题
+    session_id: str  # 会话ID
     generated_sql: Optional[str]  # query生成的SQL
     sql_validation: bool  # SQL语法是否有效
     sql_error: Optional[str]  # SQL相关错误信息
@@ -32,20 +128,27 @@ class GraphState(TypedDict):
     has_echar_data:bool   #是否有echar数据
     conversation_history: List[Dict]  # 对话历史记录
     last_sql: Optional[str]  # 上一次执行的SQL
+    session_sql: Optional[str]  # 校验通过、未补充默认LIMIT的SQL，写入会话记录（导出时读取完整结果）
+    relevant_tables: Optional[List[str]]  # 裁剪后与问题相关的表，None表示完整表结构
+    sql_source: Optional[str]  # SQL来源：llm / question_cache / rewrite
+    sql_feedback: Optional[str]  # 上一次生成的SQL及其未通过校验的原因，重试时提供给LLM
+    chart_task: Optional[str]  # 后台LLM图表生成任务的标识
+    chart: bool  # 是否生成图表（批量查询不生成）
+    batch: bool  # 批量查询：一次读取完整结果（不使用服务端游标），不读写会话记忆
 #------------------------------获取对话历史------------------------------------------------
 async def get_conversation_history(state:GraphState):
     conversation_history_str=''
     if state.get("conversation_history"):
-        logger.info(f"对话历史记录数: {len(state['conversation_history'])}")
+        logger.debug("对话历史记录数: %d", len(state['conversation_history']))
         for item in state["conversation_history"]:
             conversation_history_str += f"用户: {item.get('user_query', '')}\n"
             if item.get('generated_sql'):
                 conversation_history_str += f"SQL: {item['generated_sql']}\n"
             conversation_history_str += "---\n"
-        logger.info(f"对话历史字符串: {conversation_history_str}")
+        #完整的对话历史只在开启DEBUG时按比例采样输出
+        logger.debug("对话历史字符串: %s", conversation_history_str, extra={'sample': True})
     else:
-        logger.warning("对话历史为空")
-    print(conversation_history_str)
+        logger.debug("对话历史为空")
     return conversation_history_str
 #------------------------------提取查询关键词中的返回数量------------------------------------
 def extract_top_k_from_query(query: str) -> int:
@@ -74,7 +177,7 @@ def extract_top_k_from_query(query: str) -> int:
     # 默认返回5
     return 5
 #-------------------------------定义变量---------------------------------
-query_top_k=5   #定义查询结果数量
+query_top_k=5   #默认查询结果数量（创建SQL生成链时使用，每次调用按问题传入top_k）
 #-----------------------------定义适合性评分----------------------------
 class DataNeedImage(BaseModel):
     # 定义binary_score字段，表示是否适合生成报表，取值为"yes"或"no"
@@ -102,7 +205,7 @@ sql_template='''
    用户需求：{input}
 '''
 
-sql_agent_template=f'''
+sql_agent_template='''
 你是一个SQL执行和校准专家。
 你的任务是：
     1. 检查SQL语法是否正确
@@ -112,7 +215,7 @@ sql_agent_template=f'''
     5. 返回清晰的查询结果，查询的结果用markdown格式返回
     6.对查询结果进行总结描述
     7. 深刻理解用户需求与表节构，可以参考历史对话
-        表结构：{db.get_table_info()}
+        表结构：{{table_info}}
         
 注意：
      1：充分理解表结构后，分析sql查询是否满足查询要求,如果不能满足查询需求，请修正 SQL
@@ -128,20 +231,95 @@ sql_prompt=PromptTemplate(
     input_variables=['input','table_info','top_k','conversation_history','last_sql'],
     template=sql_template,
 )
-sql_query_chain=create_sql_query_chain(llm=llm,db=db,prompt=sql_prompt,k=query_top_k)
-#----------------------------定义sqlagent负责校验执行-------------------------------------------
-#Sql Toolkit +Agent (校验执行Sql)
-toolkit=SQLDatabaseToolkit(db=db,llm=llm)
-sql_exec_agent=create_sql_agent(llm=llm,
-                                toolkit=toolkit,
-                                agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-                                verbose=False,
-                                handle_parsing_errors=True,
-                                max_iterations=5, #增加迭代次数，允许sqlagent修正sql
-                                return_intermediate_steps=True,
-                                #添加提示词
-                                prefix=sql_agent_template
- )
+#查询链与agent在启动预热或首次使用时创建（langchain agent相关模块导入较慢，不在导入时加载）
+sql_chains_lock=threading.Lock()
+sql_query_chain=None
+sql_exec_agent=None
+def build_sql_chains():
+    '''
+    创建SQL生成链与执行agent（只创建一次）
+    :return: (sql_query_chain, sql_exec_agent)
+    '''
+    global sql_query_chain,sql_exec_agent
+    with sql_chains_lock:
+        if sql_exec_agent is None:
+            from langchain_classic.agents import AgentType
+            from langchain_classic.chains.sql_database.query import create_sql_query_chain
+            from langchain_community.agent_toolkits import SQLDatabaseToolkit,create_sql_agent
+            sql_query_chain=create_sql_query_chain(llm=llm,db=db,prompt=sql_prompt,k=query_top_k)
+            #Sql Toolkit +Agent (校验执行Sql)
+            toolkit=SQLDatabaseToolkit(db=db,llm=llm)
+            #表结构通过table_info变量在每次调用时传入（裁剪后的表结构），agent只需创建一次
+            sql_exec_agent=create_sql_agent(llm=llm,
+                                            toolkit=toolkit,
+                                            agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+                                            verbose=False,
+                                            handle_parsing_errors=True,
+                                            max_iterations=5, #增加迭代次数，允许sqlagent修正sql
+                                            return_intermediate_steps=True,
+                                            #添加提示词
+                                            prefix=sql_agent_template
+             )
+    return sql_query_chain,sql_exec_agent
+#直接执行器：SQL可直接执行时跳过agent，仅在执行出错时由agent修正
+sql_executor=SqlExecutor(read_engine,max_rows=settings.sql_direct_max_rows,pool_size=settings.sql_pool_size,timeout=settings.sql_query_timeout)
+#大结果集分批读取：服务端游标按批读取，翻页从上次的位置继续
+result_cursors=ResultCursors(read_engine,batch_size=settings.sql_stream_batch_size,
+                             max_open=settings.sql_cursor_max_open,ttl=settings.sql_cursor_ttl,executor=sql_executor,
+                             unique_keys=db.unique_keys,max_execution_time=settings.sql_cursor_max_execution_time)
+stream_results=settings.sql_stream_enabled and settings.sql_exec_mode=='direct'
+#正在直接执行的SQL（按SQL文本），相同SQL的并发请求等待先执行的完成后读取结果缓存
+sql_inflight:Dict[str,asyncio.Event]={}
+#查询结果缓存：表数据变化（information_schema.UPDATE_TIME）时失效对应表的缓存
+result_cache=ResultCache(ttl=settings.result_cache_ttl,max_entries=settings.result_cache_max_entries,max_bytes=settings.result_cache_max_bytes)
+db.add_schema_listener(lambda database: result_cache.invalidate_tables(database.changed_tables))
+#执行前代价评估：预计扫描行数超出预算的SQL不执行
+cost_guard=CostGuard(read_engine,max_rows_examined=settings.cost_guard_max_rows)
+#汇总表：事实表的预聚合，直接执行的SQL可以由汇总表等价回答时改写执行
+rollup_router=RollupRouter([RollupDef(**definition) for definition in settings.rollup_definitions])
+rollup_manager=RollupManager(primary_engine,rollup_router.rollups,rollup_router,
+                             interval=settings.rollup_refresh_interval,enabled=settings.rollup_enabled)
+db.add_schema_listener(lambda database: rollup_manager.mark_stale(database.changed_tables))
+def cacheable(sql, result):
+    '''
+    结果能否写入结果缓存：由副本读取、且该副本在相关表最近一次数据变化后还没有检查过时不缓存，
+    避免落后的数据在result_cache_ttl内一直被返回
+    :param sql: 原SQL（按其引用的表判断）
+    :param result: 执行结果，node为执行查询的节点
+    :return:
+    '''
+    if read_router is None:
+        return True
+    return read_router.is_fresh(result.get("node"), result_cache.invalidated_at(sql))
+def route_rollup(sql, count=True):
+    '''
+    汇总表改写（仅direct模式）
+    :param sql: 已校验的SQL
+    :param count: 是否计入命中率
+    :return: (实际执行的SQL, 汇总表名或None)
+    '''
+    if not settings.rollup_enabled or settings.sql_exec_mode != 'direct':
+        return sql, None
+    return rollup_router.route(sql, count) or (sql, None)
+#----------------------------表结构裁剪-------------------------------------------
+schema_pruner=SchemaPruner(db,top_n=settings.schema_prune_top_n,min_score=settings.schema_prune_min_score)
+#----------------------------问题缓存-------------------------------------------
+#相同或近似的问题直接复用已校验执行成功的SQL，跳过LLM生成
+question_cache=QuestionCache(threshold=settings.question_cache_threshold,ttl=settings.question_cache_ttl,max_entries=settings.question_cache_max_entries)
+def question_schema_key(relevant_tables):
+    '''
+    问题缓存键中的表结构部分：表结构版本+裁剪结果
+    :param relevant_tables:
+    :return:
+    '''
+    return (db.schema_version,tuple(relevant_tables) if relevant_tables else None)
+def has_session_context(state):
+    '''
+    会话中是否已有上一次的SQL或对话历史（问题可能依赖上下文，不使用问题缓存）
+    :param state:
+    :return:
+    '''
+    return bool(state.get("last_sql") or state.get("conversation_history"))
 
 #----------------------------图节点处理--------------------------------------------------
 
@@ -159,25 +337,51 @@ async  def generate_sql_node(state:GraphState):
         state["streaming_queue"].append(state["streaming_progress"])
         yield state
         #生成 sql
+        #top_k随每次调用传入，不修改模块级的默认值（并发请求之间互不影响）
         top_k = extract_top_k_from_query(state["user_query"])
-        global query_top_k
-        query_top_k=top_k
 
         # 构建对话历史字符串
         conversation_history_str =await get_conversation_history(state)
         # 获取上一次的SQL
         last_sql = state.get("last_sql", "")
-        sql=''
-        async for chunk in sql_query_chain.astream({
-            'question': state['user_query'],
-            "table_info": db.get_table_info(),
-            "top_k": top_k,
-            "conversation_history": conversation_history_str,
-            "last_sql": last_sql
-        }):
-            sql += str(chunk)
-
-        generated_sql=sql.strip()
+        # 只携带与问题相关的表结构，置信度不足时为None（完整表结构）
+        relevant_tables = None
+        if settings.schema_prune_enabled:
+            relevant_tables = await sql_executor.run(schema_pruner.select_tables, state['user_query'], last_sql, db_time=False)
+        state["relevant_tables"] = relevant_tables
+        # 重试时不使用改写与问题缓存，避免反复得到同一条未通过校验的SQL
+        rewritten_sql = None
+        cached_sql = None
+        if settings.followup_rewrite_enabled and not state.get("retry_count"):
+            # 只修改LIMIT/排序方向/单个数值条件的追问，直接基于上一次的SQL改写
+            rewritten_sql = rewrite_follow_up(state['user_query'], last_sql)
+        if not rewritten_sql and settings.question_cache_enabled and not state.get("retry_count"):
+            cached_sql = question_cache.get(state['user_query'], top_k, question_schema_key(relevant_tables), has_session_context(state))
+        if rewritten_sql:
+            generated_sql = rewritten_sql
+            state["sql_source"] = "rewrite"
+            state["streaming_progress"] = "⚡ 识别为对上一次查询的调整，直接改写SQL"
+            state["streaming_queue"].append(state["streaming_progress"])
+        elif cached_sql:
+            generated_sql = cached_sql
+            state["sql_source"] = "question_cache"
+            state["streaming_progress"] = "⚡ 命中历史问题缓存，跳过SQL生成"
+            state["streaming_queue"].append(state["streaming_progress"])
+        else:
+            question = state['user_query']
+            if state.get("retry_count") and state.get("sql_feedback"):
+                question += f"\n{state['sql_feedback']}\n请修正上述问题后重新生成SQL"
+            sql=''
+            async for chunk in build_sql_chains()[0].astream({
+                'question': question,
+                "table_names_to_use": relevant_tables,
+                "top_k": top_k,
+                "conversation_history": conversation_history_str,
+                "last_sql": last_sql
+            }):
+                sql += str(chunk)
+            generated_sql=sql.strip()
+            state["sql_source"] = "llm"
         state["streaming_progress"] = "✅ SQL生成完成"
         state["streaming_queue"].append(state["streaming_progress"])
         state["generated_sql"] = generated_sql
@@ -193,6 +397,7 @@ async  def generate_sql_node(state:GraphState):
         logger.error(msg)
         yield state
 
+SCHEMA_UNAVAILABLE="无法获取表结构，暂时不能校验SQL，请稍后重试"
 async def validate_sql_node(state:GraphState):
     '''
     校验sql的合法性
@@ -206,22 +411,66 @@ async def validate_sql_node(state:GraphState):
         yield state
         return
     state['streaming_progress']='正在校验sql语句的合规性'
-    sql=state['generated_sql'].upper().strip()
-    dangerous_keywords = ['INSERT', 'UPDATE', 'DELETE', 'DROP', 'CREATE', 'ALTER']
-    for keyword in dangerous_keywords:
-        if keyword in sql:
-            state["streaming_progress"] = f"❌ SQL包含危险操作：{keyword}"
-            state["streaming_queue"].append(state["streaming_progress"])
-            state["sql_validation"] = False
-            state["sql_error"] = f"SQL包含危险操作：{keyword}"
-            yield state
-            return
-    # 如果sql_validation尚未被设置为False（即没有危险操作），则校验通过
-    if state['sql_validation'] != False:
-        state["streaming_progress"] = "✅ SQL语法校验通过，进入查询"
-        state["sql_validation"] = True
+    try:
+        schema = await sql_executor.run(db.table_columns, db_time=False)
+    except Exception as e:
+        # 获取字段信息失败时无法确认引用的表，不执行（也不重新生成）
+        logger.error(f"获取表字段信息失败：{str(e)}")
+        state["streaming_progress"] = f"❌ {SCHEMA_UNAVAILABLE}"
+        state["streaming_queue"].append(state["streaming_progress"])
+        state["sql_validation"] = False
+        state["sql_error"] = SCHEMA_UNAVAILABLE
+        yield state
+        return
+    # 分批读取时结果大小不影响内存占用，放宽LIMIT上限
+    sql, error = validate_sql(clean_sql(state['generated_sql']), schema, default_limit=settings.sql_default_limit,
+                              max_limit=settings.sql_stream_max_limit if stream_results and not state.get("batch") else settings.sql_max_limit,
+                              database=database_name)
+    if error:
+        state["streaming_progress"] = f"❌ SQL校验未通过：{error}"
         state["streaming_queue"].append(state["streaming_progress"])
+        state["sql_validation"] = False
+        state["sql_error"] = error
+        yield state
+        return
+    # 会话记录不带校验补充的默认LIMIT，导出时只受sql_export_max_rows限制
+    state["session_sql"] = clean_sql(state['generated_sql'])
+    state["generated_sql"] = sql
+    state["streaming_progress"] = "✅ SQL语法校验通过，进入查询"
+    state["sql_validation"] = True
+    state["streaming_queue"].append(state["streaming_progress"])
+    yield state
+async def check_cost_node(state:GraphState):
+    '''
+    执行前基于EXPLAIN评估查询代价，预计扫描行数超出预算时不执行
+    :param state:
+    :return:
+    '''
+    if not settings.cost_guard_enabled or not cost_guard.supported:
         yield state
+        return
+    state["streaming_progress"] = "📊 正在评估查询代价..."
+    state["streaming_queue"].append(state["streaming_progress"])
+    yield state
+    try:
+        # 评估实际执行的SQL（可以改写到汇总表时评估改写后的SQL）
+        sql, _ = route_rollup(clean_sql(state['generated_sql']), count=False)
+        estimate = await sql_executor.run(cost_guard.estimate, sql)
+    except Exception as e:
+        # EXPLAIN失败时不拦截，执行阶段会处理SQL错误
+        logger.warning(f"查询代价评估失败：{str(e)}")
+        yield state
+        return
+    feedback = cost_guard.check(estimate)
+    if feedback:
+        logger.warning(f"SQL代价超出预算：{feedback}，SQL：{state['generated_sql']}")
+        state["streaming_progress"] = f"❌ 查询代价过高：{feedback}"
+        state["sql_validation"] = False
+        state["sql_error"] = feedback
+    else:
+        state["streaming_progress"] = f"✅ {describe(estimate)}"
+    state["streaming_queue"].append(state["streaming_progress"])
+    yield state
 async def execute_sql_node(state:GraphState):
     '''
     执行sql
@@ -242,6 +491,89 @@ async def execute_sql_node(state:GraphState):
         state["streaming_progress"] = '🚀 正在执行SQL查询...'
         state["streaming_queue"].append(state["streaming_progress"])
         yield state
+        direct_error = None
+        if settings.sql_exec_mode == 'direct':
+            # 快速路径：直接执行生成的SQL，无需agent多轮调用
+            try:
+                sql = clean_sql(state['generated_sql'])
+                result = result_cache.get(sql) if settings.result_cache_enabled else None
+                rollup = None
+                inflight = None
+                if result is None and settings.result_cache_enabled:
+                    # 相同SQL正在执行时（批量查询、多人同时查询）等待其完成后读取结果缓存，不重复执行
+                    pending = sql_inflight.get(sql)
+                    if pending is not None:
+                        await pending.wait()
+                        result = result_cache.get(sql)
+                    if result is None and sql not in sql_inflight:
+                        inflight = sql_inflight[sql] = asyncio.Event()
+                # 执行前记录时间，执行期间表数据变化（结果缓存按表失效）时不写入缓存
+                started = time.time()
+                try:
+                    if result is None:
+                        # 结果缓存按原SQL存取（按原SQL引用的事实表失效），执行时使用汇总表
+                        run_sql, rollup = route_rollup(sql)
+                        if rollup:
+                            state["streaming_progress"] = f'📊 使用汇总表{rollup}'
+                            state["streaming_queue"].append(state["streaming_progress"])
+                            yield state
+                    if result is not None:
+                        state["streaming_progress"] = '⚡ 命中查询结果缓存'
+                        state["streaming_queue"].append(state["streaming_progress"])
+                    elif stream_results and not state.get("batch"):
+                        # 服务端游标只读取第一批，其余的由stream_sql_query继续推送或翻页读取
+                        result = await sql_executor.acall(result_cursors.open, run_sql, state["session_id"],
+                                                          settings.sql_stream_page_size)
+                        if settings.result_cache_enabled and not result["has_more"] and cacheable(sql, result):
+                            result_cache.put(sql, {"columns": result["columns"], "rows": result["rows"],
+                                                   "row_count": len(result["rows"]), "truncated": False}, started)
+                    else:
+                        result = await sql_executor.aexecute(run_sql)
+                        if settings.result_cache_enabled and cacheable(sql, result):
+                            result_cache.put(sql, result, started)
+                finally:
+                    if inflight is not None:
+                        sql_inflight.pop(sql, None)
+                        inflight.set()
+                # 表结构版本变化后读取列名会重建裁剪索引（反射全部表），不在事件循环中执行
+                labels = await sql_executor.run(schema_pruner.column_labels, db_time=False)
+                state["exec_result"] = {
+                    "raw_output": rows_to_markdown(result["columns"], result["rows"], labels),
+                    "columns": result["columns"],
+                    "rows": result["rows"],
+                    "cursor": result.get("cursor"),
+                    "has_more": result.get("has_more", False),
+                    "truncated": result.get("truncated", False),
+                    "rollup": rollup,
+                    "intermediate": [],
+                    "exec_path": "direct"
+                }
+                state['sql_error'] = None
+                exec_path_counter['direct'] += 1
+                if settings.question_cache_enabled and state.get("sql_source") == "llm":
+                    question_cache.put(state['user_query'], extract_top_k_from_query(state['user_query']),
+                                       question_schema_key(state.get("relevant_tables")), state['generated_sql'], has_session_context(state))
+                yield state
+                return
+            except Exception as e:
+                if is_interrupted(e):
+                    # 超时或被中断（max_execution_time、KILL QUERY）的查询不交给agent，否则会再次执行同样耗时的SQL
+                    exec_path_counter['interrupted'] += 1
+                    logger.warning(f"SQL执行超时或被中断：{str(e)}，SQL：{state['generated_sql']}")
+                    state["streaming_progress"] = '❌ 查询超时，已中断'
+                    state["streaming_queue"].append(state["streaming_progress"])
+                    state["exec_result"] = None
+                    state["sql_error"] = '查询耗时过长，已中断，请缩小查询范围（如增加日期、股票等筛选条件）'
+                    yield state
+                    return
+                direct_error = str(e)
+                exec_path_counter['agent_repair'] += 1
+                logger.warning(f"SQL直接执行失败，交由agent修正：{direct_error}")
+                state["streaming_progress"] = '🛠️ SQL执行出错，正在尝试修正...'
+                state["streaming_queue"].append(state["streaming_progress"])
+                yield state
+        else:
+            exec_path_counter['agent'] += 1
         conversation_history_str = await get_conversation_history(state)
         # 获取上一次的SQL
         last_sql = state.get("last_sql", "")
@@ -250,13 +582,18 @@ async def execute_sql_node(state:GraphState):
                  用户需求：{state['user_query']}    
                   历史对话： "conversation_history": {conversation_history_str},       
                 """
+        if direct_error:
+            sql_with_context += f"初始SQL执行报错：{direct_error}\n"
+        table_info = await sql_executor.run(db.get_table_info, state.get("relevant_tables"), db_time=False)
         #exec_result=sql_exec_agent.astream({'input':sql_with_context,'conversation_history': conversation_history_str,'last_sql': last_sql})
-        async for chunk in sql_exec_agent.astream({'input':sql_with_context,'conversation_history': conversation_history_str,'last_sql': last_sql}):
+        async for chunk in build_sql_chains()[1].astream({'input':sql_with_context,'table_info': table_info,'conversation_history': conversation_history_str,'last_sql': last_sql}):
             if isinstance(chunk,dict):
                 if 'output' in chunk:
+                    record_agent_iterations(len(chunk.get("intermediate_steps", [])))
                     state["exec_result"] = {
                         "raw_output": chunk['output'],
-                        "intermediate": chunk.get("intermediate_steps", [])
+                        "intermediate": chunk.get("intermediate_steps", []),
+                        "exec_path": "agent_repair" if direct_error else "agent"
                     }
                     state['sql_error'] = None
                     yield state
@@ -286,6 +623,16 @@ async def format_result_node(state:GraphState):
         state["streaming_progress"] = "🎨 正在格式化查询结果..."
         state["streaming_queue"].append(state["streaming_progress"])
         yield state
+        # 图表与结果格式化同时进行：结构化结果按规则直接生成，文本结果在后台由LLM生成
+        state["echarts"] = None
+        if settings.chart_enabled and state.get("chart", True):
+            exec_result = state["exec_result"]
+            if exec_result.get("rows"):
+                labels = await sql_executor.run(schema_pruner.column_labels, db_time=False)
+                state["echarts"] = build_chart(exec_result["columns"], exec_result["rows"], labels,
+                                               state["user_query"], settings.chart_max_points)
+            elif "rows" not in exec_result and settings.chart_llm_fallback and exec_result["raw_output"].strip():
+                state["chart_task"] = start_llm_chart(state["user_query"], exec_result["raw_output"])
 
         # 提取Agent的执行结果
         raw_output = state["exec_result"]["raw_output"]
@@ -294,7 +641,8 @@ async def format_result_node(state:GraphState):
         # 分析Agent的响应，提取有用的信息
         if not raw_output or raw_output.strip() == "":
             result_text = "未查询到符合条件的数据"
-        elif "error" in raw_output.lower():
+        elif "rows" not in state["exec_result"] and "error" in raw_output.lower():
+            # 只检查agent的文本结果；直接执行的结构化结果出错时不会进入这里，单元格中的“error”不是错误
             result_text = f"查询出现错误：{raw_output}"
         else:
             # 清理和格式化Agent的输出
@@ -308,28 +656,12 @@ async def format_result_node(state:GraphState):
         state["streaming_progress"] = "✅ 结果格式化完成"
         state["formatted_result"] = formatted
         state["streaming_queue"].append(state["streaming_progress"])
-        # 更新对话历史（在工作流节点中直接更新，让 checkpointer 自动保存）
-        history_conversation = state.get("conversation_history", [])
-        history_generated_sql = state.get("generated_sql")
-        # 创建新的对话记录
-        new_record = {
-            "user_query": state.get("user_query"),
-            "generated_sql": history_conversation,
-            "timestamp": str(datetime.now())
-        }
-        print('当前数据：',history_generated_sql)
-        print('更新数据：',new_record)
-        # 添加到对话历史（最多保留最近10条）
-        updated_history = history_conversation + [new_record]
-        print('更新数据：',updated_history)
-        if len(updated_history) > 10:
-            updated_history = updated_history[-10:]
-        # 更新状态
-        state["conversation_history"] = updated_history
-        state["last_sql"] = history_generated_sql
-        
-        logger.info(f"已保存对话记录，当前历史记录数: {len(updated_history)}")
-        
+        # 保存本轮对话（问题与SQL），超过session_max_turns时覆盖最早的一轮；
+        # 在释放会话锁前写入完成，同一会话的下一轮请求（可能由其他worker处理）读到的是本轮的记录
+        if not state.get("batch"):
+            await sql_executor.run(session_memory.append, state["session_id"], state.get("user_query"),
+                                   state.get("session_sql") or state.get("generated_sql"), str(datetime.now()))
+        state["last_sql"] = state.get("generated_sql")
         yield state
     except Exception as e:
         msg=traceback.format_exc()
@@ -348,6 +680,9 @@ async def retry_generate_sql_node(state:GraphState):
     state["streaming_progress"] = f"🔄 第{state['retry_count'] + 1}次重试生成SQL..."
     state["streaming_queue"].append(state["streaming_progress"])
     state["retry_count"] = state["retry_count"] + 1
+    record_retry()
+    if state.get("generated_sql"):
+        state["sql_feedback"] = f"上一次生成的SQL：{state['generated_sql']}\n未通过校验的原因：{state.get('sql_error')}"
     state["generated_sql"] = None  # 清空原有SQL
     state["sql_validation"] = False
     yield state
@@ -359,176 +694,344 @@ async def sql_validate_route(state:GraphState):
     :return:
     '''
     if state['sql_validation']==True:
-        return 'execute_sql'
-    elif state['retry_count']<=2:
+        return 'check_cost'
+    elif state['retry_count']<=2 and state.get('sql_error')!=SCHEMA_UNAVAILABLE:
         return 'retry_generate_sql'
     return 'format_result'
 
-async def gen_image_node(state:GraphState):
+async def cost_route(state:GraphState):
     '''
-    将查询结果处理为适合做echar数据报表的格式并生成对应的格式
+    代价评估后的路由：通过则执行，超出预算时按配置重新生成或直接结束
     :param state:
     :return:
     '''
-    try:
-        content=state['exec_result']['raw_output']
-        prompts=PromptTemplate.from_file('prompts/data_report_template.txt',encoding='utf-8')
-        chain=prompts|llm.with_structured_output(DataSchema)
-        result=await chain.ainvoke({'content':content})
-        echar=result.echar_data
-        state['echarts']=echar
-        yield state
-    except Exception as e:
-        msg=traceback.format_exc()
-        state['streaming_progress'] = f"❌ 生成图表失败：{str(e)}"
-        state['streaming_queue'].append(state['streaming_progress'])
-        logger.error(msg)
-        yield state
-async def after_query_route(state:GraphState):
+    if state['sql_validation']==True:
+        return 'execute_sql'
+    elif settings.cost_guard_action=='regenerate' and state['retry_count']<=2:
+        return 'retry_generate_sql'
+    return 'format_result'
+
+#图表提示词模板：解析后的链在进程内复用，文件修改（mtime变化）后重新读取
+chart_prompt_files={'grade':('prompts/prompt_template_grade.txt',DataNeedImage),
+                    'report':('prompts/data_report_template.txt',DataSchema)}
+chart_chains={}
+def load_chart_chains():
     '''
-    定义是否生成报表的动态路由
-    :param state:
+    读取并解析图表提示词，组装为结构化输出的链
+    :return: {'grade': 链, 'report': 链}
+    '''
+    chains={}
+    for name,(path,schema) in chart_prompt_files.items():
+        mtime=os.stat(path).st_mtime_ns
+        cached=chart_chains.get(name)
+        if cached is None or cached[0]!=mtime:
+            prompt=PromptTemplate.from_file(path,encoding='utf-8')
+            cached=chart_chains[name]=(mtime,prompt|llm.with_structured_output(schema))
+        chains[name]=cached[1]
+    return chains
+#LLM生成图表的后台任务，在格式化结果时启动，由gen_chart节点等待结果
+llm_chart_tasks:Dict[str,asyncio.Task]={}
+async def llm_chart(question,content):
+    '''
+    由LLM判断是否适合生成图表并生成ECharts配置，两次调用并发进行
+    :param question:
+    :param content:
     :return:
     '''
-    if state.get('has_echar_data'):
-        return 'gen_image'
-    else:
-        return END
-async def before_genimage_node(state:GraphState):
+    current_node.set('gen_chart')
+    chains=load_chart_chains()
+    grade,report=await asyncio.gather(
+        chains['grade'].ainvoke({'context':content,'question':question}),
+        chains['report'].ainvoke({'content':content})
+    )
+    return report.echar_data if grade.binary_score=='yes' else None
+def start_llm_chart(question,content):
     '''
-    查到数据后，是否适合生数据报表的
+    在后台启动LLM图表生成
+    :param question:
+    :param content:
+    :return: 任务标识
+    '''
+    task_id=str(uuid.uuid4())
+    task=asyncio.create_task(llm_chart(question,content))
+    llm_chart_tasks[task_id]=task
+    # 工作流被取消、未执行到gen_chart节点时也能释放
+    task.add_done_callback(lambda _: asyncio.get_running_loop().call_later(settings.chart_llm_timeout,llm_chart_tasks.pop,task_id,None))
+    return task_id
+async def gen_chart_node(state:GraphState):
+    '''
+    输出图表：规则生成的图表直接使用，否则等待后台LLM生成的结果
     :param state:
     :return:
     '''
-    try:
-        if state.get('exec_result') is None or state.get('exec_result').get('raw_output') is None:
-            state['has_echar_data']=False
-            state["streaming_queue"].append('无适当数据生成图表')
-        else:
-            execnode_data=state['exec_result']['raw_output']
-            questtion=state['user_query']
-            prompt=PromptTemplate.from_file('prompts/prompt_template_grade.txt',encoding='utf-8')
-            chain=prompt|llm.with_structured_output(DataNeedImage)
-            result=await chain.ainvoke({'context':execnode_data,'question':questtion})
-            isneed=result.binary_score
-            if isneed=='yes':
-                state['has_echar_data']=True
-                state["streaming_queue"].append('准备生成数据报表')
-            else:
-                state['has_echar_data']=False
-                state["streaming_queue"].append('不需要生成数据报表')
-        yield state
-    except Exception as e:
-        msg=traceback.format_exc()
-        state['streaming_progress'] = f"❌ 获取数据报表生成失败"
+    task=llm_chart_tasks.pop(state.get('chart_task') or '',None)
+    state['chart_task']=None
+    if not state.get('echarts') and task is not None:
+        state['streaming_progress']='📈 正在生成数据报表...'
         state['streaming_queue'].append(state['streaming_progress'])
-        logger.error(msg)
         yield state
+        try:
+            state['echarts']=await asyncio.wait_for(task,settings.chart_llm_timeout)
+        except Exception as e:
+            msg=traceback.format_exc()
+            state['streaming_progress'] = f"❌ 生成图表失败：{str(e)}"
+            state['streaming_queue'].append(state['streaming_progress'])
+            logger.error(msg)
+    if state.get('echarts'):
+        state['has_echar_data']=True
+        state["streaming_queue"].append('准备生成数据报表')
+    else:
+        state['has_echar_data']=False
+        state["streaming_queue"].append('无适当数据生成图表')
+    yield state
 
 #----------------------------定义工作流----------------------------------------------
 async def workflow():
     graph=StateGraph(GraphState)
-    #添加处理节点
-    graph.add_node('generate_sql', generate_sql_node)
-    graph.add_node('validate_sql',validate_sql_node)
-    graph.add_node('retry_generate_sql',retry_generate_sql_node)
-    graph.add_node('execute_sql',execute_sql_node)
-    graph.add_node('format_result',format_result_node)
-    graph.add_node('before_genimage', before_genimage_node)
-    graph.add_node('gen_image', gen_image_node)
+    #添加处理节点（记录每个节点的耗时）
+    graph.add_node('generate_sql',traced_node('generate_sql',generate_sql_node))
+    graph.add_node('validate_sql',traced_node('validate_sql',validate_sql_node))
+    graph.add_node('check_cost',traced_node('check_cost',check_cost_node))
+    graph.add_node('retry_generate_sql',traced_node('retry_generate_sql',retry_generate_sql_node))
+    graph.add_node('execute_sql',traced_node('execute_sql',execute_sql_node))
+    graph.add_node('format_result',traced_node('format_result',format_result_node))
+    graph.add_node('gen_chart',traced_node('gen_chart',gen_chart_node))
     #添加边
     graph.add_edge(START,'generate_sql')
     # #生成sql->检验sql
     graph.add_edge('generate_sql','validate_sql')
     # #动态路由，根据校验的结果进行下一步动作的判断,(执行，重试，结束)
-    graph.add_conditional_edges('validate_sql',sql_validate_route,{'execute_sql':'execute_sql',
+    graph.add_conditional_edges('validate_sql',sql_validate_route,{'check_cost':'check_cost',
                                                                    'retry_generate_sql':'retry_generate_sql',
                                                                    'format_result':'format_result'})
+    # #代价评估->执行/重新生成/结束
+    graph.add_conditional_edges('check_cost',cost_route,{'execute_sql':'execute_sql',
+                                                         'retry_generate_sql':'retry_generate_sql',
+                                                         'format_result':'format_result'})
     # #重试->>生成sql
     graph.add_edge('retry_generate_sql','generate_sql')
     # #执行sql->格式化结果
     graph.add_edge('execute_sql','format_result')
-    graph.add_edge('format_result','before_genimage')
-    graph.add_conditional_edges('before_genimage',after_query_route,{'gen_image':'gen_image',END:END})
-    # 启用 checkpoint 记忆功能
-    return graph.compile(checkpointer=checkpoint)
+    graph.add_edge('format_result','gen_chart')
+    graph.add_edge('gen_chart',END)
+    # 对话记忆由session_memory保存，工作流本身不保存状态
+    return graph.compile()
+#编译后的工作流在进程内共享（图表提示词文件变化时由load_chart_chains重新加载，无需重新编译）
+graph_registry=GraphRegistry(workflow)
+#----------------------------启动预热------------------------------------------------
+def warm_schema():
+    '''
+    加载表结构并填充建表语句与字段缓存
+    :return:
+    '''
+    db.load()
+    db.table_columns()
+    db.get_table_info()
+async def warm_up(state):
+    '''
+    启动预热（在lifespan的后台任务中执行）：加载表结构并构建裁剪索引、解析提示词、创建查询链、编译工作流，
+    之后启动汇总表刷新；预热完成前到达的请求按需加载
+    :param state: startup.StartupState，记录各步骤耗时
+    :return:
+    '''
+    await state.step('schema',warm_schema)
+    await state.step('schema_pruner',schema_pruner.column_labels)
+    await state.step('prompts',load_chart_chains)
+    await state.step('sql_chains',build_sql_chains)
+    await state.step('graph',graph_registry.get)
+    start_services()
+def start_services():
+    '''
+    启动需要连接数据库的后台任务（汇总表刷新、副本检查）
+    :return:
+    '''
+    rollup_manager.start()
+    if read_router:
+        read_router.start()
 #----------------------------查询接口------------------------------------------------
-async  def stream_sql_query(user_query, sid=1):
+async def stream_page(cursor_id, sid, size=None):
+    '''
+    从游标上次的位置按批读取一页，每批输出一个rows事件
+    :param cursor_id:
+    :param sid: 会话ID，只能读取本会话的游标
+    :param size: 行数，默认sql_stream_page_size
+    :return:
+    '''
+    remaining=size or settings.sql_stream_page_size
+    while remaining>0:
+        batch=await sql_executor.run(result_cursors.fetch,cursor_id,str(sid),min(remaining,settings.sql_stream_batch_size))
+        remaining-=len(batch['rows'])
+        yield 'rows', {'cursor': batch['cursor'], 'offset': batch['offset'], 'rows': batch['rows'],
+                       'has_more': batch['has_more'], 'page_done': remaining<=0 or not batch['has_more']}
+        if not batch['has_more']:
+            break
+async def stream_query_page(cursor_id, sid, size=None):
+    '''
+    翻页：从游标上次的位置继续读取一页，无需重新生成和执行SQL（游标已关闭时重新执行查询并跳过已读取的行）
+    :param cursor_id:
+    :param sid:
+    :param size:
+    :return:
+    '''
+    try:
+        async for event in stream_page(cursor_id, sid, size):
+            yield event
+        yield 'done', {'cursor': cursor_id}
+    except KeyError as e:
+        yield 'error', {'message': e.args[0]}
+    except Exception as e:
+        logger.error(traceback.format_exc())
+        yield 'error', {'message': f"读取查询结果出错: {str(e)}"}
+async def open_export(sid, fmt, cursor_id=None):
+    '''
+    导出查询结果：重新执行会话上一次的SQL（或游标对应的SQL），不经过LLM
+    :param sid: 会话ID
+    :param fmt: 导出格式
+    :param cursor_id: 查询结果的游标，为空时导出会话上一次执行的SQL
+    :return: 已执行查询的ResultExport，由调用方按批读取并关闭
+    '''
+    if cursor_id:
+        # 游标对应的SQL是服务端校验（及改写）后实际执行的SQL
+        sql = result_cursors.sql(cursor_id, str(sid))
+    else:
+        _, sql = await sql_executor.run(session_memory.load, str(sid))
+        if not sql:
+            raise KeyError("当前会话没有可导出的查询，请先查询")
+        schema = await sql_executor.run(db.table_columns, db_time=False)
+        # 会话记录的SQL已经校验过（不含校验时补充的默认LIMIT），这里再校验一次保证只读，并限制导出行数
+        sql, error = validate_sql(clean_sql(sql), schema, default_limit=settings.sql_export_max_rows,
+                                  max_limit=settings.sql_export_max_rows, database=database_name)
+        if error:
+            raise ValueError(error)
+        sql, _ = route_rollup(sql)
+    export = ResultExport(read_engine, sql, fmt, batch_size=settings.sql_export_batch_size,
+                          max_execution_time=settings.sql_export_max_execution_time)
+    await sql_executor.run(export.open)
+    return export
+async def export_chunks(export):
+    '''
+    按批读取并编码导出结果，结束或中断时释放连接
+    :param export:
+    :return:
+    '''
+    try:
+        while True:
+            data = await sql_executor.run(export.next_chunk)
+            if data is None:
+                break
+            if data:
+                yield data
+        logger.info(f"导出完成：{export.fmt}，{export.rows}行")
+    except Exception:
+        logger.error(traceback.format_exc())
+        raise
+    finally:
+        export.close()
+async  def stream_sql_query(user_query, sid=1, chart=True, batch=False):
     '''
-    调用工作流进行查询处理
+    调用工作流进行查询处理，按处理进度输出(事件类型, 数据)，事件类型见stream_events.EVENT_TYPES
     :param user_query: 用户查询问题
     :param sid: 会话ID，用于记忆功能
+    :param chart: 是否生成图表
+    :param batch: 批量查询的一个问题：结果一次读取（可进入结果缓存，相同SQL只执行一次），不读写会话记忆
     :return:
     '''
     # user_query='查询市盈率（TTM）大于 30 的股票名称、市盈率、持仓机构名称、持仓占比及持仓成本，按市盈率降序排序。查找前20条数据'
-    yield f'开始处理,用户问题：{user_query}\n'
-    yield '-'*50+'\n'
-    sqlflag=False
-    graph_agent=await workflow()
+    yield 'progress', {'message': f'开始处理,用户问题：{user_query}'}
+    graph_agent=await graph_registry.get()
     # graph_agent.get_graph().draw_png('workflow.png')
-    yield "工作流已编译完成，开始流程任务\n"
-    # 配置 thread_id 用于记忆功能
+    yield 'progress', {'message': "工作流已编译完成，开始流程任务"}
     config = {
         "configurable": {
             "thread_id": str(sid)
         }
     }
 
-    # # 初始状态（不包含 conversation_history 和 last_sql，让 checkpointer 自动恢复）
-    current_state = {
-        "user_query": user_query,
-        "generated_sql": None,
-        "sql_validation": None,
-        "sql_error": None,
-        "exec_result": None,
-        "formatted_result": None,
-        "retry_count": 0,
-        "streaming_queue": [],
-        "streaming_progress": "",
-        "echarts":None,
-        "has_echar_data":None
-    }
-    
-    # 用于跟踪已经输出过的消息，防止重复输出
-    previous_progress = set()
-    
-    # 处理工作流的流式输出
-    yield "开始执行工作流...\n"
+    # 同一会话的请求串行处理：等上一轮保存对话记录后再读取；共享的会话存储上再加锁，其他worker上的同一会话同样等待
+    lock=session_lock(str(sid))
+    await lock.acquire()
+    stream=None
+    store_lock=None
+    trace=start_trace(str(sid),user_query)
     try:
-        async for state in graph_agent.astream(current_state, config=config, stream_mode="updates"):
+        if not batch:
+            store_lock=await lock_session_store(str(sid))
+        # 初始状态，对话历史与上一次的SQL从会话记忆中读取
+        conversation_history, last_sql = ([], None) if batch else await sql_executor.run(session_memory.load, str(sid))
+        current_state = {
+            "user_query": user_query,
+            "session_id": str(sid),
+            "conversation_history": conversation_history,
+            "last_sql": last_sql or "",
+            "generated_sql": None,
+            "sql_validation": None,
+            "sql_error": None,
+            "exec_result": None,
+            "formatted_result": None,
+            "retry_count": 0,
+            "streaming_queue": [],
+            "streaming_progress": "",
+            "echarts":None,
+            "has_echar_data":None,
+            "relevant_tables":None,
+            "sql_source":None,
+            "sql_feedback":None,
+            "chart_task":None,
+            "chart":chart,
+            "batch":batch
+        }
+
+        # 各节点在同一个streaming_queue上追加进度消息，只输出新追加的部分
+        sent_progress=0
+        sent_sql=None
+        sent_result=False
+        yield 'progress', {'message': "开始执行工作流..."}
+        stream=graph_agent.astream(current_state, config=config, stream_mode="updates")
+        async for state in stream:
             for node_name, node_states in state.items():
-                if isinstance(node_states, dict) and node_states.get("streaming_progress"):
-                    if  node_states.get("streaming_queue"):
-                        all_node_state=node_states.get("streaming_queue")
-                        for item_node_state in all_node_state:
-                            # 只输出之前没有输出过的消息
-                            if item_node_state not in previous_progress:
-                                yield item_node_state
-                                previous_progress.add(item_node_state)
-                if sqlflag==False:
-                    if isinstance(node_states, dict):
-                        if node_states.get('generated_sql'):
-                            yield f"首次生成的SQL: {node_states.get('generated_sql')}\n"
-                            sqlflag=True
-                # 检查是否有echarts数据，并且has_echar_data为True
-                if isinstance(node_states, dict) and node_states.get('echarts') and node_states.get('has_echar_data'):
-                    echarts = node_states.get('echarts')
-                    print(echarts)
-                    yield f"{echarts}\n"
-                # 返回has_echar_data字段，前端根据该字段判断是否需要生成数据报表
-                if isinstance(node_states, dict) and 'has_echar_data' in node_states:
-                    yield {'has_echar_data': node_states.get('has_echar_data')}
-            # 获取格式化结果
-            format_result = None
-            if 'format_result' in state:
-                format_result = state['format_result'].get('formatted_result')
-            elif 'formatted_result' in state:
-                format_result = state.get('formatted_result')
-            if format_result:
-                yield f"{format_result}\n"
-        
-        yield "工作流执行完成。\n"
+                if not isinstance(node_states, dict):
+                    continue
+                queue=node_states.get("streaming_queue") or []
+                for message in queue[sent_progress:]:
+                    yield 'progress', {'message': message}
+                sent_progress=max(sent_progress,len(queue))
+                # 每次生成（含重试）的SQL，校验时的改写不再重复输出
+                sql=node_states.get('generated_sql')
+                if node_name=='generate_sql' and sql and sql!=sent_sql:
+                    yield 'sql', {'sql': sql, 'attempt': node_states.get('retry_count', 0)+1}
+                    sent_sql=sql
+                # 结构化结果以rows输出，由前端渲染表格；agent的文本结果与失败信息以markdown输出
+                if node_name=='format_result' and node_states.get('formatted_result') and not sent_result:
+                    exec_result=node_states.get('exec_result') or {}
+                    if exec_result.get('rows'):
+                        # 分批读取时接着推送第一页的其余部分
+                        remaining=settings.sql_stream_page_size-len(exec_result['rows']) if exec_result.get('has_more') else 0
+                        labels=await sql_executor.run(schema_pruner.column_labels,db_time=False)
+                        yield 'rows', {'columns': exec_result['columns'],
+                                       'labels': [labels.get(column) or column for column in exec_result['columns']],
+                                       'rows': exec_result['rows'], 'offset': 0, 'cursor': exec_result.get('cursor'),
+                                       'has_more': exec_result.get('has_more', False), 'truncated': exec_result.get('truncated', False),
+                                       'page_done': remaining<=0}
+                        if remaining>0:
+                            async for event in stream_page(exec_result['cursor'], str(sid), remaining):
+                                yield event
+                    else:
+                        yield 'markdown', {'content': node_states['formatted_result']}
+                    sent_result=True
+                # 只有适合生成图表时才输出chart事件
+                if node_name=='gen_chart' and node_states.get('has_echar_data') and node_states.get('echarts'):
+                    yield 'chart', {'option': node_states['echarts']}
+
+        yield 'done', {'request_id': trace.request_id}
     except Exception as e:
-        msg=traceback.format_exc()
-        logger.error(msg)
-        yield f"工作流执行出错: {msg}\n"
+        logger.error(traceback.format_exc())
+        yield 'error', {'message': f"工作流执行出错: {str(e)}", 'request_id': trace.request_id}
+    finally:
+        # 调用方提前关闭（客户端断开）时取消仍在执行的节点
+        if stream is not None:
+            await stream.aclose()
+        try:
+            await unlock_session_store(str(sid),store_lock)
+        finally:
+            lock.release()
+        finish_trace(trace,settings.trace_dump_dir,settings.trace_slow_seconds)
@@ -0,0 +1,346 @@
+#----------------------请求链路追踪与指标---------------------------------
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+from langchain_core.callbacks import BaseCallbackHandler
+from logger import logger,add_log_context,add_drop_listener
+
+#当前请求的追踪记录与正在执行的节点，随asyncio任务及LangChain的执行线程传递
+current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+current_node: contextvars.ContextVar = contextvars.ContextVar("current_node", default="")
+
+
+def _log_context() -> Dict:
+    '''
+    日志记录携带当前请求、会话ID与节点
+    :return:
+    '''
+    trace = current_trace.get()
+    if trace is None:
+        return {"node": current_node.get()}
+    return {"request_id": trace.request_id, "session_id": trace.session_id, "node": current_node.get()}
+
+
+add_log_context(_log_context)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    '''
+    Prometheus计数器（文本格式输出，无需额外依赖）
+    '''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge:
+    '''
+    Prometheus仪表（文本格式输出，无需额外依赖）
+    '''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    '''
+    Prometheus直方图（文本格式输出，无需额外依赖）
+    '''
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            # [各桶计数..., 总和, 总数]
+            data = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, data in self._values.items():
+                for index, bound in enumerate(self.buckets):
+                    labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {data[index]}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {data[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {data[-2]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {data[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("text2sql_request_seconds", "整个请求的耗时（秒）")
+NODE_SECONDS = Histogram("text2sql_node_seconds", "工作流节点耗时（秒）", ("node",))
+LLM_SECONDS = Histogram("text2sql_llm_seconds", "LLM调用耗时（秒）", ("node",))
+LLM_TOKENS = Counter("text2sql_llm_tokens_total", "LLM消耗的token数", ("node", "type"))
+LLM_COST = Counter("text2sql_llm_cost_total", "LLM调用费用（元）", ("node",))
+DB_SECONDS = Histogram("text2sql_db_seconds", "数据库调用耗时（秒）", ("op",))
+AGENT_ITERATIONS = Histogram("text2sql_agent_iterations", "SQL agent每次执行的迭代次数", buckets=COUNT_BUCKETS)
+RETRIES = Histogram("text2sql_retries", "每个请求重新生成SQL的次数", buckets=COUNT_BUCKETS)
+LLM_QUEUE_DEPTH = Gauge("text2sql_llm_queue_depth", "等待LLM调用名额的请求数", ("lane",))
+LLM_INFLIGHT = Gauge("text2sql_llm_inflight", "进行中的LLM调用数")
+LLM_CONCURRENCY_LIMIT = Gauge("text2sql_llm_concurrency_limit", "当前的LLM并发上限（限流时自动降低）")
+LLM_QUEUE_SECONDS = Histogram("text2sql_llm_queue_seconds", "LLM调用排队等待时间（秒）", ("lane",))
+LLM_COALESCED = Counter("text2sql_llm_coalesced_total", "与进行中的相同LLM调用合并的次数")
+LLM_RATE_LIMITED = Counter("text2sql_llm_rate_limited_total", "LLM服务返回限流（429）的次数")
+ROLLUP_ROUTES = Counter("text2sql_rollup_routes_total", "直接执行的查询改写到汇总表的次数（miss为未命中）", ("result",))
+LLM_CACHE = Counter("text2sql_llm_cache_total", "LLM响应缓存的命中、未命中与写入次数", ("result",))
+STARTUP_SECONDS = Gauge("text2sql_startup_seconds", "启动耗时（秒）：import=应用导入，warmup=预热合计，其余为各预热步骤", ("phase",))
+DB_ROUTES = Counter("text2sql_db_routes_total", "只读查询分配到各数据库节点（主库、副本）的连接数", ("node",))
+LOG_DROPPED = Counter("text2sql_log_dropped_total", "日志队列已满（写入线程跟不上）时丢弃的日志条数")
+REGISTRY = [REQUEST_SECONDS, NODE_SECONDS, LLM_SECONDS, LLM_TOKENS, LLM_COST, DB_SECONDS, AGENT_ITERATIONS, RETRIES,
+            LLM_QUEUE_DEPTH, LLM_INFLIGHT, LLM_CONCURRENCY_LIMIT, LLM_QUEUE_SECONDS, LLM_COALESCED, LLM_RATE_LIMITED,
+            ROLLUP_ROUTES, LLM_CACHE, STARTUP_SECONDS, DB_ROUTES, LOG_DROPPED]
+add_drop_listener(LOG_DROPPED.inc)
+
+
+def render_metrics() -> str:
+    '''
+    以Prometheus文本格式输出全部指标
+    :return:
+    '''
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class RequestTrace:
+    '''
+    单个请求的追踪记录：各节点、LLM、数据库调用的耗时与token消耗
+    '''
+
+    def __init__(self, session_id: str, user_query: str = ""):
+        self.request_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.user_query = user_query
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans: List[Dict] = []
+        self.totals = {"llm_seconds": 0.0, "db_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                       "cost": 0.0, "llm_calls": 0, "db_calls": 0, "agent_iterations": 0, "retries": 0}
+        self.seconds = None
+
+    def add_span(self, kind: str, name: str, seconds: float, **extra):
+        with self._lock:
+            self.spans.append(dict(kind=kind, name=name, offset=round(time.perf_counter() - self._start - seconds, 4),
+                                   seconds=round(seconds, 4), **extra))
+
+    def add(self, **amounts):
+        with self._lock:
+            for key, amount in amounts.items():
+                self.totals[key] += amount
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "session_id": self.session_id,
+                "user_query": self.user_query,
+                "started": self.started,
+                "seconds": self.seconds,
+                "totals": dict(self.totals),
+                "spans": list(self.spans),
+            }
+
+
+def start_trace(session_id: str, user_query: str = "") -> RequestTrace:
+    '''
+    开始追踪一个请求（设置到当前上下文，之后创建的节点任务均可获取）
+    :param session_id:
+    :param user_query:
+    :return:
+    '''
+    trace = RequestTrace(session_id, user_query)
+    current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace: RequestTrace, dump_dir: Optional[str] = None, slow_seconds: float = 0):
+    '''
+    结束追踪：记录请求耗时与重试次数，耗时超过slow_seconds时将追踪记录写入dump_dir
+    :param trace:
+    :param dump_dir: 为空时不写文件
+    :param slow_seconds:
+    :return:
+    '''
+    trace.seconds = time.perf_counter() - trace._start
+    REQUEST_SECONDS.observe(trace.seconds)
+    RETRIES.observe(trace.totals["retries"])
+    if dump_dir and trace.seconds >= slow_seconds:
+        try:
+            os.makedirs(dump_dir, exist_ok=True)
+            path = os.path.join(dump_dir, f"{time.strftime('%Y%m%d%H%M%S')}_{trace.request_id}.json")
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(trace.to_dict(), file, ensure_ascii=False, indent=2, default=str)
+        except OSError as e:
+            logger.warning(f"写入追踪记录失败：{str(e)}")
+
+
+def traced_node(name: str, node):
+    '''
+    包装工作流节点（异步生成器），记录节点耗时
+    :param name:
+    :param node:
+    :return:
+    '''
+    async def wrapper(state):
+        current_node.set(name)
+        start = time.perf_counter()
+        try:
+            async for item in node(state):
+                yield item
+        finally:
+            seconds = time.perf_counter() - start
+            NODE_SECONDS.observe(seconds, node=name)
+            trace = current_trace.get()
+            if trace is not None:
+                trace.add_span("node", name, seconds)
+    wrapper.__name__ = getattr(node, "__name__", name)
+    return wrapper
+
+
+def record_db(op: str, seconds: float, trace: Optional[RequestTrace] = None):
+    '''
+    记录一次数据库调用
+    :param op: 调用类型（execute、estimate、get_table_info等）
+    :param seconds:
+    :param trace: 在线程中调用时需显式传入
+    :return:
+    '''
+    DB_SECONDS.observe(seconds, op=op)
+    trace = trace or current_trace.get()
+    if trace is not None:
+        trace.add(db_seconds=seconds, db_calls=1)
+        trace.add_span("db", op, seconds)
+
+
+def record_agent_iterations(iterations: int):
+    AGENT_ITERATIONS.observe(iterations)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(agent_iterations=iterations)
+
+
+def record_retry():
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(retries=1)
+
+
+class LLMTracer(BaseCallbackHandler):
+    '''
+    LangChain回调：记录每次LLM调用的耗时、token数与费用，按调用所在的工作流节点归类
+    '''
+    # 在事件循环中同步执行，保证能读取到当前请求的上下文
+    run_inline = True
+
+    def __init__(self, prompt_price: float = 0.0, completion_price: float = 0.0):
+        '''
+        :param prompt_price: 每千输入token的价格（元）
+        :param completion_price: 每千输出token的价格（元）
+        '''
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self._starts: Dict = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._starts[run_id] = (time.perf_counter(), current_node.get(), current_trace.get())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._starts[run_id] = (time.perf_counter(), current_node.get(), current_trace.get())
+
+    @staticmethod
+    def _usage(response) -> Tuple[int, int]:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage:
+            return usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+        prompt_tokens = completion_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                prompt_tokens += metadata.get("input_tokens", 0)
+                completion_tokens += metadata.get("output_tokens", 0)
+        return prompt_tokens, completion_tokens
+
+    def _finish(self, run_id, response=None):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        start, node, trace = started
+        seconds = time.perf_counter() - start
+        node = node or "other"
+        prompt_tokens, completion_tokens = self._usage(response) if response is not None else (0, 0)
+        cost = (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1000
+        LLM_SECONDS.observe(seconds, node=node)
+        LLM_TOKENS.inc(prompt_tokens, node=node, type="prompt")
+        LLM_TOKENS.inc(completion_tokens, node=node, type="completion")
+        LLM_COST.inc(cost, node=node)
+        if trace is not None:
+            trace.add(llm_seconds=seconds, llm_calls=1, prompt_tokens=prompt_tokens,
+                      completion_tokens=completion_tokens, cost=cost)
+            trace.add_span("llm", node, seconds, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id)
@@ -0,0 +1,18 @@
+from fastapi import APIRouter,Depends
+from core.views.admin import schema_refresh,schema_metrics,exec_metrics,result_cache_stats,result_cache_invalidate,question_cache_stats,session_stats,llm_stats,llm_cache_stats,llm_cache_clear,cursor_stats,rollup_stats,rollup_refresh,replica_stats,require_admin_token
+#所有管理接口都需要X-Admin-Token，未配置settings.admin_token时关闭
+admin_router=APIRouter(dependencies=[Depends(require_admin_token)])
+admin_router.add_api_route('/schema/refresh',schema_refresh,methods=["POST"])
+admin_router.add_api_route('/schema/metrics',schema_metrics,methods=["GET"])
+admin_router.add_api_route('/exec/metrics',exec_metrics,methods=["GET"])
+admin_router.add_api_route('/cache/result',result_cache_stats,methods=["GET"])
+admin_router.add_api_route('/cache/result/invalidate',result_cache_invalidate,methods=["POST"])
+admin_router.add_api_route('/cache/question',question_cache_stats,methods=["GET"])
+admin_router.add_api_route('/session/metrics',session_stats,methods=["GET"])
+admin_router.add_api_route('/llm/metrics',llm_stats,methods=["GET"])
+admin_router.add_api_route('/llm/cache',llm_cache_stats,methods=["GET"])
+admin_router.add_api_route('/llm/cache/clear',llm_cache_clear,methods=["POST"])
+admin_router.add_api_route('/cursor/metrics',cursor_stats,methods=["GET"])
+admin_router.add_api_route('/rollup/metrics',rollup_stats,methods=["GET"])
+admin_router.add_api_route('/rollup/refresh',rollup_refresh,methods=["POST"])
+admin_router.add_api_route('/db/replicas',replica_stats,methods=["GET"])
@@ -0,0 +1,5 @@
+from fastapi import APIRouter
+from core.views.health import healthz,readyz
+health_router=APIRouter()
+health_router.add_api_route('/healthz',healthz,methods=["GET"])
+health_router.add_api_route('/readyz',readyz,methods=["GET"])
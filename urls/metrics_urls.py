@@ -0,0 +1,4 @@
+from fastapi import APIRouter
+from core.views.metrics import metrics
+metrics_router=APIRouter()
+metrics_router.add_api_route('/metrics',metrics,methods=["GET"])
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
-from core.views.default import default,query
+from core.views.default import default,query,query_page,query_export,query_batch
 sys_router=APIRouter()
 sys_router.add_api_route('/index',default,methods=["GET"])
 sys_router.add_api_route('/query',query,methods=["POST"])
-
+sys_router.add_api_route('/query/page',query_page,methods=["POST"])
+sys_router.add_api_route('/query/export',query_export,methods=["GET"])
+sys_router.add_api_route('/query/batch',query_batch,methods=["POST"])